@@ -2,6 +2,16 @@ import streamlit as st
 import json
 from datetime import datetime
 
+from cases import case_form_rendered, case_sidebar, resume_session, sign_out_button
+from completeness import completeness_navigator, missing_required
+from derivation import derivation_panel
+from orders import prefill_from_order
+from presets import presets_sidebar
+from quick_entry import quick_entry_bar
+from reveal_group import apply_reveal_commits, reveal_group
+from stage_groups import stage_group_for
+from validation import inline_warnings, report_allowed, update_validation, validation_summary
+
 # Set page config
 st.set_page_config(
     page_title="Hepatocellular Carcinoma Pathology Reporting Checklist",
@@ -56,6 +66,25 @@ def main():
     if 'form_data' not in st.session_state:
         st.session_state.form_data = {}
     
+    # Resume this browser session's state after a replica switch or restart (optional session store)
+    resume_session("hcc")
+    # Checkbox groups' last commits, so everything below reads this run's answers
+    apply_reveal_commits()
+
+    # Prefill case summary fields from an LIS order (?order=... or the order-drop folder)
+    prefill_from_order("hcc")
+    case_sidebar("hcc")
+    
+    # One-click presets and personal macros (applied before any widget renders)
+    presets_sidebar("hcc")
+    
+    # Consistency rules; only rules reading keys changed since the last run are re-checked
+    update_validation("hcc")
+    
+    # Required-element completeness, kept as a bitmask and shown as a sidebar navigator
+    # (filled in once the form has rendered)
+    navigator = st.sidebar.container()
+    
     # ========== CASE SUMMARY SECTION ==========
     st.markdown('<div class="section-header"><h2>📋 CASE SUMMARY</h2></div>', unsafe_allow_html=True)
     st.markdown("**(HEPATOCELLULAR CARCINOMA)**")
@@ -71,7 +100,7 @@ def main():
         pathologist = st.text_input("Pathologist:", key="pathologist")
     
     # ========== SPECIMEN SECTION ==========
-    st.markdown('<div class="section-header"><h2>🧪 SPECIMEN</h2></div>', unsafe_allow_html=True)
+    st.markdown('<div class="section-header" id="specimen"><h2>🧪 SPECIMEN</h2></div>', unsafe_allow_html=True)
     
     st.markdown('<div class="subsection"><h4>Procedure (select all that apply)</h4></div>', unsafe_allow_html=True)
     
@@ -90,7 +119,7 @@ def main():
         procedure_not_specified = st.checkbox("Not specified", key="procedure_not_specified")
     
     # ========== TUMOR SECTION ==========
-    st.markdown('<div class="section-header"><h2>🎯 TUMOR</h2></div>', unsafe_allow_html=True)
+    st.markdown('<div class="section-header" id="tumor"><h2>🎯 TUMOR</h2></div>', unsafe_allow_html=True)
     
     # Histologic Type
     st.markdown('<div class="subsection"><h4>Histologic Type</h4></div>', unsafe_allow_html=True)
@@ -144,7 +173,8 @@ def main():
         focality_cannot = st.text_input("Explain:", key="focality_cannot")
     
     # ========== TUMOR CHARACTERISTICS SECTION ==========
-    st.markdown('<div class="section-header"><h2>📊 TUMOR CHARACTERISTICS</h2></div>', unsafe_allow_html=True)
+    st.markdown('<div class="section-header" id="tumor_characteristics"><h2>📊 TUMOR CHARACTERISTICS</h2></div>', unsafe_allow_html=True)
+    inline_warnings("hcc", "tumor")
     st.info("For multiple tumors, repeat this section for up to 5 largest tumor nodules.")
     
     # Number of tumor nodules to document
@@ -165,33 +195,14 @@ def main():
             
             # Tumor Site
             st.write("**Tumor Site:**")
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                right_lobe = st.checkbox(f"Right lobe", key=f"right_lobe_{i}")
-                if right_lobe:
-                    right_lobe_detail = st.text_input(f"Right lobe details:", key=f"right_lobe_detail_{i}")
-                
-                left_lobe = st.checkbox(f"Left lobe", key=f"left_lobe_{i}")
-                if left_lobe:
-                    left_lobe_detail = st.text_input(f"Left lobe details:", key=f"left_lobe_detail_{i}")
-                
-                caudate_lobe = st.checkbox(f"Caudate lobe", key=f"caudate_lobe_{i}")
-                if caudate_lobe:
-                    caudate_lobe_detail = st.text_input(f"Caudate lobe details:", key=f"caudate_lobe_detail_{i}")
-            
-            with col2:
-                quadrate_lobe = st.checkbox(f"Quadrate lobe", key=f"quadrate_lobe_{i}")
-                if quadrate_lobe:
-                    quadrate_lobe_detail = st.text_input(f"Quadrate lobe details:", key=f"quadrate_lobe_detail_{i}")
-                
-                segmental_location = st.checkbox(f"Segmental location (specify)", key=f"segmental_location_{i}")
-                if segmental_location:
-                    segmental_detail = st.text_input(f"Segmental location details:", key=f"segmental_detail_{i}")
-                
-                site_other = st.checkbox(f"Other (specify)", key=f"site_other_{i}")
-                if site_other:
-                    site_other_detail = st.text_input(f"Other site details:", key=f"site_other_detail_{i}")
+            reveal_group([
+                (f"right_lobe_{i}", "Right lobe", f"right_lobe_detail_{i}", "Right lobe details:"),
+                (f"left_lobe_{i}", "Left lobe", f"left_lobe_detail_{i}", "Left lobe details:"),
+                (f"caudate_lobe_{i}", "Caudate lobe", f"caudate_lobe_detail_{i}", "Caudate lobe details:"),
+                (f"quadrate_lobe_{i}", "Quadrate lobe", f"quadrate_lobe_detail_{i}", "Quadrate lobe details:"),
+                (f"segmental_location_{i}", "Segmental location (specify)", f"segmental_detail_{i}", "Segmental location details:"),
+                (f"site_other_{i}", "Other (specify)", f"site_other_detail_{i}", "Other site details:")
+            ], key=f"site_group_{i}", columns=2)
             
             # Tumor Size
             st.write("**Tumor Size:**")
@@ -278,23 +289,13 @@ def main():
             # Vascular Invasion
             st.write("**Vascular Invasion (select all that apply):**")
             
-            vascular_not_identified = st.checkbox(f"Not identified", key=f"vascular_not_identified_{i}")
-            
-            vascular_small = st.checkbox(f"Small vessel", key=f"vascular_small_{i}")
-            if vascular_small:
-                vascular_small_detail = st.text_input(f"Small vessel details:", key=f"vascular_small_detail_{i}")
-            
-            vascular_large = st.checkbox(f"Large vessel (major branch of hepatic vein or portal vein)", key=f"vascular_large_{i}")
-            if vascular_large:
-                vascular_large_detail = st.text_input(f"Large vessel details:", key=f"vascular_large_detail_{i}")
-            
-            vascular_present_nos = st.checkbox(f"Present (not otherwise specified)", key=f"vascular_present_nos_{i}")
-            if vascular_present_nos:
-                vascular_nos_detail = st.text_input(f"Present NOS details:", key=f"vascular_nos_detail_{i}")
-            
-            vascular_cannot = st.checkbox(f"Cannot be determined", key=f"vascular_cannot_{i}")
-            if vascular_cannot:
-                vascular_cannot_detail = st.text_input(f"Vascular invasion cannot be determined - explain:", key=f"vascular_cannot_detail_{i}")
+            reveal_group([
+                (f"vascular_not_identified_{i}", "Not identified"),
+                (f"vascular_small_{i}", "Small vessel", f"vascular_small_detail_{i}", "Small vessel details:"),
+                (f"vascular_large_{i}", "Large vessel (major branch of hepatic vein or portal vein)", f"vascular_large_detail_{i}", "Large vessel details:"),
+                (f"vascular_present_nos_{i}", "Present (not otherwise specified)", f"vascular_nos_detail_{i}", "Present NOS details:"),
+                (f"vascular_cannot_{i}", "Cannot be determined", f"vascular_cannot_detail_{i}", "Vascular invasion cannot be determined - explain:")
+            ], key=f"vascular_group_{i}")
             
             # Perineural Invasion
             st.write("**Perineural Invasion:**")
@@ -309,7 +310,7 @@ def main():
             tumor_comment = st.text_area(f"Tumor {i+1} Comment:", key=f"tumor_comment_{i}")
     
     # ========== MARGINS SECTION ==========
-    st.markdown('<div class="section-header"><h2>📏 MARGINS</h2></div>', unsafe_allow_html=True)
+    st.markdown('<div class="section-header" id="margins"><h2>📏 MARGINS</h2></div>', unsafe_allow_html=True)
     
     # Margin Status
     st.markdown('<div class="subsection"><h4>Margin Status</h4></div>', unsafe_allow_html=True)
@@ -390,7 +391,8 @@ def main():
     margin_comment = st.text_area("Margin Comment:", key="margin_comment")
     
     # ========== REGIONAL LYMPH NODES SECTION ==========
-    st.markdown('<div class="section-header"><h2>🔗 REGIONAL LYMPH NODES</h2></div>', unsafe_allow_html=True)
+    st.markdown('<div class="section-header" id="lymph_nodes"><h2>🔗 REGIONAL LYMPH NODES</h2></div>', unsafe_allow_html=True)
+    inline_warnings("hcc", "lymph_nodes")
     
     # Regional Lymph Node Status
     st.markdown('<div class="subsection"><h4>Regional Lymph Node Status</h4></div>', unsafe_allow_html=True)
@@ -461,29 +463,21 @@ def main():
     
     # ========== DISTANT METASTASIS SECTION ==========
     st.markdown('<div class="section-header"><h2>🎯 DISTANT METASTASIS</h2></div>', unsafe_allow_html=True)
+    inline_warnings("hcc", "distant_metastasis")
     
     st.markdown('<div class="subsection"><h4>Distant Site(s) Involved, if applicable (select all that apply)</h4></div>', unsafe_allow_html=True)
     
-    dm_not_applicable = st.checkbox("Not applicable", key="dm_not_applicable")
-    
-    dm_non_regional_ln = st.checkbox("Non-regional lymph node(s)", key="dm_non_regional_ln")
-    if dm_non_regional_ln:
-        dm_non_regional_detail = st.text_input("Non-regional lymph node details:", key="dm_non_regional_detail")
-    
-    dm_liver = st.checkbox("Liver", key="dm_liver")
-    if dm_liver:
-        dm_liver_detail = st.text_input("Liver metastasis details:", key="dm_liver_detail")
-    
-    dm_other = st.checkbox("Other", key="dm_other")
-    if dm_other:
-        dm_other_detail = st.text_input("Specify other distant sites:", key="dm_other_detail")
-    
-    dm_cannot_determine = st.checkbox("Cannot be determined", key="dm_cannot_determine")
-    if dm_cannot_determine:
-        dm_cannot_detail = st.text_input("Cannot be determined details:", key="dm_cannot_detail")
+    reveal_group([
+        ("dm_not_applicable", "Not applicable"),
+        ("dm_non_regional_ln", "Non-regional lymph node(s)", "dm_non_regional_detail", "Non-regional lymph node details:"),
+        ("dm_liver", "Liver", "dm_liver_detail", "Liver metastasis details:"),
+        ("dm_other", "Other", "dm_other_detail", "Specify other distant sites:"),
+        ("dm_cannot_determine", "Cannot be determined", "dm_cannot_detail", "Cannot be determined details:")
+    ], key="dm_group")
     
     # ========== pTNM CLASSIFICATION SECTION ==========
-    st.markdown('<div class="section-header"><h2>📊 PATHOLOGIC STAGE CLASSIFICATION (pTNM, AJCC 8th Edition)</h2></div>', unsafe_allow_html=True)
+    st.markdown('<div class="section-header" id="ptnm"><h2>📊 PATHOLOGIC STAGE CLASSIFICATION (pTNM, AJCC 8th Edition)</h2></div>', unsafe_allow_html=True)
+    inline_warnings("hcc", "ptnm")
     
     st.info("Reporting of pT, pN, and (when applicable) pM categories is based on information available to the pathologist at the time the report is issued. As per the AJCC (Chapter 1, 8th Ed.) it is the managing physician's responsibility to establish the final pathologic stage based upon all pertinent information, including but potentially not limited to this pathology report.")
     
@@ -526,6 +520,9 @@ def main():
     
     pn_category = st.selectbox("pN Category:", [""] + pn_options, key="pn_category")
     
+    # pT / pN suggested from the findings above, with disagreement flags
+    derivation_panel("hcc", pt_options, pn_options)
+    
     # pM Category
     st.markdown('<div class="subsection"><h4>pM Category (required only if confirmed pathologically)</h4></div>', unsafe_allow_html=True)
     
@@ -536,31 +533,31 @@ def main():
     
     pm_category = st.selectbox("pM Category:", [""] + pm_options, key="pm_category")
     
+    # AJCC prognostic stage group from pT / pN / pM
+    stage = stage_group_for("hcc", st.session_state)
+    if stage:
+        st.info(f"**AJCC Stage Group:** {stage}")
+
+    # Shorthand quick entry, resolved against the option lists above
+    quick_entry_bar("hcc", pt_options, pn_options, pm_options, grade_options)
+    
     # ========== ADDITIONAL FINDINGS SECTION ==========
     st.markdown('<div class="section-header"><h2>🔍 ADDITIONAL FINDINGS</h2></div>', unsafe_allow_html=True)
     
     st.markdown('<div class="subsection"><h4>Additional Findings (select all that apply)</h4></div>', unsafe_allow_html=True)
     
-    additional_none = st.checkbox("None identified", key="additional_none")
-    
-    additional_fibrosis = st.checkbox("Fibrosis", key="additional_fibrosis")
-    if additional_fibrosis:
-        fibrosis_detail = st.text_input("Specify extent, providing name of the scheme and assessment scale used:", key="fibrosis_detail")
-    
-    additional_cirrhosis = st.checkbox("Cirrhosis", key="additional_cirrhosis")
-    additional_lgd_nodule = st.checkbox("Low-grade dysplastic nodule", key="additional_lgd_nodule")
-    additional_hgd_nodule = st.checkbox("High-grade dysplastic nodule", key="additional_hgd_nodule")
-    additional_steatosis = st.checkbox("Steatosis", key="additional_steatosis")
-    additional_steatohepatitis = st.checkbox("Steatohepatitis", key="additional_steatohepatitis")
-    additional_iron = st.checkbox("Iron overload", key="additional_iron")
-    
-    additional_hepatitis = st.checkbox("Chronic hepatitis", key="additional_hepatitis")
-    if additional_hepatitis:
-        hepatitis_etiology = st.text_input("Specify etiology:", key="hepatitis_etiology")
-    
-    additional_other = st.checkbox("Other", key="additional_other")
-    if additional_other:
-        additional_other_detail = st.text_input("Specify other findings:", key="additional_other_detail")
+    reveal_group([
+        ("additional_none", "None identified"),
+        ("additional_fibrosis", "Fibrosis", "fibrosis_detail", "Specify extent, providing name of the scheme and assessment scale used:"),
+        ("additional_cirrhosis", "Cirrhosis"),
+        ("additional_lgd_nodule", "Low-grade dysplastic nodule"),
+        ("additional_hgd_nodule", "High-grade dysplastic nodule"),
+        ("additional_steatosis", "Steatosis"),
+        ("additional_steatohepatitis", "Steatohepatitis"),
+        ("additional_iron", "Iron overload"),
+        ("additional_hepatitis", "Chronic hepatitis", "hepatitis_etiology", "Specify etiology:"),
+        ("additional_other", "Other", "additional_other_detail", "Specify other findings:")
+    ], key="additional_group")
     
     # ========== SPECIAL STUDIES SECTION ==========
     st.markdown('<div class="section-header"><h2>🔬 SPECIAL STUDIES</h2></div>', unsafe_allow_html=True)
@@ -580,9 +577,19 @@ def main():
     # ========== GENERATE REPORT SECTION ==========
     st.markdown("---")
     st.markdown("### 📋 Generate Final Report")
+    validation_summary("hcc")
+    case_form_rendered("hcc")
+    completeness_navigator("hcc", navigator)
     
     # Large Generate Report Button
     if st.button("🔬 GENERATE COMPLETE PATHOLOGY REPORT", type="primary", use_container_width=True):
+        if not report_allowed("hcc"):
+            st.error("❌ Report not generated: resolve or acknowledge the consistency issues above.")
+            st.stop()
+        missing = missing_required("hcc")
+        if missing:
+            st.warning(f"⚠️ {len(missing)} required element(s) missing: {', '.join(element.label for element in missing)}")
+        
         st.success("✅ Complete pathology report generated successfully!")
         
         # Large Report Display Area
@@ -941,6 +948,9 @@ CASE SUMMARY (HEPATOCELLULAR CARCINOMA)
             report_content += f"pN: {st.session_state.pn_category}\n"
         if st.session_state.get('pm_category'):
             report_content += f"pM: {st.session_state.pm_category}\n"
+        stage = stage_group_for("hcc", st.session_state)
+        if stage:
+            report_content += f"Stage Group (AJCC 8th Edition): {stage}\n"
         
         # Add Additional Findings Section
         report_content += f"\nADDITIONAL FINDINGS\n"
@@ -1012,6 +1022,8 @@ CASE SUMMARY (HEPATOCELLULAR CARCINOMA)
             mime="text/plain",
             use_container_width=True
         )
+        
+        sign_out_button("hcc", report_content)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
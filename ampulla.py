@@ -2,6 +2,18 @@ import streamlit as st
 import json
 from datetime import datetime
 
+from batch_entry import batch_entry_toggle, batch_section
+from cases import case_form_rendered, case_sidebar, resume_session, sign_out_button
+from completeness import completeness_navigator, missing_required
+from derivation import derivation_panel
+from margin_table import closest_distance_method, margin_distance_lines, margin_distance_table
+from orders import prefill_from_order, resolve_order_procedure
+from presets import presets_sidebar
+from quick_entry import quick_entry_bar
+from reveal_group import apply_reveal_commits, reveal_group
+from stage_groups import stage_group_for
+from validation import inline_warnings, report_allowed, update_validation, validation_summary
+
 # Set page config
 st.set_page_config(
     page_title="Ampulla of Vater Pathology Reporting Checklist",
@@ -49,6 +61,28 @@ def main():
     if 'form_data' not in st.session_state:
         st.session_state.form_data = {}
     
+    # Batch entry: TUMOR and REGIONAL LYMPH NODES are committed per section
+    batch = batch_entry_toggle()
+    
+    # Resume this browser session's state after a replica switch or restart (optional session store)
+    resume_session("ampulla")
+    # Checkbox groups' last commits, so everything below reads this run's answers
+    apply_reveal_commits()
+
+    # Prefill case summary fields from an LIS order (?order=... or the order-drop folder)
+    prefill_from_order("ampulla")
+    case_sidebar("ampulla")
+    
+    # One-click presets and personal macros (applied before any widget renders)
+    presets_sidebar("ampulla")
+    
+    # Consistency rules; only rules reading keys changed since the last run are re-checked
+    update_validation("ampulla")
+    
+    # Required-element completeness, kept as a bitmask and shown as a sidebar navigator
+    # (filled in once the form has rendered)
+    navigator = st.sidebar.container()
+    
     # ========== CASE SUMMARY SECTION ==========
     st.markdown('<div class="section-header"><h2>📋 CASE SUMMARY</h2></div>', unsafe_allow_html=True)
     st.markdown("**(AMPULLA OF VATER)**")
@@ -62,7 +96,7 @@ def main():
         pathologist = st.text_input("Pathologist:", key="pathologist")
     
     # ========== SPECIMEN SECTION ==========
-    st.markdown('<div class="section-header"><h2>🧪 SPECIMEN</h2></div>', unsafe_allow_html=True)
+    st.markdown('<div class="section-header" id="specimen"><h2>🧪 SPECIMEN</h2></div>', unsafe_allow_html=True)
     
     st.markdown('<div class="subsection"><h4>Procedure</h4></div>', unsafe_allow_html=True)
     procedure_options = [
@@ -71,179 +105,182 @@ def main():
         "Other",
         "Not specified"
     ]
+    resolve_order_procedure(procedure_options)
     procedure = st.selectbox("Select procedure:", [""] + procedure_options, key="procedure")
     if procedure == "Other":
         procedure_other = st.text_input("Specify other procedure:", key="procedure_other")
     
     # ========== TUMOR SECTION ==========
-    st.markdown('<div class="section-header"><h2>🎯 TUMOR</h2></div>', unsafe_allow_html=True)
-    
-    # Tumor Site
-    st.markdown('<div class="subsection"><h4>Tumor Site</h4></div>', unsafe_allow_html=True)
-    
-    tumor_site_options = [
-        "Intra-ampullary papillary-tubular neoplasm (IAPN)-associated",
-        "Ampullary ductal origin",
-        "(Peri-) Ampullary-duodenal",
-        "Mixed intra-ampullary and (peri-) ampullary-duodenal, NOS",
-        "Other",
-        "Cannot be determined",
-        "Not specified"
-    ]
-    tumor_site = st.selectbox("Tumor site:", [""] + tumor_site_options, key="tumor_site")
-    
-    if tumor_site in ["(Peri-) Ampullary-duodenal", "Mixed intra-ampullary and (peri-) ampullary-duodenal, NOS", "Other", "Cannot be determined"]:
-        tumor_site_detail = st.text_input(f"Details for {tumor_site}:", key="tumor_site_detail")
-    
-    # Histologic Type
-    st.markdown('<div class="subsection"><h4>Histologic Type</h4></div>', unsafe_allow_html=True)
-    histologic_options = [
-        "Adenocarcinoma, pancreaticobiliary-type",
-        "Adenocarcinoma, intestinal-type",
-        "Adenocarcinoma with mixed features (pancreaticobiliary- and intestinal-type)",
-        "Adenocarcinoma, NOS",
-        "Adenocarcinoma arising in intra-ampullary papillary-tubular neoplasm (IAPN)",
-        "Mucinous adenocarcinoma",
-        "Poorly cohesive carcinoma",
-        "Signet-ring cell carcinoma",
-        "Medullary carcinoma",
-        "Adenosquamous carcinoma",
-        "Large cell neuroendocrine carcinoma",
-        "Small cell neuroendocrine carcinoma",
-        "Undifferentiated carcinoma, NOS",
-        "Mixed neuroendocrine-non-neuroendocrine neoplasm (MiNEN)",
-        "Other histologic type not listed",
-        "Carcinoma, NOS"
-    ]
-    histologic_type = st.selectbox("Histologic type:", [""] + histologic_options, key="histologic_type")
-    
-    if histologic_type == "Mixed neuroendocrine-non-neuroendocrine neoplasm (MiNEN)":
-        minen_components = st.text_input("Specify components:", key="minen_components")
-    elif histologic_type == "Other histologic type not listed":
-        histologic_other = st.text_input("Specify other type:", key="histologic_other")
-    
-    histologic_comment = st.text_area("Histologic Type Comment:", key="histologic_comment")
-    
-    # Histologic Grade
-    st.markdown('<div class="subsection"><h4>Histologic Grade</h4></div>', unsafe_allow_html=True)
-    grade_options = [
-        "G1, well-differentiated",
-        "G2, moderately differentiated",
-        "G3, poorly differentiated",
-        "Other",
-        "GX, cannot be assessed",
-        "Not applicable"
-    ]
-    grade = st.selectbox("Histologic grade:", [""] + grade_options, key="grade")
-    if grade == "Other":
-        grade_other = st.text_input("Specify other grade:", key="grade_other")
-    elif grade == "GX, cannot be assessed":
-        grade_cannot = st.text_input("Explain:", key="grade_cannot")
-    
-    # Tumor Size
-    st.markdown('<div class="subsection"><h4>Tumor Size</h4></div>', unsafe_allow_html=True)
-    
-    tumor_size_type = st.radio(
-        "Tumor size type:",
-        ["Unifocal invasive carcinoma", "Multifocal invasive carcinoma in association with IAPN", "Cannot be determined"],
-        key="tumor_size_type"
-    )
-    
-    if tumor_size_type == "Unifocal invasive carcinoma":
-        size_cm = st.number_input("Greatest dimension (cm):", min_value=0.0, step=0.1, key="size_cm")
+    st.markdown('<div class="section-header" id="tumor"><h2>🎯 TUMOR</h2></div>', unsafe_allow_html=True)
+    inline_warnings("ampulla", "tumor")
+    
+    with batch_section("Tumor", key="tumor_form"):
+        # Tumor Site
+        st.markdown('<div class="subsection"><h4>Tumor Site</h4></div>', unsafe_allow_html=True)
+        
+        tumor_site_options = [
+            "Intra-ampullary papillary-tubular neoplasm (IAPN)-associated",
+            "Ampullary ductal origin",
+            "(Peri-) Ampullary-duodenal",
+            "Mixed intra-ampullary and (peri-) ampullary-duodenal, NOS",
+            "Other",
+            "Cannot be determined",
+            "Not specified"
+        ]
+        tumor_site = st.selectbox("Tumor site:", [""] + tumor_site_options, key="tumor_site")
+        
+        if tumor_site in ["(Peri-) Ampullary-duodenal", "Mixed intra-ampullary and (peri-) ampullary-duodenal, NOS", "Other", "Cannot be determined"] or batch:
+            tumor_site_detail = st.text_input(f"Details for {tumor_site}:", key="tumor_site_detail")
+        
+        # Histologic Type
+        st.markdown('<div class="subsection"><h4>Histologic Type</h4></div>', unsafe_allow_html=True)
+        histologic_options = [
+            "Adenocarcinoma, pancreaticobiliary-type",
+            "Adenocarcinoma, intestinal-type",
+            "Adenocarcinoma with mixed features (pancreaticobiliary- and intestinal-type)",
+            "Adenocarcinoma, NOS",
+            "Adenocarcinoma arising in intra-ampullary papillary-tubular neoplasm (IAPN)",
+            "Mucinous adenocarcinoma",
+            "Poorly cohesive carcinoma",
+            "Signet-ring cell carcinoma",
+            "Medullary carcinoma",
+            "Adenosquamous carcinoma",
+            "Large cell neuroendocrine carcinoma",
+            "Small cell neuroendocrine carcinoma",
+            "Undifferentiated carcinoma, NOS",
+            "Mixed neuroendocrine-non-neuroendocrine neoplasm (MiNEN)",
+            "Other histologic type not listed",
+            "Carcinoma, NOS"
+        ]
+        histologic_type = st.selectbox("Histologic type:", [""] + histologic_options, key="histologic_type")
+        
+        if histologic_type == "Mixed neuroendocrine-non-neuroendocrine neoplasm (MiNEN)" or batch:
+            minen_components = st.text_input("Specify components:", key="minen_components")
+        if histologic_type == "Other histologic type not listed" or batch:
+            histologic_other = st.text_input("Specify other type:", key="histologic_other")
+        
+        histologic_comment = st.text_area("Histologic Type Comment:", key="histologic_comment")
+        
+        # Histologic Grade
+        st.markdown('<div class="subsection"><h4>Histologic Grade</h4></div>', unsafe_allow_html=True)
+        grade_options = [
+            "G1, well-differentiated",
+            "G2, moderately differentiated",
+            "G3, poorly differentiated",
+            "Other",
+            "GX, cannot be assessed",
+            "Not applicable"
+        ]
+        grade = st.selectbox("Histologic grade:", [""] + grade_options, key="grade")
+        if grade == "Other" or batch:
+            grade_other = st.text_input("Specify other grade:", key="grade_other")
+        if grade == "GX, cannot be assessed" or batch:
+            grade_cannot = st.text_input("Explain:", key="grade_cannot")
+        
+        # Tumor Size
+        st.markdown('<div class="subsection"><h4>Tumor Size</h4></div>', unsafe_allow_html=True)
+        
+        tumor_size_type = st.radio(
+            "Tumor size type:",
+            ["Unifocal invasive carcinoma", "Multifocal invasive carcinoma in association with IAPN", "Cannot be determined"],
+            key="tumor_size_type"
+        )
+        
+        if tumor_size_type == "Unifocal invasive carcinoma" or batch:
+            size_cm = st.number_input("Greatest dimension (cm):", min_value=0.0, step=0.1, key="size_cm")
+            
+            additional_dims = st.checkbox("Additional dimensions", key="additional_dims")
+            if additional_dims or batch:
+                col1, col2 = st.columns(2)
+                with col1:
+                    size_x = st.number_input("Width (cm):", min_value=0.0, step=0.1, key="size_x")
+                with col2:
+                    size_y = st.number_input("Height (cm):", min_value=0.0, step=0.1, key="size_y")
+        
+        if tumor_size_type == "Multifocal invasive carcinoma in association with IAPN" or batch:
+            largest_focus = st.number_input("Size of largest focus (cm):", min_value=0.0, step=0.1, key="largest_focus")
+            aggregate_size = st.number_input("Aggregate size of all foci (cm) (if known):", min_value=0.0, step=0.1, key="aggregate_size")
+            invasive_percentage = st.number_input("Invasive component percentage (if known):", min_value=0.0, max_value=100.0, step=0.1, key="invasive_percentage")
+        
+        if tumor_size_type == "Cannot be determined" or batch:
+            size_explain = st.text_input("Explain why size cannot be determined:", key="size_explain")
+        
+        # Tumor Extent
+        st.markdown('<div class="subsection"><h4>Tumor Extent (select all that apply)</h4></div>', unsafe_allow_html=True)
+        
+        col1, col2 = st.columns(2)
         
-        additional_dims = st.checkbox("Additional dimensions", key="additional_dims")
-        if additional_dims:
-            col1, col2 = st.columns(2)
-            with col1:
-                size_x = st.number_input("Width (cm):", min_value=0.0, step=0.1, key="size_x")
-            with col2:
-                size_y = st.number_input("Height (cm):", min_value=0.0, step=0.1, key="size_y")
-    
-    elif tumor_size_type == "Multifocal invasive carcinoma in association with IAPN":
-        largest_focus = st.number_input("Size of largest focus (cm):", min_value=0.0, step=0.1, key="largest_focus")
-        aggregate_size = st.number_input("Aggregate size of all foci (cm) (if known):", min_value=0.0, step=0.1, key="aggregate_size")
-        invasive_percentage = st.number_input("Invasive component percentage (if known):", min_value=0.0, max_value=100.0, step=0.1, key="invasive_percentage")
-    
-    elif tumor_size_type == "Cannot be determined":
-        size_explain = st.text_input("Explain why size cannot be determined:", key="size_explain")
-    
-    # Tumor Extent
-    st.markdown('<div class="subsection"><h4>Tumor Extent (select all that apply)</h4></div>', unsafe_allow_html=True)
-    
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        extent_cis = st.checkbox("Carcinoma in situ / high-grade dysplasia", key="extent_cis")
-        extent_ampulla = st.checkbox("Limited to ampulla of Vater or sphincter of Oddi", key="extent_ampulla")
-        extent_sphincter = st.checkbox("Invades beyond sphincter of Oddi", key="extent_sphincter")
-        extent_submucosa = st.checkbox("Invades into duodenal submucosa", key="extent_submucosa")
-        extent_muscularis = st.checkbox("Invades into muscularis propria of duodenum", key="extent_muscularis")
-        extent_pancreas_05 = st.checkbox("Directly invades pancreas (up to 0.5 cm)", key="extent_pancreas_05")
-        extent_pancreas_more = st.checkbox("Extends more than 0.5 cm into pancreas", key="extent_pancreas_more")
-    
-    with col2:
-        extent_peripancreatic = st.checkbox("Extends into peripancreatic soft tissues", key="extent_peripancreatic")
-        extent_periduodenal = st.checkbox("Extends into periduodenal tissue", key="extent_periduodenal")
-        extent_serosa = st.checkbox("Extends into duodenal serosa", key="extent_serosa")
-        extent_other_organs = st.checkbox("Invades other adjacent organ(s)", key="extent_other_organs")
-        extent_no_evidence = st.checkbox("No evidence of primary tumor", key="extent_no_evidence")
-        extent_cannot_determine = st.checkbox("Cannot be determined", key="extent_cannot_determine")
-    
-    if extent_other_organs:
-        st.write("**Adjacent organs involved (select all that apply):**")
-        col1, col2, col3 = st.columns(3)
         with col1:
-            organ_stomach = st.checkbox("Stomach", key="organ_stomach")
-            organ_gallbladder = st.checkbox("Gallbladder", key="organ_gallbladder")
+            extent_cis = st.checkbox("Carcinoma in situ / high-grade dysplasia", key="extent_cis")
+            extent_ampulla = st.checkbox("Limited to ampulla of Vater or sphincter of Oddi", key="extent_ampulla")
+            extent_sphincter = st.checkbox("Invades beyond sphincter of Oddi", key="extent_sphincter")
+            extent_submucosa = st.checkbox("Invades into duodenal submucosa", key="extent_submucosa")
+            extent_muscularis = st.checkbox("Invades into muscularis propria of duodenum", key="extent_muscularis")
+            extent_pancreas_05 = st.checkbox("Directly invades pancreas (up to 0.5 cm)", key="extent_pancreas_05")
+            extent_pancreas_more = st.checkbox("Extends more than 0.5 cm into pancreas", key="extent_pancreas_more")
+        
         with col2:
-            organ_omentum = st.checkbox("Omentum", key="organ_omentum")
-            organ_celiac = st.checkbox("Celiac axis", key="organ_celiac")
-        with col3:
-            organ_sma = st.checkbox("Superior mesenteric artery", key="organ_sma")
-            organ_hepatic = st.checkbox("Common hepatic artery", key="organ_hepatic")
-        
-        organ_other = st.checkbox("Other", key="organ_other")
-        if organ_other:
-            organ_other_detail = st.text_input("Specify other organ:", key="organ_other_detail")
-    
-    if extent_cannot_determine:
-        extent_explain = st.text_input("Explain:", key="extent_explain")
-    
-    # Lymphatic and/or Vascular Invasion
-    st.markdown('<div class="subsection"><h4>Lymphatic and/or Vascular Invasion</h4></div>', unsafe_allow_html=True)
-    lvi_options = ["Not identified", "Present", "Cannot be determined"]
-    lvi = st.selectbox("Lymphatic and/or vascular invasion:", [""] + lvi_options, key="lvi")
-    if lvi == "Cannot be determined":
-        lvi_explain = st.text_input("Explain:", key="lvi_explain")
-    
-    # Perineural Invasion
-    st.markdown('<div class="subsection"><h4>Perineural Invasion</h4></div>', unsafe_allow_html=True)
-    pni_options = ["Not identified", "Present", "Cannot be determined"]
-    pni = st.selectbox("Perineural invasion:", [""] + pni_options, key="pni")
-    if pni == "Cannot be determined":
-        pni_explain = st.text_input("Explain:", key="pni_explain")
-    
-    # Treatment Effect
-    st.markdown('<div class="subsection"><h4>Treatment Effect</h4></div>', unsafe_allow_html=True)
-    treatment_options = [
-        "No known presurgical therapy",
-        "Present, with no viable cancer cells (complete response, score 0)",
-        "Present, with single cells or rare small groups of cancer cells (near complete response, score 1)",
-        "Present, with residual cancer showing evident tumor regression (partial response, score 2)",
-        "Present, NOS",
-        "Absent, with extensive residual cancer and no evident tumor regression (poor or no response, score 3)",
-        "Cannot be determined"
-    ]
-    treatment_effect = st.selectbox("Treatment effect:", [""] + treatment_options, key="treatment_effect")
-    if treatment_effect == "Cannot be determined":
-        treatment_explain = st.text_input("Explain:", key="treatment_explain")
-    
-    # Tumor Comment
-    tumor_comment = st.text_area("Tumor Comment:", key="tumor_comment")
+            extent_peripancreatic = st.checkbox("Extends into peripancreatic soft tissues", key="extent_peripancreatic")
+            extent_periduodenal = st.checkbox("Extends into periduodenal tissue", key="extent_periduodenal")
+            extent_serosa = st.checkbox("Extends into duodenal serosa", key="extent_serosa")
+            extent_other_organs = st.checkbox("Invades other adjacent organ(s)", key="extent_other_organs")
+            extent_no_evidence = st.checkbox("No evidence of primary tumor", key="extent_no_evidence")
+            extent_cannot_determine = st.checkbox("Cannot be determined", key="extent_cannot_determine")
+        
+        if extent_other_organs or batch:
+            st.write("**Adjacent organs involved (select all that apply):**")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                organ_stomach = st.checkbox("Stomach", key="organ_stomach")
+                organ_gallbladder = st.checkbox("Gallbladder", key="organ_gallbladder")
+            with col2:
+                organ_omentum = st.checkbox("Omentum", key="organ_omentum")
+                organ_celiac = st.checkbox("Celiac axis", key="organ_celiac")
+            with col3:
+                organ_sma = st.checkbox("Superior mesenteric artery", key="organ_sma")
+                organ_hepatic = st.checkbox("Common hepatic artery", key="organ_hepatic")
+            
+            organ_other = st.checkbox("Other", key="organ_other")
+            if organ_other or batch:
+                organ_other_detail = st.text_input("Specify other organ:", key="organ_other_detail")
+        
+        if extent_cannot_determine or batch:
+            extent_explain = st.text_input("Explain:", key="extent_explain")
+        
+        # Lymphatic and/or Vascular Invasion
+        st.markdown('<div class="subsection"><h4>Lymphatic and/or Vascular Invasion</h4></div>', unsafe_allow_html=True)
+        lvi_options = ["Not identified", "Present", "Cannot be determined"]
+        lvi = st.selectbox("Lymphatic and/or vascular invasion:", [""] + lvi_options, key="lvi")
+        if lvi == "Cannot be determined" or batch:
+            lvi_explain = st.text_input("Explain:", key="lvi_explain")
+        
+        # Perineural Invasion
+        st.markdown('<div class="subsection"><h4>Perineural Invasion</h4></div>', unsafe_allow_html=True)
+        pni_options = ["Not identified", "Present", "Cannot be determined"]
+        pni = st.selectbox("Perineural invasion:", [""] + pni_options, key="pni")
+        if pni == "Cannot be determined" or batch:
+            pni_explain = st.text_input("Explain:", key="pni_explain")
+        
+        # Treatment Effect
+        st.markdown('<div class="subsection"><h4>Treatment Effect</h4></div>', unsafe_allow_html=True)
+        treatment_options = [
+            "No known presurgical therapy",
+            "Present, with no viable cancer cells (complete response, score 0)",
+            "Present, with single cells or rare small groups of cancer cells (near complete response, score 1)",
+            "Present, with residual cancer showing evident tumor regression (partial response, score 2)",
+            "Present, NOS",
+            "Absent, with extensive residual cancer and no evident tumor regression (poor or no response, score 3)",
+            "Cannot be determined"
+        ]
+        treatment_effect = st.selectbox("Treatment effect:", [""] + treatment_options, key="treatment_effect")
+        if treatment_effect == "Cannot be determined" or batch:
+            treatment_explain = st.text_input("Explain:", key="treatment_explain")
+        
+        # Tumor Comment
+        tumor_comment = st.text_area("Tumor Comment:", key="tumor_comment")
     
     # ========== MARGINS SECTION ==========
-    st.markdown('<div class="section-header"><h2>📏 MARGINS</h2></div>', unsafe_allow_html=True)
+    st.markdown('<div class="section-header" id="margins"><h2>📏 MARGINS</h2></div>', unsafe_allow_html=True)
     
     # Margin Status for Invasive Carcinoma
     st.markdown('<div class="subsection"><h4>Margin Status for Invasive Carcinoma</h4></div>', unsafe_allow_html=True)
@@ -261,73 +298,18 @@ def main():
     )
     
     if margin_status == "All margins negative for invasive carcinoma":
-        st.write("**Closest Margin(s) to Invasive Carcinoma (select all that apply):**")
+        st.write("**Distance from Invasive Carcinoma to Each Margin** (the closest margin(s) follow from the distances):")
+        margin_distance_table("ampulla")
         
-        col1, col2 = st.columns(2)
-        with col1:
-            margin_deep = st.checkbox("Deep (radial)", key="margin_deep")
-            if margin_deep:
-                margin_deep_detail = st.text_input("Deep margin details:", key="margin_deep_detail")
-            
-            margin_duodenal = st.checkbox("Duodenal mucosal", key="margin_duodenal")
-            if margin_duodenal:
-                margin_duodenal_detail = st.text_input("Duodenal margin details:", key="margin_duodenal_detail")
-            
-            margin_pancreatic_duct = st.checkbox("Pancreatic duct", key="margin_pancreatic_duct")
-            if margin_pancreatic_duct:
-                margin_pancreatic_duct_detail = st.text_input("Pancreatic duct margin details:", key="margin_pancreatic_duct_detail")
-            
-            margin_bile_duct = st.checkbox("Bile duct", key="margin_bile_duct")
-            if margin_bile_duct:
-                margin_bile_duct_detail = st.text_input("Bile duct margin details:", key="margin_bile_duct_detail")
+        # Closest margins without a distance of their own
+        reveal_group([
+            ("margin_other", "Other closest margin", "margin_other_detail", "Specify other margin:"),
+            ("margin_cannot_determine", "Closest margin cannot be determined", "margin_cannot_detail", "Cannot be determined details:")
+        ], key="closest_margin_other_group", columns=2)
         
-        with col2:
-            margin_pancreatic_neck = st.checkbox("Pancreatic neck / parenchymal", key="margin_pancreatic_neck")
-            if margin_pancreatic_neck:
-                margin_pancreatic_neck_detail = st.text_input("Pancreatic neck margin details:", key="margin_pancreatic_neck_detail")
-            
-            margin_uncinate = st.checkbox("Uncinate (retroperitoneal / SMA)", key="margin_uncinate")
-            if margin_uncinate:
-                margin_uncinate_detail = st.text_input("Uncinate margin details:", key="margin_uncinate_detail")
-            
-            margin_proximal = st.checkbox("Proximal (gastric or duodenal)", key="margin_proximal")
-            if margin_proximal:
-                margin_proximal_detail = st.text_input("Proximal margin details:", key="margin_proximal_detail")
-            
-            margin_distal = st.checkbox("Distal (duodenal or jejunal)", key="margin_distal")
-            if margin_distal:
-                margin_distal_detail = st.text_input("Distal margin details:", key="margin_distal_detail")
+        distance_method = closest_distance_method("ampulla")
         
-        margin_other = st.checkbox("Other", key="margin_other")
-        if margin_other:
-            margin_other_detail = st.text_input("Specify other margin:", key="margin_other_detail")
-        
-        margin_cannot_determine = st.checkbox("Cannot be determined", key="margin_cannot_determine")
-        if margin_cannot_determine:
-            margin_cannot_detail = st.text_input("Cannot be determined details:", key="margin_cannot_detail")
-        
-        # Distance from Invasive Carcinoma to Closest Margin
-        st.write("**Distance from Invasive Carcinoma to Closest Margin:**")
-        
-        distance_method = st.radio(
-            "Distance measurement:",
-            [
-                "Exact distance in cm",
-                "Greater than 1 cm",
-                "Exact distance in mm",
-                "Greater than 10 mm", 
-                "Other",
-                "Cannot be determined",
-                "Not applicable"
-            ],
-            key="distance_method"
-        )
-        
-        if distance_method == "Exact distance in cm":
-            distance_cm = st.number_input("Distance (cm):", min_value=0.0, step=0.1, key="distance_cm")
-        elif distance_method == "Exact distance in mm":
-            distance_mm = st.number_input("Distance (mm):", min_value=0.0, step=0.1, key="distance_mm")
-        elif distance_method == "Other":
+        if distance_method == "Other":
             distance_other = st.text_input("Specify other:", key="distance_other")
         elif distance_method == "Cannot be determined":
             distance_explain = st.text_input("Explain:", key="distance_explain")
@@ -335,48 +317,18 @@ def main():
     elif margin_status == "Invasive carcinoma present at margin":
         st.write("**Margin(s) Involved by Invasive Carcinoma (select all that apply):**")
         
-        col1, col2 = st.columns(2)
-        with col1:
-            involved_deep = st.checkbox("Deep (radial)", key="involved_deep")
-            if involved_deep:
-                involved_deep_detail = st.text_input("Deep involved details:", key="involved_deep_detail")
-            
-            involved_duodenal = st.checkbox("Duodenal mucosal", key="involved_duodenal")
-            if involved_duodenal:
-                involved_duodenal_detail = st.text_input("Duodenal involved details:", key="involved_duodenal_detail")
-            
-            involved_pancreatic_duct = st.checkbox("Pancreatic duct", key="involved_pancreatic_duct")
-            if involved_pancreatic_duct:
-                involved_pancreatic_duct_detail = st.text_input("Pancreatic duct involved details:", key="involved_pancreatic_duct_detail")
-            
-            involved_bile_duct = st.checkbox("Bile duct", key="involved_bile_duct")
-            if involved_bile_duct:
-                involved_bile_duct_detail = st.text_input("Bile duct involved details:", key="involved_bile_duct_detail")
-        
-        with col2:
-            involved_pancreatic_neck = st.checkbox("Pancreatic neck / parenchymal", key="involved_pancreatic_neck")
-            if involved_pancreatic_neck:
-                involved_pancreatic_neck_detail = st.text_input("Pancreatic neck involved details:", key="involved_pancreatic_neck_detail")
-            
-            involved_uncinate = st.checkbox("Uncinate (retroperitoneal / SMA)", key="involved_uncinate")
-            if involved_uncinate:
-                involved_uncinate_detail = st.text_input("Uncinate involved details:", key="involved_uncinate_detail")
-            
-            involved_proximal = st.checkbox("Proximal (gastric or duodenal)", key="involved_proximal")
-            if involved_proximal:
-                involved_proximal_detail = st.text_input("Proximal involved details:", key="involved_proximal_detail")
-            
-            involved_distal = st.checkbox("Distal (duodenal or jejunal)", key="involved_distal")
-            if involved_distal:
-                involved_distal_detail = st.text_input("Distal involved details:", key="involved_distal_detail")
-        
-        involved_other = st.checkbox("Other", key="involved_other")
-        if involved_other:
-            involved_other_detail = st.text_input("Specify other involved margin:", key="involved_other_detail")
-        
-        involved_cannot_determine = st.checkbox("Cannot be determined", key="involved_cannot_determine")
-        if involved_cannot_determine:
-            involved_cannot_detail = st.text_input("Cannot be determined details:", key="involved_cannot_detail")
+        reveal_group([
+            ("involved_deep", "Deep (radial)", "involved_deep_detail", "Deep involved details:"),
+            ("involved_duodenal", "Duodenal mucosal", "involved_duodenal_detail", "Duodenal involved details:"),
+            ("involved_pancreatic_duct", "Pancreatic duct", "involved_pancreatic_duct_detail", "Pancreatic duct involved details:"),
+            ("involved_bile_duct", "Bile duct", "involved_bile_duct_detail", "Bile duct involved details:"),
+            ("involved_pancreatic_neck", "Pancreatic neck / parenchymal", "involved_pancreatic_neck_detail", "Pancreatic neck involved details:"),
+            ("involved_uncinate", "Uncinate (retroperitoneal / SMA)", "involved_uncinate_detail", "Uncinate involved details:"),
+            ("involved_proximal", "Proximal (gastric or duodenal)", "involved_proximal_detail", "Proximal involved details:"),
+            ("involved_distal", "Distal (duodenal or jejunal)", "involved_distal_detail", "Distal involved details:"),
+            ("involved_other", "Other", "involved_other_detail", "Specify other involved margin:"),
+            ("involved_cannot_determine", "Cannot be determined", "involved_cannot_detail", "Cannot be determined details:")
+        ], key="involved_margin_group", columns=2)
     
     elif margin_status == "Other":
         margin_other_status = st.text_input("Specify other:", key="margin_other_status")
@@ -401,32 +353,14 @@ def main():
     if dysplasia_status == "High-grade dysplasia and / or high-grade intraepithelial neoplasia present at margin":
         st.write("**Margin(s) Involved by High-Grade Dysplasia:**")
         
-        col1, col2 = st.columns(2)
-        with col1:
-            hgd_pancreatic_neck = st.checkbox("Pancreatic neck / parenchymal margin", key="hgd_pancreatic_neck")
-            if hgd_pancreatic_neck:
-                hgd_pancreatic_neck_detail = st.text_input("HGD Pancreatic neck details:", key="hgd_pancreatic_neck_detail")
-            
-            hgd_bile_duct = st.checkbox("Bile duct margin", key="hgd_bile_duct")
-            if hgd_bile_duct:
-                hgd_bile_duct_detail = st.text_input("HGD Bile duct details:", key="hgd_bile_duct_detail")
-        
-        with col2:
-            hgd_proximal = st.checkbox("Proximal (gastric or duodenal)", key="hgd_proximal")
-            if hgd_proximal:
-                hgd_proximal_detail = st.text_input("HGD Proximal details:", key="hgd_proximal_detail")
-            
-            hgd_distal = st.checkbox("Distal (duodenal or jejunal)", key="hgd_distal")
-            if hgd_distal:
-                hgd_distal_detail = st.text_input("HGD Distal details:", key="hgd_distal_detail")
-        
-        hgd_other = st.checkbox("Other", key="hgd_other")
-        if hgd_other:
-            hgd_other_detail = st.text_input("HGD Other details:", key="hgd_other_detail")
-        
-        hgd_cannot = st.checkbox("Cannot be determined", key="hgd_cannot")
-        if hgd_cannot:
-            hgd_cannot_detail = st.text_input("HGD Cannot be determined details:", key="hgd_cannot_detail")
+        reveal_group([
+            ("hgd_pancreatic_neck", "Pancreatic neck / parenchymal margin", "hgd_pancreatic_neck_detail", "HGD Pancreatic neck details:"),
+            ("hgd_bile_duct", "Bile duct margin", "hgd_bile_duct_detail", "HGD Bile duct details:"),
+            ("hgd_proximal", "Proximal (gastric or duodenal)", "hgd_proximal_detail", "HGD Proximal details:"),
+            ("hgd_distal", "Distal (duodenal or jejunal)", "hgd_distal_detail", "HGD Distal details:"),
+            ("hgd_other", "Other", "hgd_other_detail", "HGD Other details:"),
+            ("hgd_cannot", "Cannot be determined", "hgd_cannot_detail", "HGD Cannot be determined details:")
+        ], key="hgd_margin_group", columns=2)
     
     elif dysplasia_status == "Other":
         dysplasia_other = st.text_input("Specify other:", key="dysplasia_other")
@@ -437,100 +371,94 @@ def main():
     margin_comment = st.text_area("Margin Comment:", key="margin_comment")
     
     # ========== REGIONAL LYMPH NODES SECTION ==========
-    st.markdown('<div class="section-header"><h2>🔗 REGIONAL LYMPH NODES</h2></div>', unsafe_allow_html=True)
-    
-    # Regional Lymph Node Status
-    st.markdown('<div class="subsection"><h4>Regional Lymph Node Status</h4></div>', unsafe_allow_html=True)
-    
-    ln_status = st.radio(
-        "Regional lymph node status:",
-        [
-            "Not applicable (no regional lymph nodes submitted or found)",
-            "Regional lymph nodes present",
-            "Other",
-            "Cannot be determined"
-        ],
-        key="ln_status"
-    )
+    st.markdown('<div class="section-header" id="lymph_nodes"><h2>🔗 REGIONAL LYMPH NODES</h2></div>', unsafe_allow_html=True)
+    inline_warnings("ampulla", "lymph_nodes")
     
-    if ln_status == "Regional lymph nodes present":
-        ln_tumor_status = st.radio(
-            "Tumor in lymph nodes:",
+    with batch_section("Regional Lymph Nodes", key="lymph_node_form"):
+        # Regional Lymph Node Status
+        st.markdown('<div class="subsection"><h4>Regional Lymph Node Status</h4></div>', unsafe_allow_html=True)
+        
+        ln_status = st.radio(
+            "Regional lymph node status:",
             [
-                "All regional lymph nodes negative for tumor",
-                "Tumor present in regional lymph node(s)"
+                "Not applicable (no regional lymph nodes submitted or found)",
+                "Regional lymph nodes present",
+                "Other",
+                "Cannot be determined"
             ],
-            key="ln_tumor_status"
+            key="ln_status"
         )
         
-        if ln_tumor_status == "Tumor present in regional lymph node(s)":
-            st.write("**Number of Lymph Nodes with Tumor:**")
+        if ln_status == "Regional lymph nodes present" or batch:
+            ln_tumor_status = st.radio(
+                "Tumor in lymph nodes:",
+                [
+                    "All regional lymph nodes negative for tumor",
+                    "Tumor present in regional lymph node(s)"
+                ],
+                key="ln_tumor_status"
+            )
+            
+            if ln_tumor_status == "Tumor present in regional lymph node(s)" or batch:
+                st.write("**Number of Lymph Nodes with Tumor:**")
+                
+                ln_positive_method = st.radio(
+                    "Number of positive nodes:",
+                    ["Exact number", "At least", "Other", "Cannot be determined"],
+                    key="ln_positive_method"
+                )
+                
+                if ln_positive_method == "Exact number" or batch:
+                    ln_positive_exact = st.number_input("Exact number of positive nodes:", min_value=0, key="ln_positive_exact")
+                if ln_positive_method == "At least" or batch:
+                    ln_positive_atleast = st.number_input("At least number of positive nodes:", min_value=0, key="ln_positive_atleast")
+                if ln_positive_method == "Other" or batch:
+                    ln_positive_other = st.text_input("Specify other:", key="ln_positive_other")
+                if ln_positive_method == "Cannot be determined" or batch:
+                    ln_positive_explain = st.text_input("Explain:", key="ln_positive_explain")
             
-            ln_positive_method = st.radio(
-                "Number of positive nodes:",
+            st.write("**Number of Lymph Nodes Examined:**")
+            
+            ln_examined_method = st.radio(
+                "Number of examined nodes:",
                 ["Exact number", "At least", "Other", "Cannot be determined"],
-                key="ln_positive_method"
+                key="ln_examined_method"
             )
             
-            if ln_positive_method == "Exact number":
-                ln_positive_exact = st.number_input("Exact number of positive nodes:", min_value=0, key="ln_positive_exact")
-            elif ln_positive_method == "At least":
-                ln_positive_atleast = st.number_input("At least number of positive nodes:", min_value=0, key="ln_positive_atleast")
-            elif ln_positive_method == "Other":
-                ln_positive_other = st.text_input("Specify other:", key="ln_positive_other")
-            elif ln_positive_method == "Cannot be determined":
-                ln_positive_explain = st.text_input("Explain:", key="ln_positive_explain")
-        
-        st.write("**Number of Lymph Nodes Examined:**")
-        
-        ln_examined_method = st.radio(
-            "Number of examined nodes:",
-            ["Exact number", "At least", "Other", "Cannot be determined"],
-            key="ln_examined_method"
-        )
-        
-        if ln_examined_method == "Exact number":
-            ln_examined_exact = st.number_input("Exact number of examined nodes:", min_value=0, key="ln_examined_exact")
-        elif ln_examined_method == "At least":
-            ln_examined_atleast = st.number_input("At least number of examined nodes:", min_value=0, key="ln_examined_atleast")
-        elif ln_examined_method == "Other":
-            ln_examined_other = st.text_input("Specify other:", key="ln_examined_other")
-        elif ln_examined_method == "Cannot be determined":
-            ln_examined_explain = st.text_input("Explain:", key="ln_examined_explain")
-    
-    elif ln_status == "Other":
-        ln_other_detail = st.text_input("Specify other:", key="ln_other_detail")
-    elif ln_status == "Cannot be determined":
-        ln_cannot_explain = st.text_input("Explain:", key="ln_cannot_explain")
-    
-    # Regional Lymph Node Comment
-    ln_comment = st.text_area("Regional Lymph Node Comment:", key="ln_comment")
+            if ln_examined_method == "Exact number" or batch:
+                ln_examined_exact = st.number_input("Exact number of examined nodes:", min_value=0, key="ln_examined_exact")
+            if ln_examined_method == "At least" or batch:
+                ln_examined_atleast = st.number_input("At least number of examined nodes:", min_value=0, key="ln_examined_atleast")
+            if ln_examined_method == "Other" or batch:
+                ln_examined_other = st.text_input("Specify other:", key="ln_examined_other")
+            if ln_examined_method == "Cannot be determined" or batch:
+                ln_examined_explain = st.text_input("Explain:", key="ln_examined_explain")
+        
+        if ln_status == "Other" or batch:
+            ln_other_detail = st.text_input("Specify other:", key="ln_other_detail")
+        if ln_status == "Cannot be determined" or batch:
+            ln_cannot_explain = st.text_input("Explain:", key="ln_cannot_explain")
+        
+        # Regional Lymph Node Comment
+        ln_comment = st.text_area("Regional Lymph Node Comment:", key="ln_comment")
     
     # ========== DISTANT METASTASIS SECTION ==========
     st.markdown('<div class="section-header"><h2>🎯 DISTANT METASTASIS</h2></div>', unsafe_allow_html=True)
+    inline_warnings("ampulla", "distant_metastasis")
     
     st.markdown('<div class="subsection"><h4>Distant Site(s) Involved, if applicable (select all that apply)</h4></div>', unsafe_allow_html=True)
     
-    dm_not_applicable = st.checkbox("Not applicable", key="dm_not_applicable")
-    
-    dm_non_regional_ln = st.checkbox("Non-regional lymph node(s)", key="dm_non_regional_ln")
-    if dm_non_regional_ln:
-        dm_non_regional_detail = st.text_input("Non-regional lymph node details:", key="dm_non_regional_detail")
-    
-    dm_liver = st.checkbox("Liver", key="dm_liver")
-    if dm_liver:
-        dm_liver_detail = st.text_input("Liver metastasis details:", key="dm_liver_detail")
-    
-    dm_other = st.checkbox("Other", key="dm_other")
-    if dm_other:
-        dm_other_detail = st.text_input("Specify other distant sites:", key="dm_other_detail")
-    
-    dm_cannot_determine = st.checkbox("Cannot be determined", key="dm_cannot_determine")
-    if dm_cannot_determine:
-        dm_cannot_detail = st.text_input("Cannot be determined details:", key="dm_cannot_detail")
+    reveal_group([
+        ("dm_not_applicable", "Not applicable"),
+        ("dm_non_regional_ln", "Non-regional lymph node(s)", "dm_non_regional_detail", "Non-regional lymph node details:"),
+        ("dm_liver", "Liver", "dm_liver_detail", "Liver metastasis details:"),
+        ("dm_other", "Other", "dm_other_detail", "Specify other distant sites:"),
+        ("dm_cannot_determine", "Cannot be determined", "dm_cannot_detail", "Cannot be determined details:")
+    ], key="dm_group")
     
     # ========== pTNM CLASSIFICATION SECTION ==========
-    st.markdown('<div class="section-header"><h2>📊 pTNM CLASSIFICATION (AJCC 8th Edition)</h2></div>', unsafe_allow_html=True)
+    st.markdown('<div class="section-header" id="ptnm"><h2>📊 pTNM CLASSIFICATION (AJCC 8th Edition)</h2></div>', unsafe_allow_html=True)
+    inline_warnings("ampulla", "ptnm")
     
     st.info("Reporting of pT, pN, and (when applicable) pM categories is based on information available to the pathologist at the time the report is issued. As per the AJCC (Chapter 1, 8th Ed.) it is the managing physician's responsibility to establish the final pathologic stage based upon all pertinent information, including but potentially not limited to this pathology report.")
     
@@ -582,6 +510,9 @@ def main():
     
     pn_category = st.selectbox("pN Category:", [""] + pn_options, key="pn_category")
     
+    # pT / pN suggested from the findings above, with disagreement flags
+    derivation_panel("ampulla", pt_options, pn_options)
+    
     # pM Category
     st.markdown('<div class="subsection"><h4>pM Category (required only if confirmed pathologically)</h4></div>', unsafe_allow_html=True)
     
@@ -592,6 +523,14 @@ def main():
     
     pm_category = st.selectbox("pM Category:", [""] + pm_options, key="pm_category")
     
+    # AJCC prognostic stage group from pT / pN / pM
+    stage = stage_group_for("ampulla", st.session_state)
+    if stage:
+        st.info(f"**AJCC Stage Group:** {stage}")
+
+    # Shorthand quick entry, resolved against the option lists above
+    quick_entry_bar("ampulla", pt_options, pn_options, pm_options, grade_options)
+    
     # ========== ADDITIONAL FINDINGS SECTION ==========
     st.markdown('<div class="section-header"><h2>🔍 ADDITIONAL FINDINGS</h2></div>', unsafe_allow_html=True)
     
@@ -631,9 +570,19 @@ def main():
     # ========== GENERATE REPORT SECTION ==========
     st.markdown("---")
     st.markdown("### 📋 Generate Final Report")
+    validation_summary("ampulla")
+    case_form_rendered("ampulla")
+    completeness_navigator("ampulla", navigator)
     
     # Large Generate Report Button
     if st.button("🔬 GENERATE COMPLETE PATHOLOGY REPORT", type="primary", use_container_width=True):
+        if not report_allowed("ampulla"):
+            st.error("❌ Report not generated: resolve or acknowledge the consistency issues above.")
+            st.stop()
+        missing = missing_required("ampulla")
+        if missing:
+            st.warning(f"⚠️ {len(missing)} required element(s) missing: {', '.join(element.label for element in missing)}")
+        
         st.success("✅ Complete pathology report generated successfully!")
         
         # Large Report Display Area
@@ -808,6 +757,7 @@ CASE SUMMARY (AMPULLA OF VATER)
                     report_content += f"  Distance to closest margin: {st.session_state.distance_mm} mm\n"
                 elif st.session_state.get('distance_method') in ["Greater than 1 cm", "Greater than 10 mm"]:
                     report_content += f"  Distance to closest margin: {st.session_state.distance_method}\n"
+            report_content += margin_distance_lines("ampulla")
         
         # Involved margins if positive
         elif st.session_state.get('margin_status') == "Invasive carcinoma present at margin":
@@ -902,6 +852,9 @@ CASE SUMMARY (AMPULLA OF VATER)
         
         if st.session_state.get('pm_category') and st.session_state.pm_category != "Not applicable - pM cannot be determined from the submitted specimen(s)":
             report_content += f"pM: {st.session_state.pm_category}\n"
+        stage = stage_group_for("ampulla", st.session_state)
+        if stage:
+            report_content += f"Stage Group (AJCC 8th Edition): {stage}\n"
         
         # Add Additional Findings Section
         report_content += f"\nADDITIONAL FINDINGS\n"
@@ -950,6 +903,8 @@ CASE SUMMARY (AMPULLA OF VATER)
             mime="text/plain",
             use_container_width=True
         )
+        
+        sign_out_button("ampulla", report_content)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
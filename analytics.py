@@ -0,0 +1,110 @@
+import time
+from collections import defaultdict
+
+import pandas as pd
+import streamlit as st
+
+from cases import ORGANS
+from report_index import connect
+from report_stats import ensure_stats, load_stats, months
+
+st.set_page_config(
+    page_title="Pathology Cohort Analytics",
+    page_icon="📊",
+    layout="wide"
+)
+
+DISTRIBUTIONS = {"pt": "pT category", "pn": "pN category", "grade": "Histologic grade"}
+
+
+def _distribution(stats, metric):
+    # month x bucket report counts
+    counts = defaultdict(dict)
+    for (month, name, bucket), (cases, _) in stats.items():
+        if name == metric:
+            counts[bucket][month] = cases
+    return pd.DataFrame(counts).fillna(0).astype(int).sort_index()
+
+
+def _monthly_mean(stats, metric):
+    return pd.Series({month: total / cases for (month, name, _), (cases, total) in stats.items() if name == metric},
+                     dtype=float).sort_index()
+
+
+def _margin_positivity(stats):
+    margins = _distribution(stats, "margin")
+    if margins.empty:
+        return pd.Series(dtype=float)
+    margins = margins.reindex(columns=["positive", "negative"], fill_value=0)
+    return (100 * margins["positive"] / margins.sum(axis=1)).rename("Positive margins (%)")
+
+
+def _overall_mean(stats, metric):
+    cases = sum(value[0] for key, value in stats.items() if key[1] == metric)
+    return sum(value[1] for key, value in stats.items() if key[1] == metric) / cases if cases else None
+
+
+def main():
+    st.title("📊 Cohort Analytics")
+    st.markdown("**Signed-out reports** by organ and month")
+
+    started = time.perf_counter()
+    connection = connect()
+    ensure_stats(connection)
+    available = months(connection)
+    if not available:
+        st.info("No signed-out reports yet.")
+        connection.close()
+        return
+
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        organ = st.selectbox("Organ:", [""] + list(ORGANS), format_func=lambda o: ORGANS.get(o, "All"), key="analytics_organ")
+    with col2:
+        if len(available) > 1:
+            first, last = st.select_slider("Months:", available, value=(available[0], available[-1]), key="analytics_months")
+        else:
+            first = last = available[0]
+    stats = load_stats(connection, [organ] if organ else list(ORGANS), first, last)
+    connection.close()
+
+    reports = sum(cases for (_, metric, _), (cases, _) in stats.items() if metric == "cases")
+    margins = _distribution(stats, "margin").sum()
+    node_yield = _overall_mean(stats, "node_yield")
+    turnaround = _overall_mean(stats, "turnaround")
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Reports", reports)
+    col2.metric("Mean node yield", f"{node_yield:.1f}" if node_yield is not None else "—")
+    positive, assessed = margins.get("positive", 0), margins.get("positive", 0) + margins.get("negative", 0)
+    col3.metric("Margin positivity", f"{100 * positive / assessed:.1f}%" if assessed else "—")
+    col4.metric("Mean turnaround", f"{turnaround:.1f} days" if turnaround is not None else "—")
+
+    tabs = st.tabs(list(DISTRIBUTIONS.values()) + ["Node yield", "Margins", "Turnaround"])
+    for tab, metric in zip(tabs, DISTRIBUTIONS):
+        with tab:
+            distribution = _distribution(stats, metric)
+            if distribution.empty:
+                st.info("Not recorded in these reports.")
+                continue
+            st.bar_chart(distribution)
+            totals = distribution.sum().sort_values(ascending=False)
+            st.dataframe(
+                {"Category": list(totals.index), "Reports": list(totals), "Share (%)": list((100 * totals / totals.sum()).round(1))},
+                hide_index=True,
+                width="stretch"
+            )
+    for tab, series, label in (
+        (tabs[3], _monthly_mean(stats, "node_yield"), "Mean lymph nodes examined"),
+        (tabs[4], _margin_positivity(stats), "Positive margins (%)"),
+        (tabs[5], _monthly_mean(stats, "turnaround"), "Mean days from procedure to sign-out")
+    ):
+        with tab:
+            if series.empty:
+                st.info("Not recorded in these reports.")
+                continue
+            st.line_chart(series.rename(label))
+    st.caption(f"Loaded in {(time.perf_counter() - started) * 1000:.0f} ms from the monthly summary")
+
+
+if __name__ == "__main__":
+    main()
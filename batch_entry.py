@@ -0,0 +1,33 @@
+from contextlib import contextmanager
+
+import streamlit as st
+
+from user_prefs import load_prefs, save_pref
+
+
+def _remember_batch_entry():
+    save_pref("batch_entry", st.session_state.batch_entry)
+
+
+def batch_entry_toggle():
+    # Remembered per user between sessions; seeded from saved prefs on first run
+    if "batch_entry" not in st.session_state:
+        st.session_state.batch_entry = load_prefs().get("batch_entry", False)
+    st.sidebar.toggle(
+        "Batch entry mode",
+        key="batch_entry",
+        on_change=_remember_batch_entry,
+        help="Sections are committed with their Apply button instead of rerunning on every click. "
+             "Conditional fields are always shown so they can be filled in without a round trip."
+    )
+    return st.session_state.batch_entry
+
+
+@contextmanager
+def batch_section(name, key):
+    if not st.session_state.get("batch_entry"):
+        yield
+        return
+    with st.form(key, border=False):
+        yield
+        st.form_submit_button(f"Apply {name}", type="primary", use_container_width=True)
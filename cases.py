@@ -0,0 +1,459 @@
+import json
+import os
+from datetime import date, datetime
+
+import streamlit as st
+
+from hl7_outbound import SCHEMA as OUTBOX_SCHEMA
+from hl7_outbound import dispatcher, queue_result, send_queued
+from orders import parse_date
+from report_archive import archive_report
+from report_index import SCHEMA as REPORTS_SCHEMA
+from report_index import index_report
+from report_versions import SCHEMA as VERSIONS_SCHEMA
+from report_versions import display_value, record_version, version_history
+from session_store import load_session, mirror_session
+from storage import connect_db
+
+# A case is the set of answered checklist keys of one form. Widget plumbing
+# (buttons, component groups, presets, internal "_" state) is not part of it.
+CASE_EXCLUDED_KEYS = {
+    "form_data", "final_report", "batch_entry", "quick_entry", "validation_override", "save_draft", "sign_out",
+    "discard_draft"
+}
+CASE_EXCLUDED_PREFIXES = ("_", "FormSubmitter:", "preset_", "macro_", "use_", "report_versions_")
+
+ORGANS = {"colon": "Colon and Rectum", "ampulla": "Ampulla of Vater", "kidney": "Kidney", "hcc": "Hepatocellular Carcinoma"}
+
+# Each checklist runs as its own Streamlit app; opening a case links to it with ?case=<case_id>
+APP_URLS = {
+    "colon": os.environ.get("CHECKLIST_COLON_URL", "http://localhost:8501"),
+    "ampulla": os.environ.get("CHECKLIST_AMPULLA_URL", "http://localhost:8502"),
+    "kidney": os.environ.get("CHECKLIST_KIDNEY_URL", "http://localhost:8503"),
+    "hcc": os.environ.get("CHECKLIST_HCC_URL", "http://localhost:8504")
+}
+
+DRAFT = "draft"
+SIGNED_OUT = "signed_out"
+STATUSES = {DRAFT: "Draft", SIGNED_OUT: "Signed out"}
+
+# One row per (organ, case_id). The worklist pages through it with keyset
+# pagination on (sort column, organ, case_id); every filter combination has
+# an index whose trailing columns match that order. `version` counts saves:
+# writes are compare-and-swap on it, so two sessions editing the same case
+# cannot overwrite each other unnoticed.
+SCHEMA = REPORTS_SCHEMA + VERSIONS_SCHEMA + OUTBOX_SCHEMA + """
+CREATE TABLE IF NOT EXISTS cases (
+    organ TEXT NOT NULL,
+    case_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    pathologist TEXT NOT NULL DEFAULT '',
+    patient_name TEXT NOT NULL DEFAULT '',
+    procedure_date TEXT NOT NULL DEFAULT '',
+    updated_at TEXT NOT NULL,
+    fields TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (organ, case_id)
+);
+CREATE INDEX IF NOT EXISTS cases_updated ON cases (updated_at, organ, case_id);
+CREATE INDEX IF NOT EXISTS cases_status ON cases (status, updated_at, organ, case_id);
+CREATE INDEX IF NOT EXISTS cases_organ ON cases (organ, status, updated_at, case_id);
+CREATE INDEX IF NOT EXISTS cases_pathologist ON cases (pathologist, status, updated_at, organ, case_id);
+CREATE INDEX IF NOT EXISTS cases_case_id ON cases (case_id, organ);
+"""
+
+# Date keys are stored as ISO strings and parsed back when a case is opened
+DATE_KEYS = ("date_of_procedure",)
+
+
+_migrated = set()
+
+
+def connect(path=None):
+    connection = connect_db(SCHEMA, path)
+    if path not in _migrated:
+        # Databases created before cases were versioned
+        if "version" not in {row["name"] for row in connection.execute("PRAGMA table_info(cases)")}:
+            with connection:
+                connection.execute("ALTER TABLE cases ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        _migrated.add(path)
+    return connection
+
+
+def case_values(state):
+    values = {}
+    for key, value in state.items():
+        if key in CASE_EXCLUDED_KEYS or key.startswith(CASE_EXCLUDED_PREFIXES):
+            continue
+        if isinstance(value, date):
+            value = value.isoformat()
+        if isinstance(value, (bool, int, float, str)) and value not in (False, "", 0, 0.0):
+            values[key] = value
+    return values
+
+
+def save_case(connection, organ, values, status=None, expected_version=None):
+    # Compare-and-swap write of the worklist row of (organ, case_id): a new case
+    # (expected_version None) is only inserted if absent, a stored one only
+    # updated if still at expected_version. Returns the new version, or None on
+    # a conflict. status None keeps the stored status, and a signed-out case is
+    # never turned back into a draft. The caller commits.
+    row = (
+        values.get("pathologist") or "", values.get("patient_name") or "", values.get("date_of_procedure") or "",
+        datetime.now().isoformat(timespec="seconds"), json.dumps(values)
+    )
+    if expected_version is None:
+        cursor = connection.execute(
+            """INSERT INTO cases (organ, case_id, status, pathologist, patient_name, procedure_date, updated_at, fields)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (organ, case_id) DO NOTHING""",
+            (organ, values["case_id"], status or DRAFT) + row
+        )
+        return 1 if cursor.rowcount else None
+    cursor = connection.execute(
+        """UPDATE cases SET status = CASE WHEN status = ? THEN status ELSE COALESCE(?, status) END, pathologist = ?, patient_name = ?, procedure_date = ?,
+               updated_at = ?, fields = ?, version = version + 1
+           WHERE organ = ? AND case_id = ? AND version = ?""",
+        (SIGNED_OUT, status) + row + (organ, values["case_id"], expected_version)
+    )
+    return expected_version + 1 if cursor.rowcount else None
+
+
+def load_case(connection, organ, case_id):
+    row = connection.execute("SELECT fields FROM cases WHERE organ = ? AND case_id = ?", (organ, case_id)).fetchone()
+    return json.loads(row["fields"]) if row else None
+
+
+def load_case_version(connection, organ, case_id):
+    # (fields, version) of a stored case, or (None, None)
+    row = connection.execute(
+        "SELECT fields, version FROM cases WHERE organ = ? AND case_id = ?", (organ, case_id)
+    ).fetchone()
+    return (json.loads(row["fields"]), row["version"]) if row else (None, None)
+
+
+def merge_proposal(base, mine, theirs):
+    # Three-way field merge of two sessions' edits of the version `base`:
+    # ({key: value} both sides agree on or only one side changed, [(key, mine, theirs)] changed differently by both)
+    merged = {}
+    conflicts = []
+    for key in sorted(set(base) | set(mine) | set(theirs)):
+        original, my_value, their_value = base.get(key), mine.get(key), theirs.get(key)
+        if my_value == their_value or their_value == original:
+            value = my_value
+        elif my_value == original:
+            value = their_value
+        else:
+            conflicts.append((key, my_value, their_value))
+            continue
+        if value is not None:
+            merged[key] = value
+    return merged, conflicts
+
+
+# Keyset pagination: a page is fetched with WHERE (sort, organ, case_id) past
+# the last row of the previous page, so page N costs the same as page 1.
+SORTS = {
+    "updated_desc": ("updated_at", "DESC"),
+    "updated_asc": ("updated_at", "ASC"),
+    "case_id": ("case_id", "ASC")
+}
+
+
+def list_cases(connection, filters, sort="updated_desc", after=None, page_size=25):
+    # filters: organ / status / pathologist (exact), updated_from / updated_to (ISO dates)
+    # Returns page_size + 1 rows at most; the extra row only signals a next page
+    column, direction = SORTS[sort]
+    where = []
+    params = []
+    for key in ("organ", "status", "pathologist"):
+        if filters.get(key):
+            where.append(f"{key} = ?")
+            params.append(filters[key])
+    if filters.get("updated_from"):
+        where.append("updated_at >= ?")
+        params.append(filters["updated_from"])
+    if filters.get("updated_to"):
+        # Inclusive end date
+        where.append("updated_at < ?")
+        params.append(filters["updated_to"] + "T99")
+    if after:
+        where.append(f"({column}, organ, case_id) {'<' if direction == 'DESC' else '>'} (?, ?, ?)")
+        params += list(after)
+    sql = f"SELECT organ, case_id, status, pathologist, patient_name, procedure_date, updated_at, {column} AS sort_value FROM cases"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {column} {direction}, organ {direction}, case_id {direction} LIMIT ?"
+    params.append(page_size + 1)
+    return connection.execute(sql, params).fetchall()
+
+
+def pathologists(connection):
+    return [row[0] for row in connection.execute("SELECT DISTINCT pathologist FROM cases WHERE pathologist != '' ORDER BY 1")]
+
+
+# Session state of the stored case being edited:
+# _case_sync     {"case_id", "version", "base"}: the stored version this session last loaded or saved, and its answers
+# _case_conflict {"case_id", "version", "base", "theirs"}: a save that lost the compare-and-swap, until resolved
+# _order         placer order number of a worklist entry created from an LIS order (hl7_orders), kept
+#                in the stored fields until someone edits the case so order updates and cancellations still apply
+# _case_rendered answers of that entry as first rendered (widget defaults, resolved procedure); any other
+#                answers are an edit
+# _form_defaults answers of the session's form as first rendered, without the Case ID; a Case ID not stored
+#                yet is only autosaved once something else differs from them
+def _set_values(values, replace=False):
+    # Load stored fields into the widgets; replace=True also clears answers the stored case does not have
+    state = st.session_state
+    if replace:
+        for key in case_values(state):
+            if key not in values:
+                del state[key]
+    for key, value in values.items():
+        state[key] = parse_date(value) if key in DATE_KEYS else value
+
+
+def open_case_from_query(organ):
+    # ?case=<case_id> (links from the worklist): load the stored case once, before any widget renders
+    case_id = st.query_params.get("case")
+    if not case_id or st.session_state.get("_case_loaded") == case_id:
+        return
+    connection = connect()
+    values, version = load_case_version(connection, organ, case_id)
+    connection.close()
+    st.session_state._case_loaded = case_id
+    st.session_state.pop("_order", None)
+    st.session_state.pop("_case_rendered", None)
+    if values is None:
+        st.session_state._case_message = ("warning", f"Case {case_id} was not found in the worklist.")
+        return
+    _set_values(values)
+    st.session_state._case_sync = {"case_id": case_id, "version": version, "base": case_values(values)}
+    st.session_state._case_message = ("success", f"Opened case {case_id}.")
+
+
+def _store_case(organ, status, report=None):
+    # Returns (case_id, version signed out or None); None without a Case ID or on a conflict
+    state = st.session_state
+    values = case_values(state)
+    if not values.get("case_id"):
+        st.toast("Enter a Case ID first.", icon="⚠️")
+        return None
+    if state.get("_case_conflict", {}).get("case_id") == values["case_id"]:
+        st.toast("Resolve the conflicting edits in the sidebar first.", icon="⚠️")
+        return None
+    sync = state.get("_case_sync")
+    expected, base = (sync["version"], sync["base"]) if sync and sync["case_id"] == values["case_id"] else (None, {})
+    stored = values
+    if state.get("_order") and status is None and state.get("_case_rendered") == values:
+        stored = dict(values, _order=state._order)
+    else:
+        state.pop("_order", None)
+    signed_out_at = datetime.now().isoformat(timespec="seconds")
+    report_version = None
+    connection = connect()
+    with connection:
+        # Conflict detection is the WHERE clause of the write itself
+        version = save_case(connection, organ, stored, status, expected)
+        if version is not None and report is not None:
+            index_report(connection, organ, values, report, signed_out_at)
+            report_version = record_version(connection, organ, values, report, signed_out_at)
+            queue_result(connection, organ, ORGANS[organ], values, report, report_version, signed_out_at)
+    if version is None:
+        theirs, their_version = load_case_version(connection, organ, values["case_id"])
+        connection.close()
+        state._case_conflict = {"case_id": values["case_id"], "version": their_version, "base": base, "theirs": theirs}
+        st.toast(f"Case {values['case_id']} was changed in another session; review the merge in the sidebar.", icon="⚠️")
+        return None
+    if report is not None:
+        archive_report(connection, organ, values["case_id"], report, values, signed_out_at)
+        send_queued()
+    connection.close()
+    state._case_sync = {"case_id": values["case_id"], "version": version, "base": values}
+    state._case_saved_at = datetime.now().strftime("%H:%M:%S")
+    return values["case_id"], report_version
+
+
+def _save_draft(organ):
+    stored = _store_case(organ, DRAFT)
+    if stored:
+        st.toast(f"Draft of case {stored[0]} saved.", icon="💾")
+
+
+def _sign_out(organ, report):
+    stored = _store_case(organ, SIGNED_OUT, report)
+    if stored:
+        case_id, version = stored
+        st.toast(f"Case {case_id} signed out and indexed" + (f" (amendment, version {version})." if version > 1 else "."), icon="✅")
+
+
+def _discard_draft(organ):
+    # Delete the stored draft of the open case (never a signed-out one) and start a blank form
+    state = st.session_state
+    sync = state.get("_case_sync")
+    if not sync:
+        return
+    connection = connect()
+    with connection:
+        deleted = connection.execute(
+            "DELETE FROM cases WHERE organ = ? AND case_id = ? AND status = ? AND version = ?",
+            (organ, sync["case_id"], DRAFT, sync["version"])
+        ).rowcount
+    connection.close()
+    if not deleted:
+        st.toast(f"Case {sync['case_id']} is signed out or was changed in another session; it was not discarded.", icon="⚠️")
+        return
+    _set_values({}, replace=True)
+    for key in ("_case_sync", "_case_saved_at", "_case_conflict", "_order", "_case_rendered"):
+        state.pop(key, None)
+    st.query_params.pop("case", None)
+    st.toast(f"Draft of case {sync['case_id']} discarded.", icon="🗑️")
+
+
+def _answered(state, values):
+    # Anything besides the Case ID that differs from the form as first rendered
+    defaults = state.get("_form_defaults")
+    if defaults is None:
+        return False
+    return any(values.get(key) != defaults.get(key) for key in set(values) | set(defaults) if key != "case_id")
+
+
+def autosave(organ):
+    # Called at the top of every rerun, when the last interaction's widget values
+    # are already in session state; writes only if the answers changed since the last save.
+    # A Case ID that is not stored yet waits for another answer, so typing one never
+    # leaves drafts under partial or mistyped IDs.
+    state = st.session_state
+    if not state.get("_autosave", True) or "_case_conflict" in state:
+        return
+    values = case_values(state)
+    sync = state.get("_case_sync")
+    stored = sync and sync["case_id"] == values.get("case_id")
+    if not values.get("case_id") or (stored and sync["base"] == values) or (not stored and not _answered(state, values)):
+        return
+    _store_case(organ, None)
+
+
+def _resolve_conflict(organ, keep_mine):
+    state = st.session_state
+    conflict = state.pop("_case_conflict")
+    if keep_mine:
+        merged, conflicts = merge_proposal(conflict["base"], case_values(state), case_values(conflict["theirs"] or {}))
+        for key, mine, theirs in conflicts:
+            value = mine if state.get(f"_merge_{key}", "mine") == "mine" else theirs
+            if value is not None:
+                merged[key] = value
+    else:
+        merged = conflict["theirs"] or {"case_id": conflict["case_id"]}
+        state.pop("_case_saved_at", None)
+    for key in [key for key in state if key.startswith("_merge_")]:
+        del state[key]
+    _set_values(merged, replace=True)
+    state.pop("_order", None)
+    state._case_sync = {"case_id": conflict["case_id"], "version": conflict["version"], "base": case_values(conflict["theirs"] or {})}
+    if keep_mine and _store_case(organ, None):
+        st.toast(f"Merged edits of case {conflict['case_id']} saved.", icon="🔀")
+
+
+def _conflict_panel(organ, conflict):
+    # Re-read while the conflict is open (one primary-key lookup), so the proposal is against the latest save
+    connection = connect()
+    theirs, version = load_case_version(connection, organ, conflict["case_id"])
+    connection.close()
+    if version != conflict["version"]:
+        conflict.update(theirs=theirs, version=version)
+    mine = case_values(st.session_state)
+    theirs = case_values(conflict["theirs"] or {})
+    merged, conflicts = merge_proposal(conflict["base"], mine, theirs)
+    st.warning(f"Case {conflict['case_id']} was saved in another session (version {conflict['version']}). "
+               "Your latest changes are not saved yet.")
+    conflicting = {key for key, _, _ in conflicts}
+    taken = [key for key in set(merged) | set(mine) if merged.get(key) != mine.get(key) and key not in conflicting]
+    if taken:
+        st.caption(f"Taken from the other session: {', '.join(sorted(taken))}")
+    for key, my_value, their_value in conflicts:
+        st.radio(
+            f"{key}:", ["mine", "theirs"], key=f"_merge_{key}",
+            format_func=lambda side, m=my_value, t=their_value: f"Mine: {display_value(m)}" if side == "mine" else f"Theirs: {display_value(t)}"
+        )
+    st.button("🔀 Save merged", key="_merge_save", on_click=_resolve_conflict, args=(organ, True), use_container_width=True)
+    st.button("Discard my changes", key="_merge_discard", on_click=_resolve_conflict, args=(organ, False), use_container_width=True)
+
+
+# Session-level keys a replica needs besides the answers to resume a session
+RESUMED_KEYS = (
+    "_case_sync", "_case_conflict", "_case_loaded", "_case_saved_at", "_order_loaded", "_order", "_case_rendered", "_autosave",
+    "_form_defaults"
+)
+
+
+def resume_session(organ):
+    # First run of a browser session on this replica: restore the state mirrored by another
+    # replica (see session_store). Call before prefill_from_order and before any widget renders.
+    state = st.session_state
+    if "_session_resumed" in state:
+        return
+    state._session_resumed = True
+    mirrored = load_session(organ)
+    if not mirrored:
+        return
+    _set_values(mirrored["answers"])
+    for key in RESUMED_KEYS:
+        if key in mirrored:
+            state[key] = mirrored[key]
+    state._session_mirrored = mirrored
+    if mirrored["answers"].get("case_id"):
+        state._case_message = ("info", f"Resumed case {mirrored['answers']['case_id']}.")
+
+
+def _mirror_session(organ):
+    state = st.session_state
+    snapshot = {"answers": case_values(state)}
+    snapshot.update({key: state[key] for key in RESUMED_KEYS if key in state})
+    mirror_session(organ, snapshot)
+
+
+def case_sidebar(organ):
+    open_case_from_query(organ)
+    autosave(organ)
+    _mirror_session(organ)
+    # Starts this process's HL7 result sender, which picks up anything still queued
+    dispatcher()
+    with st.sidebar:
+        st.markdown("### 🗂️ Case")
+        message = st.session_state.pop("_case_message", None)
+        if message:
+            getattr(st, message[0])(message[1])
+        conflict = st.session_state.get("_case_conflict")
+        if conflict:
+            _conflict_panel(organ, conflict)
+        st.button("💾 Save Draft", key="save_draft", on_click=_save_draft, args=(organ,), use_container_width=True)
+        if "_autosave" not in st.session_state:
+            st.session_state._autosave = True
+        st.toggle("Autosave", key="_autosave")
+        sync = st.session_state.get("_case_sync")
+        if st.session_state.get("_case_saved_at") and sync:
+            st.caption(f"Saved {st.session_state._case_saved_at} (version {sync['version']})")
+        if sync and sync["case_id"] == st.session_state.get("case_id"):
+            st.button("🗑️ Discard Draft", key="discard_draft", on_click=_discard_draft, args=(organ,), use_container_width=True)
+
+
+def case_form_rendered(organ):
+    # Call after the last checklist widget. Records the form's first answers (see
+    # _form_defaults). The first time a case created from an LIS order renders, its
+    # answers (the order's, the widgets' defaults and the procedure matched to the
+    # app's options) are saved without dropping the order marker, so viewing an
+    # order neither loses the procedure nor makes it "edited".
+    state = st.session_state
+    if "_form_defaults" not in state:
+        state._form_defaults = {key: value for key, value in case_values(state).items() if key != "case_id"}
+    if not state.get("_order") or "_case_rendered" in state:
+        return
+    state._case_rendered = case_values(state)
+    autosave(organ)
+
+
+def sign_out_button(organ, report):
+    st.button("✍️ Sign Out Report", key="sign_out", on_click=_sign_out, args=(organ, report), use_container_width=True)
+    if st.session_state.get("case_id"):
+        connection = connect()
+        version_history(connection, organ, st.session_state.case_id, "report_versions")
+        connection.close()
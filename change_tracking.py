@@ -0,0 +1,18 @@
+import streamlit as st
+
+# Rerun-to-rerun change detection over a fixed set of watched keys. Each named
+# tracker remembers the values it saw last time, so incremental features
+# (validation, completeness) only do work for keys that actually changed.
+
+
+def changed_keys(tracker, keys):
+    state = st.session_state
+    snapshot_key = f"_{tracker}_snapshot"
+    if snapshot_key not in state:
+        state[snapshot_key] = {key: state.get(key) for key in keys}
+        return list(keys)
+    snapshot = state[snapshot_key]
+    changed = [key for key in keys if state.get(key) != snapshot.get(key)]
+    for key in changed:
+        snapshot[key] = state.get(key)
+    return changed
@@ -0,0 +1,89 @@
+import time
+from urllib.parse import quote
+
+import streamlit as st
+
+from cases import APP_URLS, ORGANS, connect
+from cohort_index import CohortIndex
+
+st.set_page_config(
+    page_title="Pathology Cohort Query",
+    page_icon="🧮",
+    layout="wide"
+)
+
+RESULT_LIMIT = 500
+
+EXAMPLES = [
+    'organ == "colon" and pt_category == "pT3*" and lvi_small and ln_examined < 12',
+    'organ == "kidney" and sarcomatoid_present and grade == "G4"',
+    'status == "signed_out" and stage_group in ("IIIA", "IIIB", "IIIC")'
+]
+
+
+@st.cache_resource
+def cohort_index():
+    # Shared by every session of this server; each run only indexes the cases saved since the last one
+    return CohortIndex()
+
+
+def main():
+    st.title("🧮 Cohort Query")
+    st.markdown("**Boolean queries** over the structured fields of all stored cases")
+
+    index = cohort_index()
+    connection = connect()
+    index.refresh(connection)
+    connection.close()
+
+    query = st.text_input(
+        "Query:",
+        key="cohort_query",
+        placeholder=EXAMPLES[0],
+        help='field (checked / answered), field == "pT3a" (option or its short label), field == "pT3*" (prefix), '
+             'field in ("G3", "G4"), field < 12, 5 <= field < 12, and / or / not, parentheses. '
+             "Besides the form keys: organ, status, stage_group."
+    )
+
+    with st.expander(f"Indexed fields ({len(index.cases)} cases)"):
+        fields = index.fields()
+        st.dataframe(
+            {"Field": [f[0] for f in fields], "Kind": [f[1] for f in fields], "Answered": [f[2] for f in fields]},
+            hide_index=True,
+            width="stretch"
+        )
+        field = st.selectbox("Options of:", [""] + sorted(index.options), key="cohort_field")
+        if field:
+            counts = index.option_counts(field)
+            st.dataframe({"Option": [c[0] for c in counts], "Cases": [c[1] for c in counts]}, hide_index=True, width="stretch")
+
+    if not query.strip():
+        st.info("Enter a query, for example:\n\n" + "\n\n".join(f"`{example}`" for example in EXAMPLES))
+        return
+
+    started = time.perf_counter()
+    try:
+        bitmap = index.query(query)
+    except ValueError as error:
+        st.error(str(error))
+        return
+    elapsed = (time.perf_counter() - started) * 1000
+    count = index.count(bitmap)
+    st.caption(f"{count} case(s) in {elapsed:.1f} ms" + (f" (first {RESULT_LIMIT} listed)" if count > RESULT_LIMIT else ""))
+
+    matches = index.matches(bitmap, RESULT_LIMIT)
+    if matches:
+        st.dataframe(
+            {
+                "Case ID": [case_id for _, case_id in matches],
+                "Organ": [ORGANS[organ] for organ, _ in matches],
+                "Open": [f"{APP_URLS[organ]}/?case={quote(case_id)}" for organ, case_id in matches]
+            },
+            hide_index=True,
+            width="stretch",
+            column_config={"Open": st.column_config.LinkColumn("Open", display_text="Open ↗")}
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+import ast
+import json
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from derivation import option_label
+from stage_groups import stage_group_for
+from units import normalize_values
+
+# In-memory cohort index over the structured fields of every stored case, for
+# research / QA pulls such as
+#   organ == "colon" and pt_category == "pT3*" and lvi_small and ln_examined < 12
+# Each case is a row. Checked boxes and every selectbox / radio option get a
+# bitmap over the rows (NumPy bool arrays packed 8 rows per byte, so a million
+# cases cost 125 KB per option); numbers (raw inputs and the canonical
+# findings of units.py) are float32 columns with NaN where missing. A query is a
+# handful of vectorized AND / OR / NOT and comparisons over whole columns.
+#
+# Query syntax (a Python expression):
+#   field                       checked / answered
+#   field == "pT3a"             option, or its short label ("pT3a" for "pT3a: Tumor ...")
+#   field == "pT3*"             options starting with "pT3"
+#   field in ("G3", "G4")       any of the options
+#   field < 12, 5 <= field < 12 numeric comparisons (censored "At least" answers use their bound)
+#   and / or / not, parentheses
+# Besides the form keys: organ, status and stage_group.
+
+# String fields with more distinct answers than this are free text, not categories
+MAX_OPTIONS = 200
+
+_FLIPPED = {ast.Lt: ast.Gt, ast.LtE: ast.GtE, ast.Gt: ast.Lt, ast.GtE: ast.LtE, ast.Eq: ast.Eq, ast.NotEq: ast.NotEq}
+_NUMERIC_OPS = {
+    ast.Lt: np.less, ast.LtE: np.less_equal, ast.Gt: np.greater, ast.GtE: np.greater_equal,
+    ast.Eq: np.equal, ast.NotEq: np.not_equal
+}
+
+
+def _row_masks(rows):
+    rows = np.asarray(rows, dtype=np.intp)
+    return rows >> 3, (0x80 >> (rows & 7)).astype(np.uint8)
+
+
+def case_entries(organ, status, fields):
+    # (flags, categories, numbers) a stored case contributes to the index
+    flags = []
+    categories = {"organ": organ, "status": status}
+    numbers = {}
+    for key, value in fields.items():
+        if value is True:
+            flags.append(key)
+        elif isinstance(value, str):
+            categories[key] = value
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            numbers[key] = float(value)
+    stage = stage_group_for(organ, fields)
+    if stage:
+        categories["stage_group"] = stage
+    for name, measurement in normalize_values(organ, fields).items():
+        value = measurement.value
+        numbers[name] = float(max(value) if isinstance(value, list) else value)
+    return flags, categories, numbers
+
+
+class CohortIndex:
+    def __init__(self):
+        # row -> (organ, case_id)
+        self.cases = []
+        self._rows = {}
+        # key -> packed bitmap of the rows where the box is checked
+        self.flags = {}
+        # key -> {option: packed bitmap}
+        self.options = {}
+        # name -> float32 column (exact for counts, sub-micron for mm)
+        self.numbers = {}
+        self.text_keys = set()
+        self._live = np.zeros(0, np.uint8)
+        self._capacity = 0
+        self._lock = threading.RLock()
+        # updated_at of the newest case indexed (cases table)
+        self.updated_at = ""
+
+    def _grow(self, needed):
+        capacity = max(1024, self._capacity)
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self._capacity:
+            return
+        padding = (capacity - self._capacity) // 8
+        for bitmaps in [self.flags, *self.options.values()]:
+            for key, bitmap in bitmaps.items():
+                bitmaps[key] = np.concatenate([bitmap, np.zeros(padding, np.uint8)])
+        for name, column in self.numbers.items():
+            self.numbers[name] = np.concatenate([column, np.full(capacity - self._capacity, np.nan, np.float32)])
+        self._capacity = capacity
+
+    def _bitmap(self):
+        return np.zeros(self._capacity // 8, np.uint8)
+
+    def update(self, records):
+        # records: (organ, case_id, status, fields); a case indexed before is replaced
+        flag_rows = defaultdict(list)
+        option_rows = defaultdict(list)
+        number_rows = defaultdict(lambda: ([], []))
+        replaced = []
+        with self._lock:
+            for organ, case_id, status, fields in records:
+                row = self._rows.get((organ, case_id))
+                if row is None:
+                    row = self._rows[(organ, case_id)] = len(self.cases)
+                    self.cases.append((organ, case_id))
+                else:
+                    replaced.append(row)
+                flags, categories, numbers = case_entries(organ, status, fields)
+                for key in flags:
+                    flag_rows[key].append(row)
+                for key, value in categories.items():
+                    if key not in self.text_keys:
+                        option_rows[(key, value)].append(row)
+                for name, value in numbers.items():
+                    number_rows[name][0].append(row)
+                    number_rows[name][1].append(value)
+            self._grow(len(self.cases))
+
+            if replaced:
+                # Forget everything the old version of these cases set
+                byte, mask = _row_masks(replaced)
+                for bitmap in [*self.flags.values(), *(b for o in self.options.values() for b in o.values())]:
+                    np.bitwise_and.at(bitmap, byte, ~mask)
+                for column in self.numbers.values():
+                    column[replaced] = np.nan
+            for key, rows in flag_rows.items():
+                bitmap = self.flags.setdefault(key, self._bitmap())
+                np.bitwise_or.at(bitmap, *_row_masks(rows))
+            for (key, value), rows in option_rows.items():
+                bitmap = self.options.setdefault(key, {}).setdefault(value, self._bitmap())
+                np.bitwise_or.at(bitmap, *_row_masks(rows))
+            for key in [key for key, options in self.options.items() if len(options) > MAX_OPTIONS]:
+                del self.options[key]
+                self.text_keys.add(key)
+            for name, (rows, values) in number_rows.items():
+                if name not in self.numbers:
+                    self.numbers[name] = np.full(self._capacity, np.nan, np.float32)
+                self.numbers[name][rows] = values
+            self._live = np.packbits(np.arange(self._capacity) < len(self.cases))
+
+    def refresh(self, connection, chunk=10000):
+        # Index the cases saved since the last refresh (cases table of cases.py)
+        with self._lock:
+            cursor = connection.execute(
+                "SELECT organ, case_id, status, updated_at, fields FROM cases WHERE updated_at >= ? ORDER BY updated_at",
+                (self.updated_at,)
+            )
+            while True:
+                rows = cursor.fetchmany(chunk)
+                if not rows:
+                    break
+                self.update((row[0], row[1], row[2], json.loads(row[4])) for row in rows)
+                self.updated_at = rows[-1][3]
+
+    # Query evaluation: every node evaluates to a packed bitmap over all rows
+
+    def query(self, expression):
+        # Packed bitmap of the matching cases; ValueError on an invalid query
+        try:
+            tree = ast.parse(expression.strip(), mode="eval")
+        except SyntaxError as error:
+            raise ValueError(f"Invalid query: {error.msg}") from None
+        with self._lock:
+            return self._evaluate(tree.body) & self._live
+
+    def _evaluate(self, node):
+        if isinstance(node, ast.BoolOp):
+            combine = np.bitwise_and if isinstance(node.op, ast.And) else np.bitwise_or
+            result = self._evaluate(node.values[0])
+            for value in node.values[1:]:
+                result = combine(result, self._evaluate(value))
+            return result
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return ~self._evaluate(node.operand) & self._live
+        if isinstance(node, ast.Name):
+            return self._answered(node.id)
+        if isinstance(node, ast.Compare):
+            result = self._live
+            left = node.left
+            for op, right in zip(node.ops, node.comparators):
+                result = result & self._compare(left, op, right)
+                left = right
+            return result
+        raise ValueError(f"Unsupported query syntax: {ast.unparse(node)}")
+
+    def _field(self, name):
+        if name in self.flags or name in self.options or name in self.numbers:
+            return name
+        if name in self.text_keys:
+            raise ValueError(f"{name} is a free-text field and is not indexed")
+        raise ValueError(f"Unknown field {name}: no indexed case has answered it")
+
+    def _answered(self, name):
+        name = self._field(name)
+        if name in self.flags:
+            return self.flags[name]
+        if name in self.options:
+            return np.bitwise_or.reduce(list(self.options[name].values()))
+        return np.packbits(~np.isnan(self.numbers[name]))
+
+    def _compare(self, left, op, right):
+        if isinstance(right, ast.Name) and not isinstance(left, ast.Name):
+            if type(op) not in _FLIPPED:
+                raise ValueError(f"Unsupported comparison: {ast.unparse(left)} {ast.unparse(op)} {right.id}")
+            left, op, right = right, _FLIPPED[type(op)](), left
+        if not isinstance(left, ast.Name):
+            raise ValueError(f"Comparisons need a field on one side: {ast.unparse(left)}")
+        name = self._field(left.id)
+        try:
+            value = ast.literal_eval(right)
+        except ValueError:
+            raise ValueError(f"Compare {name} with a literal, not {ast.unparse(right)}") from None
+        values = value if isinstance(op, (ast.In, ast.NotIn)) else (value,)
+        if not isinstance(values, (tuple, list, set)):
+            raise ValueError(f"{name} in ... needs a list of values")
+        negate = isinstance(op, (ast.NotEq, ast.NotIn))
+
+        if name in self.numbers and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+            column = self.numbers[name]
+            with np.errstate(invalid="ignore"):
+                if isinstance(op, (ast.In, ast.NotIn)):
+                    matched = np.isin(column, values)
+                    matched = matched if not negate else ~matched & ~np.isnan(column)
+                else:
+                    matched = _NUMERIC_OPS[type(op)](column, value) & ~np.isnan(column)
+            return np.packbits(matched)
+        if not isinstance(op, (ast.Eq, ast.NotEq, ast.In, ast.NotIn)):
+            raise ValueError(f"{name} only supports ==, !=, in and not in")
+        matched = self._bitmap()
+        for v in values:
+            matched |= self._match(name, v)
+        return self._answered(name) & ~matched if negate else matched
+
+    def _match(self, name, value):
+        if name in self.flags and isinstance(value, bool):
+            return self.flags[name] if value else ~self.flags[name] & self._live
+        if not isinstance(value, str) or name not in self.options:
+            raise ValueError(f"Cannot compare {name} with {value!r}")
+        matched = self._bitmap()
+        for option, bitmap in self.options[name].items():
+            if option == value or option_label(option) == value or (value.endswith("*") and option.startswith(value[:-1])):
+                matched |= bitmap
+        return matched
+
+    # Results
+
+    def count(self, bitmap):
+        return int(np.bitwise_count(bitmap).sum())
+
+    def matches(self, bitmap, limit=None):
+        # (organ, case_id) of matching rows, oldest indexed first
+        rows = np.flatnonzero(np.unpackbits(bitmap, count=len(self.cases)))
+        return [self.cases[row] for row in rows[:limit]]
+
+    def fields(self):
+        # (name, kind, answered cases) of everything queryable
+        with self._lock:
+            fields = [(name, "checkbox", self.count(bitmap)) for name, bitmap in self.flags.items()]
+            fields += [(name, f"{len(options)} option(s)", self.count(self._answered(name))) for name, options in self.options.items()]
+            fields += [(name, "number", int((~np.isnan(column)).sum())) for name, column in self.numbers.items()]
+        return sorted(fields)
+
+    def option_counts(self, name):
+        with self._lock:
+            return sorted(((option, self.count(bitmap)) for option, bitmap in self.options.get(name, {}).items()),
+                          key=lambda item: -item[1])
+
+
+if __name__ == "__main__":
+    # python cohort_index.py '<query>' against the cases in the data directory
+    from cases import connect
+
+    started = time.perf_counter()
+    index = CohortIndex()
+    connection = connect()
+    index.refresh(connection)
+    connection.close()
+    print(f"indexed {len(index.cases)} case(s) in {time.perf_counter() - started:.2f} s")
+    for expression in sys.argv[1:]:
+        started = time.perf_counter()
+        bitmap = index.query(expression)
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"{expression}: {index.count(bitmap)} case(s) in {elapsed:.2f} ms")
+        for organ, case_id in index.matches(bitmap, 20):
+            print(f"  {organ} {case_id}")
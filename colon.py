@@ -2,6 +2,18 @@ import streamlit as st
 import json
 from datetime import datetime
 
+from batch_entry import batch_entry_toggle, batch_section
+from cases import case_form_rendered, case_sidebar, resume_session, sign_out_button
+from completeness import completeness_navigator, missing_required
+from derivation import derivation_panel
+from margin_table import closest_distance_method, margin_distance_lines, margin_distance_table
+from orders import prefill_from_order, resolve_order_procedure
+from presets import presets_sidebar
+from quick_entry import quick_entry_bar
+from reveal_group import apply_reveal_commits, reveal_group
+from stage_groups import stage_group_for
+from validation import inline_warnings, report_allowed, update_validation, validation_summary
+
 # Set page config
 st.set_page_config(
     page_title="Colorectal Cancer Pathology Reporting Checklist",
@@ -49,6 +61,28 @@ def main():
     if 'form_data' not in st.session_state:
         st.session_state.form_data = {}
     
+    # Batch entry: TUMOR and REGIONAL LYMPH NODES are committed per section
+    batch = batch_entry_toggle()
+    
+    # Resume this browser session's state after a replica switch or restart (optional session store)
+    resume_session("colon")
+    # Checkbox groups' last commits, so everything below reads this run's answers
+    apply_reveal_commits()
+
+    # Prefill case summary fields from an LIS order (?order=... or the order-drop folder)
+    prefill_from_order("colon")
+    case_sidebar("colon")
+    
+    # One-click presets and personal macros (applied before any widget renders)
+    presets_sidebar("colon")
+    
+    # Consistency rules; only rules reading keys changed since the last run are re-checked
+    update_validation("colon")
+    
+    # Required-element completeness, kept as a bitmask and shown as a sidebar navigator
+    # (filled in once the form has rendered)
+    navigator = st.sidebar.container()
+    
     # ========== CASE SUMMARY SECTION ==========
     st.markdown('<div class="section-header"><h2>📋 CASE SUMMARY</h2></div>', unsafe_allow_html=True)
     st.markdown("**(COLON AND RECTUM: Resection)**")
@@ -62,7 +96,7 @@ def main():
         pathologist = st.text_input("Pathologist:", key="pathologist")
     
     # ========== SPECIMEN SECTION ==========
-    st.markdown('<div class="section-header"><h2>🧪 SPECIMEN</h2></div>', unsafe_allow_html=True)
+    st.markdown('<div class="section-header" id="specimen"><h2>🧪 SPECIMEN</h2></div>', unsafe_allow_html=True)
     
     st.markdown('<div class="subsection"><h4>Procedure</h4></div>', unsafe_allow_html=True)
     procedure_options = [
@@ -76,6 +110,7 @@ def main():
         "Other",
         "Not specified"
     ]
+    resolve_order_procedure(procedure_options)
     procedure = st.selectbox("Select procedure:", [""] + procedure_options, key="procedure")
     if procedure == "Other":
         procedure_other = st.text_input("Specify other procedure:", key="procedure_other")
@@ -93,310 +128,262 @@ def main():
         mesorectum_explain = st.text_input("Explain:", key="mesorectum_explain")
     
     # ========== TUMOR SECTION ==========
-    st.markdown('<div class="section-header"><h2>🎯 TUMOR</h2></div>', unsafe_allow_html=True)
-    
-    # Tumor Site
-    st.markdown('<div class="subsection"><h4>Tumor Site (select all that apply)</h4></div>', unsafe_allow_html=True)
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        cecum = st.checkbox("Cecum", key="site_cecum")
-        if cecum:
-            cecum_detail = st.text_input("Cecum details:", key="cecum_detail")
-        
-        ileocecal = st.checkbox("Ileocecal valve", key="site_ileocecal")
-        if ileocecal:
-            ileocecal_detail = st.text_input("Ileocecal valve details:", key="ileocecal_detail")
-        
-        ascending = st.checkbox("Ascending colon", key="site_ascending")
-        if ascending:
-            ascending_detail = st.text_input("Ascending colon details:", key="ascending_detail")
-        
-        hepatic = st.checkbox("Hepatic flexure", key="site_hepatic")
-        if hepatic:
-            hepatic_detail = st.text_input("Hepatic flexure details:", key="hepatic_detail")
-        
-        transverse = st.checkbox("Transverse colon", key="site_transverse")
-        if transverse:
-            transverse_detail = st.text_input("Transverse colon details:", key="transverse_detail")
-    
-    with col2:
-        splenic = st.checkbox("Splenic flexure", key="site_splenic")
-        if splenic:
-            splenic_detail = st.text_input("Splenic flexure details:", key="splenic_detail")
-        
-        descending = st.checkbox("Descending colon", key="site_descending")
-        if descending:
-            descending_detail = st.text_input("Descending colon details:", key="descending_detail")
-        
-        sigmoid = st.checkbox("Sigmoid colon", key="site_sigmoid")
-        if sigmoid:
-            sigmoid_detail = st.text_input("Sigmoid colon details:", key="sigmoid_detail")
+    st.markdown('<div class="section-header" id="tumor"><h2>🎯 TUMOR</h2></div>', unsafe_allow_html=True)
+    inline_warnings("colon", "tumor")
+    
+    with batch_section("Tumor", key="tumor_form"):
+        # Tumor Site
+        st.markdown('<div class="subsection"><h4>Tumor Site (select all that apply)</h4></div>', unsafe_allow_html=True)
+        reveal_group([
+            ("site_cecum", "Cecum", "cecum_detail", "Cecum details:"),
+            ("site_ileocecal", "Ileocecal valve", "ileocecal_detail", "Ileocecal valve details:"),
+            ("site_ascending", "Ascending colon", "ascending_detail", "Ascending colon details:"),
+            ("site_hepatic", "Hepatic flexure", "hepatic_detail", "Hepatic flexure details:"),
+            ("site_transverse", "Transverse colon", "transverse_detail", "Transverse colon details:"),
+            ("site_splenic", "Splenic flexure", "splenic_detail", "Splenic flexure details:"),
+            ("site_descending", "Descending colon", "descending_detail", "Descending colon details:"),
+            ("site_sigmoid", "Sigmoid colon", "sigmoid_detail", "Sigmoid colon details:"),
+            ("site_rectosigmoid", "Rectosigmoid", "rectosigmoid_detail", "Rectosigmoid details:"),
+            ("site_rectum", "Rectum", "rectum_detail", "Rectum details:"),
+            ("site_colon_nos", "Colon, NOS", "colon_nos_detail", "Colon NOS details:"),
+            ("site_cannot_determine", "Cannot be determined", "site_explain", "Explain:")
+        ], key="site_group", columns=2)
+        
+        # Rectal Tumor Location
+        st.markdown('<div class="subsection"><h4>Rectal Tumor Location (required for rectal primaries only)</h4></div>', unsafe_allow_html=True)
+        rectal_location_options = [
+            "Not applicable",
+            "Entirely above anterior peritoneal reflection",
+            "Entirely below anterior peritoneal reflection", 
+            "Straddles anterior peritoneal reflection",
+            "Not specified"
+        ]
+        rectal_location = st.selectbox("Rectal tumor location:", [""] + rectal_location_options, key="rectal_location")
+        
+        # Histologic Type
+        st.markdown('<div class="subsection"><h4>Histologic Type</h4></div>', unsafe_allow_html=True)
+        histologic_options = [
+            "Adenocarcinoma",
+            "Mucinous adenocarcinoma",
+            "Poorly cohesive carcinoma",
+            "Signet-ring cell carcinoma",
+            "Medullary carcinoma",
+            "Serrated adenocarcinoma",
+            "Micropapillary adenocarcinoma",
+            "Adenoma-like adenocarcinoma",
+            "Adenosquamous carcinoma",
+            "Undifferentiated carcinoma, NOS",
+            "Carcinoma with sarcomatoid component",
+            "Large cell neuroendocrine carcinoma",
+            "Small cell neuroendocrine carcinoma",
+            "Mixed neuroendocrine-non-neuroendocrine neoplasm (MiNEN)",
+            "Other histologic type not listed",
+            "Carcinoma, type cannot be determined"
+        ]
+        histologic_type = st.selectbox("Histologic type:", [""] + histologic_options, key="histologic_type")
+        
+        if histologic_type == "Mixed neuroendocrine-non-neuroendocrine neoplasm (MiNEN)" or batch:
+            minen_components = st.text_input("Specify components:", key="minen_components")
+        if histologic_type == "Other histologic type not listed" or batch:
+            histologic_other = st.text_input("Specify other type:", key="histologic_other")
+        if histologic_type == "Carcinoma, type cannot be determined" or batch:
+            histologic_cannot = st.text_input("Explain:", key="histologic_cannot")
+        
+        histologic_comment = st.text_area("Histologic Type Comment:", key="histologic_comment")
+        
+        # Histologic Grade
+        st.markdown('<div class="subsection"><h4>Histologic Grade</h4></div>', unsafe_allow_html=True)
+        grade_options = [
+            "G1, well-differentiated",
+            "G2, moderately differentiated",
+            "G3, poorly differentiated",
+            "G4, undifferentiated",
+            "Other",
+            "GX, cannot be assessed",
+            "Not applicable"
+        ]
+        grade = st.selectbox("Histologic grade:", [""] + grade_options, key="grade")
+        if grade == "Other" or batch:
+            grade_other = st.text_input("Specify other grade:", key="grade_other")
+        if grade == "GX, cannot be assessed" or batch:
+            grade_cannot = st.text_input("Explain:", key="grade_cannot")
         
-        rectosigmoid = st.checkbox("Rectosigmoid", key="site_rectosigmoid")
-        if rectosigmoid:
-            rectosigmoid_detail = st.text_input("Rectosigmoid details:", key="rectosigmoid_detail")
+        # Tumor Size
+        st.markdown('<div class="subsection"><h4>Tumor Size</h4></div>', unsafe_allow_html=True)
+        size_method = st.radio(
+            "Size measurement:",
+            ["Greatest dimension in cm", "Cannot be determined"],
+            key="size_method"
+        )
         
-        rectum = st.checkbox("Rectum", key="site_rectum")
-        if rectum:
-            rectum_detail = st.text_input("Rectum details:", key="rectum_detail")
-    
-    colon_nos = st.checkbox("Colon, NOS", key="site_colon_nos")
-    if colon_nos:
-        colon_nos_detail = st.text_input("Colon NOS details:", key="colon_nos_detail")
-    
-    cannot_determine_site = st.checkbox("Cannot be determined", key="site_cannot_determine")
-    if cannot_determine_site:
-        site_explain = st.text_input("Explain:", key="site_explain")
-    
-    # Rectal Tumor Location
-    st.markdown('<div class="subsection"><h4>Rectal Tumor Location (required for rectal primaries only)</h4></div>', unsafe_allow_html=True)
-    rectal_location_options = [
-        "Not applicable",
-        "Entirely above anterior peritoneal reflection",
-        "Entirely below anterior peritoneal reflection", 
-        "Straddles anterior peritoneal reflection",
-        "Not specified"
-    ]
-    rectal_location = st.selectbox("Rectal tumor location:", [""] + rectal_location_options, key="rectal_location")
-    
-    # Histologic Type
-    st.markdown('<div class="subsection"><h4>Histologic Type</h4></div>', unsafe_allow_html=True)
-    histologic_options = [
-        "Adenocarcinoma",
-        "Mucinous adenocarcinoma",
-        "Poorly cohesive carcinoma",
-        "Signet-ring cell carcinoma",
-        "Medullary carcinoma",
-        "Serrated adenocarcinoma",
-        "Micropapillary adenocarcinoma",
-        "Adenoma-like adenocarcinoma",
-        "Adenosquamous carcinoma",
-        "Undifferentiated carcinoma, NOS",
-        "Carcinoma with sarcomatoid component",
-        "Large cell neuroendocrine carcinoma",
-        "Small cell neuroendocrine carcinoma",
-        "Mixed neuroendocrine-non-neuroendocrine neoplasm (MiNEN)",
-        "Other histologic type not listed",
-        "Carcinoma, type cannot be determined"
-    ]
-    histologic_type = st.selectbox("Histologic type:", [""] + histologic_options, key="histologic_type")
-    
-    if histologic_type == "Mixed neuroendocrine-non-neuroendocrine neoplasm (MiNEN)":
-        minen_components = st.text_input("Specify components:", key="minen_components")
-    elif histologic_type == "Other histologic type not listed":
-        histologic_other = st.text_input("Specify other type:", key="histologic_other")
-    elif histologic_type == "Carcinoma, type cannot be determined":
-        histologic_cannot = st.text_input("Explain:", key="histologic_cannot")
-    
-    histologic_comment = st.text_area("Histologic Type Comment:", key="histologic_comment")
-    
-    # Histologic Grade
-    st.markdown('<div class="subsection"><h4>Histologic Grade</h4></div>', unsafe_allow_html=True)
-    grade_options = [
-        "G1, well-differentiated",
-        "G2, moderately differentiated",
-        "G3, poorly differentiated",
-        "G4, undifferentiated",
-        "Other",
-        "GX, cannot be assessed",
-        "Not applicable"
-    ]
-    grade = st.selectbox("Histologic grade:", [""] + grade_options, key="grade")
-    if grade == "Other":
-        grade_other = st.text_input("Specify other grade:", key="grade_other")
-    elif grade == "GX, cannot be assessed":
-        grade_cannot = st.text_input("Explain:", key="grade_cannot")
-    
-    # Tumor Size
-    st.markdown('<div class="subsection"><h4>Tumor Size</h4></div>', unsafe_allow_html=True)
-    size_method = st.radio(
-        "Size measurement:",
-        ["Greatest dimension in cm", "Cannot be determined"],
-        key="size_method"
-    )
-    
-    if size_method == "Greatest dimension in cm":
-        size_cm = st.number_input("Size (cm):", min_value=0.0, step=0.1, key="size_cm")
+        if size_method == "Greatest dimension in cm" or batch:
+            size_cm = st.number_input("Size (cm):", min_value=0.0, step=0.1, key="size_cm")
+            
+            additional_dims = st.checkbox("Additional dimensions", key="additional_dims")
+            if additional_dims or batch:
+                col1, col2 = st.columns(2)
+                with col1:
+                    size_x = st.number_input("Width (cm):", min_value=0.0, step=0.1, key="size_x")
+                with col2:
+                    size_y = st.number_input("Height (cm):", min_value=0.0, step=0.1, key="size_y")
+        if size_method == "Cannot be determined" or batch:
+            size_explain = st.text_input("Explain why size cannot be determined:", key="size_explain")
+        
+        # Multiple Primary Sites
+        st.markdown('<div class="subsection"><h4>Multiple Primary Sites</h4></div>', unsafe_allow_html=True)
+        multiple_primary = st.radio(
+            "Multiple primary sites:",
+            ["Not applicable", "Present"],
+            key="multiple_primary"
+        )
+        if multiple_primary == "Present" or batch:
+            multiple_details = st.text_area("Describe multiple primary sites:", key="multiple_details")
+            st.info("Please complete a separate checklist for each primary site")
+        
+        # Tumor Extent
+        st.markdown('<div class="subsection"><h4>Tumor Extent</h4></div>', unsafe_allow_html=True)
+        extent_options = [
+            "No invasion (high-grade dysplasia)",
+            "Invades lamina propria / muscularis mucosae (intramucosal carcinoma)",
+            "Invades submucosa",
+            "Invades into muscularis propria",
+            "Invades through muscularis propria into the pericolic or perirectal tissue",
+            "Invades visceral peritoneum",
+            "Directly invades or adheres to adjacent structure(s)",
+            "Cannot be determined",
+            "No evidence of primary tumor"
+        ]
+        tumor_extent = st.selectbox("Tumor extent:", [""] + extent_options, key="tumor_extent")
+        
+        if tumor_extent == "Directly invades or adheres to adjacent structure(s)" or batch:
+            adjacent_structures = st.text_input("Specify adjacent structures:", key="adjacent_structures")
+        if tumor_extent == "Cannot be determined" or batch:
+            extent_explain = st.text_input("Explain:", key="extent_explain")
+        
+        # Sub-mucosal Invasion (for pT1 tumors)
+        st.markdown('<div class="subsection"><h4>Sub-mucosal Invasion (required only for pT1 tumors)</h4></div>', unsafe_allow_html=True)
+        submucosal_applicable = st.radio(
+            "Sub-mucosal invasion:",
+            ["Not applicable (not a pT1 tumor)", "Not identified", "Present"],
+            key="submucosal_applicable"
+        )
         
-        additional_dims = st.checkbox("Additional dimensions", key="additional_dims")
-        if additional_dims:
+        if submucosal_applicable == "Present" or batch:
             col1, col2 = st.columns(2)
-            with col1:
-                size_x = st.number_input("Width (cm):", min_value=0.0, step=0.1, key="size_x")
-            with col2:
-                size_y = st.number_input("Height (cm):", min_value=0.0, step=0.1, key="size_y")
-    else:
-        size_explain = st.text_input("Explain why size cannot be determined:", key="size_explain")
-    
-    # Multiple Primary Sites
-    st.markdown('<div class="subsection"><h4>Multiple Primary Sites</h4></div>', unsafe_allow_html=True)
-    multiple_primary = st.radio(
-        "Multiple primary sites:",
-        ["Not applicable", "Present"],
-        key="multiple_primary"
-    )
-    if multiple_primary == "Present":
-        multiple_details = st.text_area("Describe multiple primary sites:", key="multiple_details")
-        st.info("Please complete a separate checklist for each primary site")
-    
-    # Tumor Extent
-    st.markdown('<div class="subsection"><h4>Tumor Extent</h4></div>', unsafe_allow_html=True)
-    extent_options = [
-        "No invasion (high-grade dysplasia)",
-        "Invades lamina propria / muscularis mucosae (intramucosal carcinoma)",
-        "Invades submucosa",
-        "Invades into muscularis propria",
-        "Invades through muscularis propria into the pericolic or perirectal tissue",
-        "Invades visceral peritoneum",
-        "Directly invades or adheres to adjacent structure(s)",
-        "Cannot be determined",
-        "No evidence of primary tumor"
-    ]
-    tumor_extent = st.selectbox("Tumor extent:", [""] + extent_options, key="tumor_extent")
-    
-    if tumor_extent == "Directly invades or adheres to adjacent structure(s)":
-        adjacent_structures = st.text_input("Specify adjacent structures:", key="adjacent_structures")
-    elif tumor_extent == "Cannot be determined":
-        extent_explain = st.text_input("Explain:", key="extent_explain")
-    
-    # Sub-mucosal Invasion (for pT1 tumors)
-    st.markdown('<div class="subsection"><h4>Sub-mucosal Invasion (required only for pT1 tumors)</h4></div>', unsafe_allow_html=True)
-    submucosal_applicable = st.radio(
-        "Sub-mucosal invasion:",
-        ["Not applicable (not a pT1 tumor)", "Not identified", "Present"],
-        key="submucosal_applicable"
-    )
-    
-    if submucosal_applicable == "Present":
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            st.write("**Depth of Sub-mucosal Invasion:**")
-            depth_options = [
-                "Less than 1 mm",
-                "Greater than or equal to 1 mm and less than 2 mm",
-                "Greater than 2 mm", 
-                "Exact depth in mm",
-                "Cannot be determined"
-            ]
-            depth = st.selectbox("Depth:", [""] + depth_options, key="submucosal_depth")
             
-            if depth == "Exact depth in mm":
-                depth_mm = st.number_input("Depth (mm):", min_value=0.0, step=0.1, key="depth_mm")
-            elif depth == "Cannot be determined":
-                depth_explain = st.text_input("Explain:", key="depth_explain")
-        
-        with col2:
-            st.write("**Extent of Sub-mucosal Invasion:**")
-            extent_sub_options = [
-                "Tumor invades into upper one third of submucosa",
-                "Tumor invades into middle one third of submucosa",
-                "Tumor invades into lower one third of submucosa",
-                "Cannot be determined"
-            ]
-            extent_sub = st.selectbox("Extent:", [""] + extent_sub_options, key="submucosal_extent")
+            with col1:
+                st.write("**Depth of Sub-mucosal Invasion:**")
+                depth_options = [
+                    "Less than 1 mm",
+                    "Greater than or equal to 1 mm and less than 2 mm",
+                    "Greater than 2 mm", 
+                    "Exact depth in mm",
+                    "Cannot be determined"
+                ]
+                depth = st.selectbox("Depth:", [""] + depth_options, key="submucosal_depth")
+                
+                if depth == "Exact depth in mm" or batch:
+                    depth_mm = st.number_input("Depth (mm):", min_value=0.0, step=0.1, key="depth_mm")
+                if depth == "Cannot be determined" or batch:
+                    depth_explain = st.text_input("Explain:", key="depth_explain")
             
-            if extent_sub == "Cannot be determined":
-                extent_sub_explain = st.text_input("Explain:", key="extent_sub_explain")
-    
-    # Macroscopic Tumor Perforation
-    st.markdown('<div class="subsection"><h4>Macroscopic Tumor Perforation</h4></div>', unsafe_allow_html=True)
-    perforation_options = ["Not identified", "Present", "Cannot be determined"]
-    perforation = st.selectbox("Macroscopic Tumor Perforation:", [""] + perforation_options, key="perforation")
-    if perforation == "Cannot be determined":
-        perforation_explain = st.text_input("Explain:", key="perforation_explain")
-    
-    # Lymphatic and/or Vascular Invasion
-    st.markdown('<div class="subsection"><h4>Lymphatic and/or Vascular Invasion (select all that apply)</h4></div>', unsafe_allow_html=True)
-    lvi_not_identified = st.checkbox("Not identified", key="lvi_not_identified")
-    
-    lvi_small = st.checkbox("Small vessel", key="lvi_small")
-    if lvi_small:
-        lvi_small_detail = st.text_input("Small vessel details:", key="lvi_small_detail")
-    
-    lvi_large_intramural = st.checkbox("Large vessel (venous), intramural", key="lvi_large_intramural")
-    if lvi_large_intramural:
-        lvi_large_intramural_detail = st.text_input("Large vessel intramural details:", key="lvi_large_intramural_detail")
-    
-    lvi_large_extramural = st.checkbox("Large vessel (venous), extramural", key="lvi_large_extramural")
-    if lvi_large_extramural:
-        lvi_large_extramural_detail = st.text_input("Large vessel extramural details:", key="lvi_large_extramural_detail")
-    
-    lvi_present_nos = st.checkbox("Present, NOS", key="lvi_present_nos")
-    if lvi_present_nos:
-        lvi_nos_detail = st.text_input("Present NOS details:", key="lvi_nos_detail")
-    
-    lvi_cannot_determine = st.checkbox("Cannot be determined", key="lvi_cannot_determine")
-    if lvi_cannot_determine:
-        lvi_cannot_explain = st.text_input("Cannot be determined - explain:", key="lvi_cannot_explain")
-    
-    # Perineural Invasion
-    st.markdown('<div class="subsection"><h4>Perineural Invasion</h4></div>', unsafe_allow_html=True)
-    pni_options = ["Not identified", "Present", "Cannot be determined"]
-    pni = st.selectbox("Perineural Invasion:", [""] + pni_options, key="pni")
-    if pni == "Cannot be determined":
-        pni_explain = st.text_input("Explain:", key="pni_explain")
-    
-    # Tumor Budding Score
-    st.markdown('<div class="subsection"><h4>Tumor Budding Score (required only when applicable)</h4></div>', unsafe_allow_html=True)
-    budding_options = ["Not applicable", "Low (0-4)", "Intermediate (5-9)", "High (10 or more)", "Cannot be determined"]
-    budding = st.selectbox("Tumor budding score:", [""] + budding_options, key="budding")
-    
-    if budding == "Cannot be determined":
-        budding_explain = st.text_input("Explain:", key="budding_explain")
-    
-    # Number of Tumor Buds
-    st.write("**Number of Tumor Buds (per 'hotspot' field):**")
-    buds_method = st.radio(
-        "Number of tumor buds per 'hotspot' field:",
-        ["Specify number", "Other", "Cannot be determined"],
-        key="buds_method"
-    )
-    
-    if buds_method == "Specify number":
-        buds_number = st.number_input("Number in one 'hotspot' field (area = 0.785 mm²):", min_value=0, key="buds_number")
-    elif buds_method == "Other":
-        buds_other = st.text_input("Specify other:", key="buds_other")
-    elif buds_method == "Cannot be determined":
-        buds_explain = st.text_input("Explain:", key="buds_explain")
-    
-    # Type of Polyp
-    st.markdown('<div class="subsection"><h4>Type of Polyp in which Invasive Carcinoma Arose</h4></div>', unsafe_allow_html=True)
-    polyp_options = [
-        "None identified",
-        "Tubular adenoma",
-        "Villous adenoma",
-        "Tubulovillous adenoma",
-        "Traditional serrated adenoma",
-        "Sessile serrated adenoma / sessile serrated polyp",
-        "Hamartomatous polyp",
-        "Other"
-    ]
-    polyp_type = st.selectbox("Polyp type:", [""] + polyp_options, key="polyp_type")
-    if polyp_type == "Other":
-        polyp_other = st.text_input("Specify other polyp type:", key="polyp_other")
-    
-    # Treatment Effect
-    st.markdown('<div class="subsection"><h4>Treatment Effect</h4></div>', unsafe_allow_html=True)
-    treatment_options = [
-        "No known presurgical therapy",
-        "Present, with no viable cancer cells (complete response, score 0)",
-        "Present, with single cells or rare small groups of cancer cells (near complete response, score 1)",
-        "Present, with residual cancer showing evident tumor regression, but more than single cells or rare small groups of cancer cells (partial response, score 2)",
-        "Present, NOS",
-        "Absent, with extensive residual cancer and no evident tumor regression (poor or no response, score 3)",
-        "Cannot be determined"
-    ]
-    treatment_effect = st.selectbox("Treatment effect:", [""] + treatment_options, key="treatment_effect")
-    if treatment_effect == "Cannot be determined":
-        treatment_explain = st.text_input("Explain:", key="treatment_explain")
-    
-    # Tumor Comment
-    tumor_comment = st.text_area("Tumor Comment:", key="tumor_comment")
+            with col2:
+                st.write("**Extent of Sub-mucosal Invasion:**")
+                extent_sub_options = [
+                    "Tumor invades into upper one third of submucosa",
+                    "Tumor invades into middle one third of submucosa",
+                    "Tumor invades into lower one third of submucosa",
+                    "Cannot be determined"
+                ]
+                extent_sub = st.selectbox("Extent:", [""] + extent_sub_options, key="submucosal_extent")
+                
+                if extent_sub == "Cannot be determined" or batch:
+                    extent_sub_explain = st.text_input("Explain:", key="extent_sub_explain")
+        
+        # Macroscopic Tumor Perforation
+        st.markdown('<div class="subsection"><h4>Macroscopic Tumor Perforation</h4></div>', unsafe_allow_html=True)
+        perforation_options = ["Not identified", "Present", "Cannot be determined"]
+        perforation = st.selectbox("Macroscopic Tumor Perforation:", [""] + perforation_options, key="perforation")
+        if perforation == "Cannot be determined" or batch:
+            perforation_explain = st.text_input("Explain:", key="perforation_explain")
+        
+        # Lymphatic and/or Vascular Invasion
+        st.markdown('<div class="subsection"><h4>Lymphatic and/or Vascular Invasion (select all that apply)</h4></div>', unsafe_allow_html=True)
+        reveal_group([
+            ("lvi_not_identified", "Not identified"),
+            ("lvi_small", "Small vessel", "lvi_small_detail", "Small vessel details:"),
+            ("lvi_large_intramural", "Large vessel (venous), intramural", "lvi_large_intramural_detail", "Large vessel intramural details:"),
+            ("lvi_large_extramural", "Large vessel (venous), extramural", "lvi_large_extramural_detail", "Large vessel extramural details:"),
+            ("lvi_present_nos", "Present, NOS", "lvi_nos_detail", "Present NOS details:"),
+            ("lvi_cannot_determine", "Cannot be determined", "lvi_cannot_explain", "Cannot be determined - explain:")
+        ], key="lvi_group")
+        
+        # Perineural Invasion
+        st.markdown('<div class="subsection"><h4>Perineural Invasion</h4></div>', unsafe_allow_html=True)
+        pni_options = ["Not identified", "Present", "Cannot be determined"]
+        pni = st.selectbox("Perineural Invasion:", [""] + pni_options, key="pni")
+        if pni == "Cannot be determined" or batch:
+            pni_explain = st.text_input("Explain:", key="pni_explain")
+        
+        # Tumor Budding Score
+        st.markdown('<div class="subsection"><h4>Tumor Budding Score (required only when applicable)</h4></div>', unsafe_allow_html=True)
+        budding_options = ["Not applicable", "Low (0-4)", "Intermediate (5-9)", "High (10 or more)", "Cannot be determined"]
+        budding = st.selectbox("Tumor budding score:", [""] + budding_options, key="budding")
+        
+        if budding == "Cannot be determined" or batch:
+            budding_explain = st.text_input("Explain:", key="budding_explain")
+        
+        # Number of Tumor Buds
+        st.write("**Number of Tumor Buds (per 'hotspot' field):**")
+        buds_method = st.radio(
+            "Number of tumor buds per 'hotspot' field:",
+            ["Specify number", "Other", "Cannot be determined"],
+            key="buds_method"
+        )
+        
+        if buds_method == "Specify number" or batch:
+            buds_number = st.number_input("Number in one 'hotspot' field (area = 0.785 mm²):", min_value=0, key="buds_number")
+        if buds_method == "Other" or batch:
+            buds_other = st.text_input("Specify other:", key="buds_other")
+        if buds_method == "Cannot be determined" or batch:
+            buds_explain = st.text_input("Explain:", key="buds_explain")
+        
+        # Type of Polyp
+        st.markdown('<div class="subsection"><h4>Type of Polyp in which Invasive Carcinoma Arose</h4></div>', unsafe_allow_html=True)
+        polyp_options = [
+            "None identified",
+            "Tubular adenoma",
+            "Villous adenoma",
+            "Tubulovillous adenoma",
+            "Traditional serrated adenoma",
+            "Sessile serrated adenoma / sessile serrated polyp",
+            "Hamartomatous polyp",
+            "Other"
+        ]
+        polyp_type = st.selectbox("Polyp type:", [""] + polyp_options, key="polyp_type")
+        if polyp_type == "Other" or batch:
+            polyp_other = st.text_input("Specify other polyp type:", key="polyp_other")
+        
+        # Treatment Effect
+        st.markdown('<div class="subsection"><h4>Treatment Effect</h4></div>', unsafe_allow_html=True)
+        treatment_options = [
+            "No known presurgical therapy",
+            "Present, with no viable cancer cells (complete response, score 0)",
+            "Present, with single cells or rare small groups of cancer cells (near complete response, score 1)",
+            "Present, with residual cancer showing evident tumor regression, but more than single cells or rare small groups of cancer cells (partial response, score 2)",
+            "Present, NOS",
+            "Absent, with extensive residual cancer and no evident tumor regression (poor or no response, score 3)",
+            "Cannot be determined"
+        ]
+        treatment_effect = st.selectbox("Treatment effect:", [""] + treatment_options, key="treatment_effect")
+        if treatment_effect == "Cannot be determined" or batch:
+            treatment_explain = st.text_input("Explain:", key="treatment_explain")
+        
+        # Tumor Comment
+        tumor_comment = st.text_area("Tumor Comment:", key="tumor_comment")
     
     # ========== MARGINS SECTION ==========
-    st.markdown('<div class="section-header"><h2>📏 MARGINS</h2></div>', unsafe_allow_html=True)
+    st.markdown('<div class="section-header" id="margins"><h2>📏 MARGINS</h2></div>', unsafe_allow_html=True)
     
     # Margin Status for Invasive Carcinoma
     st.markdown('<div class="subsection"><h4>Margin Status for Invasive Carcinoma</h4></div>', unsafe_allow_html=True)
@@ -414,56 +401,12 @@ def main():
     )
     
     if margin_status == "All margins negative for invasive carcinoma":
-        st.write("**Closest Margin(s) to Invasive Carcinoma (select all that apply):**")
+        st.write("**Distance from Invasive Carcinoma to Each Margin** (the closest margin(s) follow from the distances):")
+        margin_distance_table("colon")
         
-        col1, col2 = st.columns(2)
-        with col1:
-            proximal_closest = st.checkbox("Proximal", key="proximal_closest")
-            if proximal_closest:
-                proximal_detail = st.text_input("Proximal details:", key="proximal_detail")
-            
-            distal_closest = st.checkbox("Distal", key="distal_closest")
-            if distal_closest:
-                distal_detail = st.text_input("Distal details:", key="distal_detail")
-            
-            radial_closest = st.checkbox("Radial (circumferential)", key="radial_closest")
-            if radial_closest:
-                radial_detail = st.text_input("Radial details:", key="radial_detail")
-        
-        with col2:
-            mesenteric_closest = st.checkbox("Mesenteric", key="mesenteric_closest")
-            if mesenteric_closest:
-                mesenteric_detail = st.text_input("Mesenteric details:", key="mesenteric_detail")
-            
-            deep_closest = st.checkbox("Deep", key="deep_closest")
-            if deep_closest:
-                deep_detail = st.text_input("Deep details:", key="deep_detail")
-            
-            mucosal_closest = st.checkbox("Mucosal", key="mucosal_closest")
-            if mucosal_closest:
-                mucosal_detail = st.text_input("Mucosal location:", key="mucosal_detail")
-        
-        # Distance from Invasive Carcinoma to Closest Margin
-        st.write("**Distance from Invasive Carcinoma to Closest Margin:**")
+        distance_method = closest_distance_method("colon")
         
-        distance_method = st.radio(
-            "Distance measurement:",
-            [
-                "Exact distance in cm",
-                "Greater than 1 cm",
-                "Exact distance in mm",
-                "Greater than 10 mm", 
-                "Other",
-                "Cannot be determined"
-            ],
-            key="distance_method"
-        )
-        
-        if distance_method == "Exact distance in cm":
-            distance_cm = st.number_input("Distance (cm):", min_value=0.0, step=0.1, key="distance_cm")
-        elif distance_method == "Exact distance in mm":
-            distance_mm = st.number_input("Distance (mm):", min_value=0.0, step=0.1, key="distance_mm")
-        elif distance_method == "Other":
+        if distance_method == "Other":
             distance_other = st.text_input("Specify other:", key="distance_other")
         elif distance_method == "Cannot be determined":
             distance_explain = st.text_input("Explain:", key="distance_explain")
@@ -471,32 +414,14 @@ def main():
     elif margin_status == "Invasive carcinoma present at margin":
         st.write("**Margin(s) Involved by Invasive Carcinoma (select all that apply):**")
         
-        col1, col2 = st.columns(2)
-        with col1:
-            proximal_involved = st.checkbox("Proximal", key="proximal_involved")
-            if proximal_involved:
-                proximal_involved_detail = st.text_input("Proximal involved details:", key="proximal_involved_detail")
-            
-            distal_involved = st.checkbox("Distal", key="distal_involved")
-            if distal_involved:
-                distal_involved_detail = st.text_input("Distal involved details:", key="distal_involved_detail")
-            
-            radial_involved = st.checkbox("Radial (circumferential)", key="radial_involved")
-            if radial_involved:
-                radial_involved_detail = st.text_input("Radial involved details:", key="radial_involved_detail")
-        
-        with col2:
-            mesenteric_involved = st.checkbox("Mesenteric", key="mesenteric_involved")
-            if mesenteric_involved:
-                mesenteric_involved_detail = st.text_input("Mesenteric involved details:", key="mesenteric_involved_detail")
-            
-            deep_involved = st.checkbox("Deep", key="deep_involved")
-            if deep_involved:
-                deep_involved_detail = st.text_input("Deep involved details:", key="deep_involved_detail")
-            
-            mucosal_involved = st.checkbox("Mucosal", key="mucosal_involved")
-            if mucosal_involved:
-                mucosal_involved_detail = st.text_input("Mucosal involved location:", key="mucosal_involved_detail")
+        reveal_group([
+            ("proximal_involved", "Proximal", "proximal_involved_detail", "Proximal involved details:"),
+            ("distal_involved", "Distal", "distal_involved_detail", "Distal involved details:"),
+            ("radial_involved", "Radial (circumferential)", "radial_involved_detail", "Radial involved details:"),
+            ("mesenteric_involved", "Mesenteric", "mesenteric_involved_detail", "Mesenteric involved details:"),
+            ("deep_involved", "Deep", "deep_involved_detail", "Deep involved details:"),
+            ("mucosal_involved", "Mucosal", "mucosal_involved_detail", "Mucosal involved location:")
+        ], key="involved_margin_group", columns=2)
     
     elif margin_status == "Other":
         margin_other_detail = st.text_input("Specify other:", key="margin_other_detail")
@@ -521,47 +446,23 @@ def main():
     
     if non_invasive_status == "High-grade dysplasia / intramucosal carcinoma present at margin":
         st.write("**Margin(s) Involved by High-Grade Dysplasia / Intramucosal Carcinoma:**")
-        hgd_proximal = st.checkbox("Proximal", key="hgd_proximal")
-        if hgd_proximal:
-            hgd_proximal_detail = st.text_input("HGD Proximal details:", key="hgd_proximal_detail")
-        
-        hgd_distal = st.checkbox("Distal", key="hgd_distal")
-        if hgd_distal:
-            hgd_distal_detail = st.text_input("HGD Distal details:", key="hgd_distal_detail")
-        
-        hgd_mucosal = st.checkbox("Mucosal", key="hgd_mucosal")
-        if hgd_mucosal:
-            hgd_mucosal_detail = st.text_input("HGD Mucosal location:", key="hgd_mucosal_detail")
-        
-        hgd_other = st.checkbox("Other", key="hgd_other")
-        if hgd_other:
-            hgd_other_detail = st.text_input("HGD Other details:", key="hgd_other_detail")
-        
-        hgd_cannot = st.checkbox("Cannot be determined", key="hgd_cannot")
-        if hgd_cannot:
-            hgd_cannot_detail = st.text_input("HGD Cannot be determined details:", key="hgd_cannot_detail")
+        reveal_group([
+            ("hgd_proximal", "Proximal", "hgd_proximal_detail", "HGD Proximal details:"),
+            ("hgd_distal", "Distal", "hgd_distal_detail", "HGD Distal details:"),
+            ("hgd_mucosal", "Mucosal", "hgd_mucosal_detail", "HGD Mucosal location:"),
+            ("hgd_other", "Other", "hgd_other_detail", "HGD Other details:"),
+            ("hgd_cannot", "Cannot be determined", "hgd_cannot_detail", "HGD Cannot be determined details:")
+        ], key="hgd_margin_group")
     
     elif non_invasive_status == "Low-grade dysplasia present at margin":
         st.write("**Margin(s) Involved by Low-Grade Dysplasia:**")
-        lgd_proximal = st.checkbox("Proximal", key="lgd_proximal")
-        if lgd_proximal:
-            lgd_proximal_detail = st.text_input("LGD Proximal details:", key="lgd_proximal_detail")
-        
-        lgd_distal = st.checkbox("Distal", key="lgd_distal")
-        if lgd_distal:
-            lgd_distal_detail = st.text_input("LGD Distal details:", key="lgd_distal_detail")
-        
-        lgd_mucosal = st.checkbox("Mucosal", key="lgd_mucosal")
-        if lgd_mucosal:
-            lgd_mucosal_detail = st.text_input("LGD Mucosal location:", key="lgd_mucosal_detail")
-        
-        lgd_other = st.checkbox("Other", key="lgd_other")
-        if lgd_other:
-            lgd_other_detail = st.text_input("LGD Other details:", key="lgd_other_detail")
-        
-        lgd_cannot = st.checkbox("Cannot be determined", key="lgd_cannot")
-        if lgd_cannot:
-            lgd_cannot_detail = st.text_input("LGD Cannot be determined details:", key="lgd_cannot_detail")
+        reveal_group([
+            ("lgd_proximal", "Proximal", "lgd_proximal_detail", "LGD Proximal details:"),
+            ("lgd_distal", "Distal", "lgd_distal_detail", "LGD Distal details:"),
+            ("lgd_mucosal", "Mucosal", "lgd_mucosal_detail", "LGD Mucosal location:"),
+            ("lgd_other", "Other", "lgd_other_detail", "LGD Other details:"),
+            ("lgd_cannot", "Cannot be determined", "lgd_cannot_detail", "LGD Cannot be determined details:")
+        ], key="lgd_margin_group")
     
     elif non_invasive_status == "Other":
         non_invasive_other = st.text_input("Specify other:", key="non_invasive_other")
@@ -572,128 +473,122 @@ def main():
     margin_comment = st.text_area("Margin Comment:", key="margin_comment")
     
     # ========== REGIONAL LYMPH NODES SECTION ==========
-    st.markdown('<div class="section-header"><h2>🔗 REGIONAL LYMPH NODES</h2></div>', unsafe_allow_html=True)
-    
-    # Regional Lymph Node Status
-    st.markdown('<div class="subsection"><h4>Regional Lymph Node Status</h4></div>', unsafe_allow_html=True)
+    st.markdown('<div class="section-header" id="lymph_nodes"><h2>🔗 REGIONAL LYMPH NODES</h2></div>', unsafe_allow_html=True)
+    inline_warnings("colon", "lymph_nodes")
     
-    ln_status = st.radio(
-        "Regional lymph node status:",
-        [
-            "Not applicable (no regional lymph nodes submitted or found)",
-            "Regional lymph nodes present",
-            "Other",
-            "Cannot be determined"
-        ],
-        key="ln_status"
-    )
-    
-    if ln_status == "Regional lymph nodes present":
-        ln_tumor_status = st.radio(
-            "Tumor in lymph nodes:",
+    with batch_section("Regional Lymph Nodes", key="lymph_node_form"):
+        # Regional Lymph Node Status
+        st.markdown('<div class="subsection"><h4>Regional Lymph Node Status</h4></div>', unsafe_allow_html=True)
+        
+        ln_status = st.radio(
+            "Regional lymph node status:",
             [
-                "All regional lymph nodes negative for tumor",
-                "Tumor present in regional lymph node(s)"
+                "Not applicable (no regional lymph nodes submitted or found)",
+                "Regional lymph nodes present",
+                "Other",
+                "Cannot be determined"
             ],
-            key="ln_tumor_status"
+            key="ln_status"
         )
         
-        if ln_tumor_status == "Tumor present in regional lymph node(s)":
-            st.write("**Number of Lymph Nodes with Tumor:**")
+        if ln_status == "Regional lymph nodes present" or batch:
+            ln_tumor_status = st.radio(
+                "Tumor in lymph nodes:",
+                [
+                    "All regional lymph nodes negative for tumor",
+                    "Tumor present in regional lymph node(s)"
+                ],
+                key="ln_tumor_status"
+            )
+            
+            if ln_tumor_status == "Tumor present in regional lymph node(s)" or batch:
+                st.write("**Number of Lymph Nodes with Tumor:**")
+                
+                ln_positive_method = st.radio(
+                    "Number of positive nodes:",
+                    ["Exact number", "At least", "Other", "Cannot be determined"],
+                    key="ln_positive_method"
+                )
+                
+                if ln_positive_method == "Exact number" or batch:
+                    ln_positive_exact = st.number_input("Exact number of positive nodes:", min_value=0, key="ln_positive_exact")
+                if ln_positive_method == "At least" or batch:
+                    ln_positive_atleast = st.number_input("At least number of positive nodes:", min_value=0, key="ln_positive_atleast")
+                if ln_positive_method == "Other" or batch:
+                    ln_positive_other = st.text_input("Specify other:", key="ln_positive_other")
+                if ln_positive_method == "Cannot be determined" or batch:
+                    ln_positive_explain = st.text_input("Explain:", key="ln_positive_explain")
             
-            ln_positive_method = st.radio(
-                "Number of positive nodes:",
+            st.write("**Number of Lymph Nodes Examined:**")
+            
+            ln_examined_method = st.radio(
+                "Number of examined nodes:",
                 ["Exact number", "At least", "Other", "Cannot be determined"],
-                key="ln_positive_method"
+                key="ln_examined_method"
             )
             
-            if ln_positive_method == "Exact number":
-                ln_positive_exact = st.number_input("Exact number of positive nodes:", min_value=0, key="ln_positive_exact")
-            elif ln_positive_method == "At least":
-                ln_positive_atleast = st.number_input("At least number of positive nodes:", min_value=0, key="ln_positive_atleast")
-            elif ln_positive_method == "Other":
-                ln_positive_other = st.text_input("Specify other:", key="ln_positive_other")
-            elif ln_positive_method == "Cannot be determined":
-                ln_positive_explain = st.text_input("Explain:", key="ln_positive_explain")
-        
-        st.write("**Number of Lymph Nodes Examined:**")
-        
-        ln_examined_method = st.radio(
-            "Number of examined nodes:",
-            ["Exact number", "At least", "Other", "Cannot be determined"],
-            key="ln_examined_method"
+            if ln_examined_method == "Exact number" or batch:
+                ln_examined_exact = st.number_input("Exact number of examined nodes:", min_value=0, key="ln_examined_exact")
+            if ln_examined_method == "At least" or batch:
+                ln_examined_atleast = st.number_input("At least number of examined nodes:", min_value=0, key="ln_examined_atleast")
+            if ln_examined_method == "Other" or batch:
+                ln_examined_other = st.text_input("Specify other:", key="ln_examined_other")
+            if ln_examined_method == "Cannot be determined" or batch:
+                ln_examined_explain = st.text_input("Explain:", key="ln_examined_explain")
+        
+        if ln_status == "Other" or batch:
+            ln_other_detail = st.text_input("Specify other:", key="ln_other_detail")
+        if ln_status == "Cannot be determined" or batch:
+            ln_cannot_explain = st.text_input("Explain:", key="ln_cannot_explain")
+        
+        # Tumor Deposits
+        st.markdown('<div class="subsection"><h4>Tumor Deposits</h4></div>', unsafe_allow_html=True)
+        
+        tumor_deposits = st.radio(
+            "Tumor deposits:",
+            ["Not identified", "Present", "Cannot be determined"],
+            key="tumor_deposits"
         )
         
-        if ln_examined_method == "Exact number":
-            ln_examined_exact = st.number_input("Exact number of examined nodes:", min_value=0, key="ln_examined_exact")
-        elif ln_examined_method == "At least":
-            ln_examined_atleast = st.number_input("At least number of examined nodes:", min_value=0, key="ln_examined_atleast")
-        elif ln_examined_method == "Other":
-            ln_examined_other = st.text_input("Specify other:", key="ln_examined_other")
-        elif ln_examined_method == "Cannot be determined":
-            ln_examined_explain = st.text_input("Explain:", key="ln_examined_explain")
-    
-    elif ln_status == "Other":
-        ln_other_detail = st.text_input("Specify other:", key="ln_other_detail")
-    elif ln_status == "Cannot be determined":
-        ln_cannot_explain = st.text_input("Explain:", key="ln_cannot_explain")
-    
-    # Tumor Deposits
-    st.markdown('<div class="subsection"><h4>Tumor Deposits</h4></div>', unsafe_allow_html=True)
-    
-    tumor_deposits = st.radio(
-        "Tumor deposits:",
-        ["Not identified", "Present", "Cannot be determined"],
-        key="tumor_deposits"
-    )
-    
-    if tumor_deposits == "Present":
-        st.write("**Number of Tumor Deposits:**")
+        if tumor_deposits == "Present" or batch:
+            st.write("**Number of Tumor Deposits:**")
+            
+            deposits_method = st.radio(
+                "Number of deposits:",
+                ["Specify number", "Other", "Cannot be determined"],
+                key="deposits_method"
+            )
+            
+            if deposits_method == "Specify number" or batch:
+                deposits_number = st.number_input("Number of tumor deposits:", min_value=0, key="deposits_number")
+            if deposits_method == "Other" or batch:
+                deposits_other = st.text_input("Specify other:", key="deposits_other")
+            if deposits_method == "Cannot be determined" or batch:
+                deposits_explain = st.text_input("Explain:", key="deposits_explain")
         
-        deposits_method = st.radio(
-            "Number of deposits:",
-            ["Specify number", "Other", "Cannot be determined"],
-            key="deposits_method"
-        )
+        if tumor_deposits == "Cannot be determined" or batch:
+            deposits_cannot_explain = st.text_input("Explain:", key="deposits_cannot_explain")
         
-        if deposits_method == "Specify number":
-            deposits_number = st.number_input("Number of tumor deposits:", min_value=0, key="deposits_number")
-        elif deposits_method == "Other":
-            deposits_other = st.text_input("Specify other:", key="deposits_other")
-        elif deposits_method == "Cannot be determined":
-            deposits_explain = st.text_input("Explain:", key="deposits_explain")
-    
-    elif tumor_deposits == "Cannot be determined":
-        deposits_cannot_explain = st.text_input("Explain:", key="deposits_cannot_explain")
-    
-    # Regional Lymph Node Comment
-    ln_comment = st.text_area("Regional Lymph Node Comment:", key="ln_comment")
+        # Regional Lymph Node Comment
+        ln_comment = st.text_area("Regional Lymph Node Comment:", key="ln_comment")
     
     # ========== DISTANT METASTASIS SECTION ==========
     st.markdown('<div class="section-header"><h2>🎯 DISTANT METASTASIS</h2></div>', unsafe_allow_html=True)
+    inline_warnings("colon", "distant_metastasis")
     
     st.markdown('<div class="subsection"><h4>Distant Site(s) Involved, if applicable (select all that apply)</h4></div>', unsafe_allow_html=True)
     
-    dm_not_applicable = st.checkbox("Not applicable", key="dm_not_applicable")
-    
-    dm_non_regional_ln = st.checkbox("Non-regional lymph node(s)", key="dm_non_regional_ln")
-    if dm_non_regional_ln:
-        dm_non_regional_detail = st.text_input("Non-regional lymph node details:", key="dm_non_regional_detail")
-    
-    dm_liver = st.checkbox("Liver", key="dm_liver")
-    if dm_liver:
-        dm_liver_detail = st.text_input("Liver metastasis details:", key="dm_liver_detail")
-    
-    dm_other = st.checkbox("Other", key="dm_other")
-    if dm_other:
-        dm_other_detail = st.text_input("Specify other distant sites:", key="dm_other_detail")
-    
-    dm_cannot_determine = st.checkbox("Cannot be determined", key="dm_cannot_determine")
-    if dm_cannot_determine:
-        dm_cannot_detail = st.text_input("Cannot be determined details:", key="dm_cannot_detail")
+    reveal_group([
+        ("dm_not_applicable", "Not applicable"),
+        ("dm_non_regional_ln", "Non-regional lymph node(s)", "dm_non_regional_detail", "Non-regional lymph node details:"),
+        ("dm_liver", "Liver", "dm_liver_detail", "Liver metastasis details:"),
+        ("dm_other", "Other", "dm_other_detail", "Specify other distant sites:"),
+        ("dm_cannot_determine", "Cannot be determined", "dm_cannot_detail", "Cannot be determined details:")
+    ], key="dm_group")
     
     # ========== pTNM CLASSIFICATION SECTION ==========
-    st.markdown('<div class="section-header"><h2>📊 pTNM CLASSIFICATION (AJCC 8th Edition)</h2></div>', unsafe_allow_html=True)
+    st.markdown('<div class="section-header" id="ptnm"><h2>📊 pTNM CLASSIFICATION (AJCC 8th Edition)</h2></div>', unsafe_allow_html=True)
+    inline_warnings("colon", "ptnm")
     
     st.info("Reporting of pT, pN, and (when applicable) pM categories is based on information available to the pathologist at the time the report is issued. As per the AJCC (Chapter 1, 8th Ed.) it is the managing physician's responsibility to establish the final pathologic stage based upon all pertinent information, including but potentially not limited to this pathology report.")
     
@@ -748,6 +643,9 @@ def main():
     
     pn_category = st.selectbox("pN Category:", [""] + pn_options, key="pn_category")
     
+    # pT / pN suggested from the findings above, with disagreement flags
+    derivation_panel("colon", pt_options, pn_options)
+    
     # pM Category
     st.markdown('<div class="subsection"><h4>pM Category (required only if confirmed pathologically)</h4></div>', unsafe_allow_html=True)
     
@@ -761,6 +659,14 @@ def main():
     
     pm_category = st.selectbox("pM Category:", [""] + pm_options, key="pm_category")
     
+    # AJCC prognostic stage group from pT / pN / pM
+    stage = stage_group_for("colon", st.session_state)
+    if stage:
+        st.info(f"**AJCC Stage Group:** {stage}")
+
+    # Shorthand quick entry, resolved against the option lists above
+    quick_entry_bar("colon", pt_options, pn_options, pm_options, grade_options)
+    
     # ========== ADDITIONAL FINDINGS SECTION ==========
     st.markdown('<div class="section-header"><h2>🔍 ADDITIONAL FINDINGS</h2></div>', unsafe_allow_html=True)
     
@@ -794,9 +700,19 @@ def main():
     # ========== GENERATE REPORT SECTION ==========
     st.markdown("---")
     st.markdown("### 📋 Generate Final Report")
+    validation_summary("colon")
+    case_form_rendered("colon")
+    completeness_navigator("colon", navigator)
     
     # Large Generate Report Button
     if st.button("🔬 GENERATE COMPLETE PATHOLOGY REPORT", type="primary", use_container_width=True):
+        if not report_allowed("colon"):
+            st.error("❌ Report not generated: resolve or acknowledge the consistency issues above.")
+            st.stop()
+        missing = missing_required("colon")
+        if missing:
+            st.warning(f"⚠️ {len(missing)} required element(s) missing: {', '.join(element.label for element in missing)}")
+        
         st.success("✅ Complete pathology report generated successfully!")
         
         # Large Report Display Area
@@ -945,6 +861,9 @@ CASE SUMMARY (COLON AND RECTUM: Resection)
         if st.session_state.get('margin_status'):
             report_content += f"Margin Status for Invasive Carcinoma: {st.session_state.margin_status}\n"
         
+        if st.session_state.get('margin_status') == "All margins negative for invasive carcinoma":
+            report_content += margin_distance_lines("colon")
+        
         if st.session_state.get('non_invasive_status'):
             report_content += f"Margin Status for Non-Invasive Tumor: {st.session_state.non_invasive_status}\n"
         
@@ -997,6 +916,9 @@ CASE SUMMARY (COLON AND RECTUM: Resection)
             report_content += f"pN: {st.session_state.pn_category}\n"
         if st.session_state.get('pm_category'):
             report_content += f"pM: {st.session_state.pm_category}\n"
+        stage = stage_group_for("colon", st.session_state)
+        if stage:
+            report_content += f"Stage Group (AJCC 8th Edition): {stage}\n"
         
         # Add Additional Findings Section
         report_content += f"\nADDITIONAL FINDINGS\n"
@@ -1046,6 +968,8 @@ CASE SUMMARY (COLON AND RECTUM: Resection)
             mime="text/plain",
             use_container_width=True
         )
+        
+        sign_out_button("colon", report_content)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
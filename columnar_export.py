@@ -0,0 +1,308 @@
+import json
+import os
+import re
+import sys
+from collections import defaultdict
+from datetime import date, datetime
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from cases import DATE_KEYS
+from cohort_index import MAX_OPTIONS
+from storage import data_path
+from units import FINDING_INDEX, normalize_values
+
+# Analysis-ready export of signed-out cases: one Parquet dataset per organ
+# under exports/<organ>/, with the HCC nodules in a child table
+# exports/hcc_nodules/. Each run appends one part file holding the reports
+# signed out since the previous run; its name carries the first and last
+# reports.id it covers, which is also the watermark for the next run, so
+# history is never rewritten. An amended case appears again in a later part;
+# the row with the highest report_id is the current one.
+#
+# Columns besides report_id / case_id / signed_out_at / stage_group:
+# - checkboxes: bool (unchecked is False)
+# - selectbox / radio answers: dictionary<int16, string>, i.e. categorical
+#   codes with the option labels; free text (too many distinct answers): string
+# - findings of units.py in their canonical unit, suffixed _mm / _pct / _g;
+#   counts as int32; censored answers add <column>_censor (">", ">=", "<")
+# - other number inputs: float64; dates: date32
+# Kinds are decided per run, so a column can be categorical in one part and
+# string in another, or bool in one and a number in another; dataset() reads
+# such a column as string, or as the broadest number type.
+# Rows are read, converted and written CHUNK at a time, so memory stays
+# bounded whatever the number of cases.
+CHUNK = 5000
+
+UNIT_SUFFIXES = {"mm": "_mm", "%": "_pct", "g": "_g", "count": ""}
+# Identifying fields stay out of analytics exports
+EXCLUDED_KEYS = {"case_id", "patient_name"}
+# HCC documents up to 5 nodules with keys ending _0 ... _4
+NODULE_KEY = re.compile(r"^(.+)_([0-4])$")
+NODULES = "hcc_nodules"
+
+PART_NAME = re.compile(r"^part-(\d{10})-(\d{10})\.parquet$")
+
+
+def flatten(organ, fields):
+    # {column: value} of a case and {nodule: {column: value}} of its HCC nodules
+    finding_keys = FINDING_INDEX[organ]
+    nodule_count = int(fields.get("num_tumors") or 1) if organ == "hcc" else 0
+    case = {}
+    nodules = defaultdict(dict)
+
+    def put(name, value, suffix=""):
+        match = NODULE_KEY.match(name) if organ == "hcc" else None
+        if not match:
+            case[name + suffix] = value
+        elif int(match.group(2)) < nodule_count:
+            nodules[int(match.group(2))][match.group(1) + suffix] = value
+
+    for key, value in fields.items():
+        # Number inputs behind a finding are exported once, normalized
+        if key in EXCLUDED_KEYS or (key in finding_keys and not isinstance(value, (bool, str))):
+            continue
+        put(key, date.fromisoformat(value) if key in DATE_KEYS else value)
+    for name, measurement in normalize_values(organ, fields).items():
+        suffix = UNIT_SUFFIXES[measurement.unit]
+        value = measurement.value
+        if isinstance(value, list):
+            put(name, [float(v) for v in value], suffix)
+        else:
+            put(name, int(value) if measurement.unit == "count" else float(value), suffix)
+        if measurement.censor:
+            put(name, measurement.censor, suffix + "_censor")
+    return case, nodules
+
+
+def _kind(value):
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, date):
+        return "date"
+    if isinstance(value, list):
+        return "float_list"
+    return "string"
+
+
+# Checkbox / count / number answers of one key widen to the broader kind
+NUMERIC_KINDS = ("bool", "int", "float")
+
+
+def _merged_kind(seen, kind):
+    if seen == kind:
+        return seen
+    if seen in NUMERIC_KINDS and kind in NUMERIC_KINDS:
+        return max(seen, kind, key=NUMERIC_KINDS.index)
+    return "string"
+
+
+class _Layout:
+    # Column kinds (and option sets) seen in the rows of one export run
+    def __init__(self):
+        self.kinds = {}
+        self.options = defaultdict(set)
+
+    def observe(self, row):
+        for name, value in row.items():
+            kind = _kind(value)
+            self.kinds[name] = _merged_kind(self.kinds.get(name, kind), kind)
+            if kind == "string" and len(self.options[name]) <= MAX_OPTIONS:
+                self.options[name].add(value)
+
+    def schema(self, leading):
+        fields = list(leading)
+        names = {field.name for field in leading}
+        for name in sorted(set(self.kinds) - names):
+            kind = self.kinds[name]
+            if kind == "string" and len(self.options[name]) <= MAX_OPTIONS:
+                fields.append(pa.field(name, pa.dictionary(pa.int16(), pa.string())))
+            else:
+                fields.append(pa.field(name, {
+                    "bool": pa.bool_(), "int": pa.int32(), "float": pa.float64(), "date": pa.date32(),
+                    "float_list": pa.list_(pa.float64())
+                }.get(kind, pa.string())))
+        # Option lists fix each categorical column's codes for the whole part
+        self.dictionaries = {
+            field.name: sorted(self.options[field.name]) for field in fields if pa.types.is_dictionary(field.type)
+        }
+        return pa.schema(fields)
+
+    def table(self, schema, rows):
+        columns = []
+        for field in schema:
+            values = [row.get(field.name) for row in rows]
+            if field.name in self.dictionaries:
+                codes = {option: code for code, option in enumerate(self.dictionaries[field.name])}
+                columns.append(pa.DictionaryArray.from_arrays(
+                    pa.array([codes.get(value) for value in values], pa.int16()),
+                    pa.array(self.dictionaries[field.name], pa.string())
+                ))
+            elif field.type == pa.bool_():
+                columns.append(pa.array([bool(value) for value in values], pa.bool_()))
+            elif field.type == pa.string():
+                columns.append(pa.array([None if value is None else str(value) for value in values], pa.string()))
+            elif field.type in (pa.int32(), pa.float64()):
+                columns.append(pa.array([int(value) if isinstance(value, bool) else value for value in values], field.type))
+            else:
+                columns.append(pa.array(values, field.type))
+        return pa.Table.from_arrays(columns, schema=schema)
+
+
+CASE_COLUMNS = [
+    pa.field("report_id", pa.int64(), nullable=False), pa.field("case_id", pa.string(), nullable=False),
+    pa.field("signed_out_at", pa.timestamp("ms")), pa.field("stage_group", pa.dictionary(pa.int16(), pa.string()))
+]
+NODULE_COLUMNS = [
+    pa.field("report_id", pa.int64(), nullable=False), pa.field("case_id", pa.string(), nullable=False),
+    pa.field("nodule", pa.int8(), nullable=False)
+]
+
+
+def _directory(table):
+    return os.path.dirname(data_path("exports", table, "part"))
+
+
+def _parts(table):
+    # [(first id, last id, path)] of a table's part files, oldest first
+    directory = _directory(table)
+    parts = []
+    for name in os.listdir(directory):
+        match = PART_NAME.match(name)
+        if match:
+            parts.append((int(match.group(1)), int(match.group(2)), os.path.join(directory, name)))
+    return sorted(parts)
+
+
+def watermark(organ):
+    # Highest reports.id already exported for the organ
+    parts = _parts(organ)
+    return parts[-1][1] if parts else 0
+
+
+def _reports(connection, organ, after, last):
+    cursor = connection.execute(
+        "SELECT id, case_id, signed_out_at, stage, fields FROM reports WHERE organ = ? AND id > ? AND id <= ? ORDER BY id",
+        (organ, after, last)
+    )
+    while True:
+        rows = cursor.fetchmany(CHUNK)
+        if not rows:
+            return
+        yield rows
+
+
+def _write(table, schema, layout, first, last, chunks):
+    # Written under a temporary name and renamed, so a part is complete or absent
+    path = os.path.join(_directory(table), f"part-{first:010d}-{last:010d}.parquet")
+    with pq.ParquetWriter(path + ".tmp", schema, compression="zstd") as writer:
+        for rows in chunks:
+            writer.write_table(layout.table(schema, rows), row_group_size=CHUNK)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def export_organ(connection, organ):
+    # Append the reports signed out since the last export; returns (cases, nodules) written
+    after = watermark(organ)
+    last = connection.execute("SELECT max(id) FROM reports WHERE organ = ?", (organ,)).fetchone()[0] or 0
+    if last <= after:
+        return 0, 0
+    if organ == "hcc":
+        # Nodule parts of a run that crashed before its case part was written
+        for first, _, path in _parts(NODULES):
+            if first > after:
+                os.remove(path)
+
+    # Pass 1: column kinds and option sets (memory grows with columns, not rows)
+    case_layout = _Layout()
+    nodule_layout = _Layout()
+    for rows in _reports(connection, organ, after, last):
+        for row in rows:
+            case, nodules = flatten(organ, json.loads(row["fields"]))
+            if row["stage"]:
+                case["stage_group"] = row["stage"]
+            case_layout.observe(case)
+            for nodule in nodules.values():
+                nodule_layout.observe(nodule)
+    case_schema = case_layout.schema(CASE_COLUMNS)
+    nodule_schema = nodule_layout.schema(NODULE_COLUMNS)
+
+    # Pass 2: convert and write chunk by chunk
+    counts = {"cases": 0, "nodules": 0}
+
+    def case_chunks():
+        for rows in _reports(connection, organ, after, last):
+            chunk = []
+            for row in rows:
+                case, _ = flatten(organ, json.loads(row["fields"]))
+                case.update(report_id=row["id"], case_id=row["case_id"], stage_group=row["stage"] or None,
+                            signed_out_at=datetime.fromisoformat(row["signed_out_at"]))
+                chunk.append(case)
+            counts["cases"] += len(chunk)
+            yield chunk
+
+    def nodule_chunks():
+        for rows in _reports(connection, organ, after, last):
+            chunk = []
+            for row in rows:
+                _, nodules = flatten(organ, json.loads(row["fields"]))
+                for number, nodule in sorted(nodules.items()):
+                    nodule.update(report_id=row["id"], case_id=row["case_id"], nodule=number)
+                    chunk.append(nodule)
+            counts["nodules"] += len(chunk)
+            if chunk:
+                yield chunk
+
+    first = after + 1
+    if organ == "hcc":
+        _write(NODULES, nodule_schema, nodule_layout, first, last, nodule_chunks())
+    _write(organ, case_schema, case_layout, first, last, case_chunks())
+    return counts["cases"], counts["nodules"]
+
+
+def _common_type(types):
+    # Type every part's column is read as: categorical in one run and free
+    # text in another reads as string, checkbox / count / number as the broadest
+    if all(pa.types.is_dictionary(t) or pa.types.is_string(t) for t in types):
+        return pa.string()
+    numeric = [pa.bool_(), pa.int32(), pa.float64()]
+    if all(t in numeric for t in types):
+        return max(types, key=numeric.index)
+    return pa.string()
+
+
+def dataset(table):
+    # All parts of an organ (or hcc_nodules) as one dataset; columns added by
+    # later parts read as null in earlier ones. Each part's schema follows
+    # the answers of its own run, so columns are cast to a common type.
+    paths = [path for _, _, path in _parts(table)]
+    if not paths:
+        return ds.dataset(paths, format="parquet")
+    columns = {}
+    for path in paths:
+        for field in pq.read_schema(path):
+            columns.setdefault(field.name, []).append(field)
+    schema = pa.schema([
+        fields[0] if len({field.type for field in fields}) == 1
+        else pa.field(name, _common_type([field.type for field in fields]))
+        for name, fields in columns.items()
+    ])
+    return ds.dataset(paths, schema=schema, format="parquet")
+
+
+if __name__ == "__main__":
+    # python columnar_export.py [organ ...]: append newly signed-out cases
+    from report_index import connect
+
+    connection = connect()
+    for organ in sys.argv[1:] or ["colon", "ampulla", "kidney", "hcc"]:
+        cases, nodules = export_organ(connection, organ)
+        print(f"{organ}: {cases} case(s)" + (f", {nodules} nodule(s)" if organ == "hcc" else "") + f" appended (through report {watermark(organ)})")
+    connection.close()
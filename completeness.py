@@ -0,0 +1,200 @@
+from collections import namedtuple
+
+import streamlit as st
+
+from change_tracking import changed_keys
+
+# CAP required elements per organ. Element i owns bit i of a per-organ mask
+# kept in session state; a changed key only re-tests the elements that read
+# it, so each change updates completeness in constant time. An element is
+# satisfied when any of its keys is filled; `condition` = (key, value) makes
+# it required only while that key holds that value.
+Element = namedtuple("Element", "section label keys condition")
+
+SECTIONS = {
+    "colon": [("specimen", "Specimen"), ("tumor", "Tumor"), ("lymph_nodes", "Regional Lymph Nodes"), ("ptnm", "pTNM")],
+    "ampulla": [("specimen", "Specimen"), ("tumor", "Tumor"), ("lymph_nodes", "Regional Lymph Nodes"), ("ptnm", "pTNM")],
+    "kidney": [("specimen", "Specimen"), ("tumor", "Tumor"), ("margins", "Margins"),
+               ("lymph_nodes", "Regional Lymph Nodes"), ("ptnm", "pTNM")],
+    "hcc": [("specimen", "Specimen"), ("tumor", "Tumor"), ("tumor_characteristics", "Tumor Characteristics"),
+            ("lymph_nodes", "Regional Lymph Nodes"), ("ptnm", "pTNM")]
+}
+
+NODES_EXAMINED = ("ln_examined_exact", "ln_examined_atleast", "ln_examined_other", "ln_examined_explain")
+NODES_PRESENT = ("ln_status", "Regional lymph nodes present")
+
+
+# Missing elements link to #field.<section>.<key>...; Streamlit marks a keyed
+# widget's container with the class st-key-<key>, so a click scrolls to the
+# first key with a widget on the page (answers kept outside widgets, such as
+# the checkbox groups, fall back to the section anchor) and focuses its input
+FIELD_LINKS = """<script>
+const doc = window.parent.document;
+// One listener on the app page; a remounted frame replaces the one of the frame it succeeds
+if (doc.checklistFieldLinks) doc.removeEventListener("click", doc.checklistFieldLinks, true);
+doc.checklistFieldLinks = (event) => {
+    const link = event.target.closest('a[href^="#field."]');
+    if (!link) return;
+    event.preventDefault();
+    event.stopPropagation();
+    const [section, ...keys] = link.getAttribute("href").slice(7).split(".");
+    const target = keys.map((key) => doc.querySelector(".st-key-" + key)).find(Boolean) || doc.getElementById(section);
+    if (!target) return;
+    target.scrollIntoView({behavior: "smooth", block: "center"});
+    const input = target.querySelector("input, textarea");
+    if (input) input.focus({preventScroll: true});
+};
+doc.addEventListener("click", doc.checklistFieldLinks, true);
+</script>"""
+
+
+def _element(section, label, *keys, condition=None):
+    return Element(section, label, keys, condition)
+
+
+REQUIRED = {
+    "colon": [
+        _element("specimen", "Procedure", "procedure"),
+        _element("tumor", "Tumor site", "site_cecum", "site_ileocecal", "site_ascending", "site_hepatic",
+                 "site_transverse", "site_splenic", "site_descending", "site_sigmoid", "site_rectosigmoid",
+                 "site_rectum", "site_colon_nos", "site_cannot_determine"),
+        _element("tumor", "Histologic type", "histologic_type"),
+        _element("tumor", "Histologic grade", "grade"),
+        _element("tumor", "Tumor size", "size_cm", "size_explain"),
+        _element("tumor", "Tumor extent", "tumor_extent"),
+        _element("tumor", "Macroscopic tumor perforation", "perforation"),
+        _element("tumor", "Lymphovascular invasion", "lvi_not_identified", "lvi_small", "lvi_large_intramural",
+                 "lvi_large_extramural", "lvi_present_nos", "lvi_cannot_determine"),
+        _element("tumor", "Perineural invasion", "pni"),
+        _element("lymph_nodes", "Number of lymph nodes examined", *NODES_EXAMINED, condition=NODES_PRESENT),
+        _element("ptnm", "pT category", "pt_category"),
+        _element("ptnm", "pN category", "pn_category")
+    ],
+    "ampulla": [
+        _element("specimen", "Procedure", "procedure"),
+        _element("tumor", "Tumor site", "tumor_site"),
+        _element("tumor", "Histologic type", "histologic_type"),
+        _element("tumor", "Histologic grade", "grade"),
+        _element("tumor", "Tumor size", "size_cm", "largest_focus", "size_explain"),
+        _element("tumor", "Tumor extent", "extent_cis", "extent_ampulla", "extent_sphincter", "extent_submucosa",
+                 "extent_muscularis", "extent_pancreas_05", "extent_pancreas_more", "extent_peripancreatic",
+                 "extent_periduodenal", "extent_serosa", "extent_other_organs", "extent_no_evidence",
+                 "extent_cannot_determine"),
+        _element("tumor", "Lymphovascular invasion", "lvi"),
+        _element("tumor", "Perineural invasion", "pni"),
+        _element("lymph_nodes", "Number of lymph nodes examined", *NODES_EXAMINED, condition=NODES_PRESENT),
+        _element("ptnm", "pT category", "pt_category"),
+        _element("ptnm", "pN category", "pn_category")
+    ],
+    "kidney": [
+        _element("specimen", "Procedure", "procedure"),
+        _element("specimen", "Specimen laterality", "laterality"),
+        _element("tumor", "Tumor focality", "focality"),
+        _element("tumor", "Tumor site", "site_upper_pole", "site_middle", "site_lower_pole", "site_other", "site_not_specified"),
+        _element("tumor", "Tumor size", "greatest_dimension", "size_explain"),
+        _element("tumor", "Histologic type", "clear_cell_rcc", "multilocular_cystic", "papillary_rcc", "chromophobe_rcc",
+                 "other_oncocytic", "collecting_duct", "clear_cell_papillary", "mucinous_tubular", "tubulocystic",
+                 "acquired_cystic", "eosinophilic_solid", "rcc_nos", "tfe3_rearranged", "tfeb_altered", "eloc_mutated",
+                 "fh_deficient", "sdh_deficient", "alk_rearranged", "smarcb1_deficient", "subtype_pending",
+                 "other_histologic"),
+        _element("tumor", "Histologic grade", "grade"),
+        _element("tumor", "Tumor extent", "extent_limited_kidney", "extent_perinephric", "extent_renal_sinus",
+                 "extent_pelvicalyceal", "extent_renal_vein", "extent_ivc", "extent_gerota", "extent_adrenal_direct",
+                 "extent_adrenal_noncontiguous", "extent_other_organs", "extent_cannot_determine"),
+        _element("tumor", "Sarcomatoid / rhabdoid features", "no_sarcomatoid_rhabdoid", "sarcomatoid_present",
+                 "rhabdoid_present", "other_features", "features_cannot_determine"),
+        _element("tumor", "Tumor necrosis", "necrosis"),
+        _element("tumor", "Lymphovascular invasion", "vascular_invasion"),
+        _element("margins", "Margin status", "margin_status"),
+        _element("lymph_nodes", "Regional lymph node status", "ln_status"),
+        _element("lymph_nodes", "Number of lymph nodes examined", *NODES_EXAMINED, condition=NODES_PRESENT),
+        _element("ptnm", "pT category", "pt_category"),
+        _element("ptnm", "pN category", "pn_category")
+    ],
+    "hcc": [
+        _element("specimen", "Procedure", "wedge_resection", "partial_major", "partial_minor", "partial_nos",
+                 "total_hepatectomy", "procedure_other", "procedure_not_specified"),
+        _element("tumor", "Histologic type", "histologic_type"),
+        _element("tumor", "Histologic grade", "grade"),
+        _element("tumor", "Tumor focality", "focality"),
+        _element("tumor_characteristics", "Tumor 1 size", "size_cm_0", "size_explain_0"),
+        _element("tumor_characteristics", "Tumor 1 extent", "confined_liver_0", "major_portal_0", "hepatic_vein_0",
+                 "visceral_peritoneum_0", "gallbladder_0", "diaphragm_0", "adjacent_organs_0", "extent_cannot_0",
+                 "no_primary_0"),
+        _element("tumor_characteristics", "Tumor 1 vascular invasion", "vascular_not_identified_0", "vascular_small_0",
+                 "vascular_large_0", "vascular_present_nos_0", "vascular_cannot_0"),
+        _element("lymph_nodes", "Number of lymph nodes examined", *NODES_EXAMINED, condition=NODES_PRESENT),
+        _element("ptnm", "pT category", "pt_category"),
+        _element("ptnm", "pN category", "pn_category")
+    ]
+}
+
+
+def _build_index(elements):
+    index = {}
+    section_masks = {}
+    for bit, element in enumerate(elements):
+        keys = element.keys + ((element.condition[0],) if element.condition else ())
+        for key in keys:
+            index.setdefault(key, []).append(bit)
+        section_masks[element.section] = section_masks.get(element.section, 0) | (1 << bit)
+    return index, section_masks
+
+
+INDEXES = {organ: _build_index(elements) for organ, elements in REQUIRED.items()}
+
+
+def _satisfied(element, values):
+    if element.condition and values.get(element.condition[0]) != element.condition[1]:
+        return True
+    return any(values.get(key) not in (None, "", False, 0, 0.0) for key in element.keys)
+
+
+def update_completeness(organ):
+    state = st.session_state
+    index = INDEXES[organ][0]
+    mask_key = f"_complete_mask_{organ}"
+    mask = state.get(mask_key, 0)
+    elements = REQUIRED[organ]
+    for key in changed_keys(f"completeness_{organ}", index):
+        for bit in index[key]:
+            if _satisfied(elements[bit], state):
+                mask |= 1 << bit
+            else:
+                mask &= ~(1 << bit)
+    state[mask_key] = mask
+    return mask
+
+
+def missing_required(organ, section=None):
+    mask = st.session_state.get(f"_complete_mask_{organ}", 0)
+    return [element for bit, element in enumerate(REQUIRED[organ])
+            if not mask >> bit & 1 and section in (None, element.section)]
+
+
+def _field_link(element):
+    return f"[{element.label}](#field.{element.section}.{'.'.join(element.keys)})"
+
+
+def completeness_navigator(organ, container=None):
+    # Sidebar: per-section completion, with links to the sections and to each missing element.
+    # Call after the form has rendered, into a container reserved in the sidebar earlier.
+    mask = update_completeness(organ)
+    section_masks = INDEXES[organ][1]
+    total = len(REQUIRED[organ])
+    done = bin(mask).count("1")
+    with container or st.sidebar:
+        st.markdown("### 🧭 Required Elements")
+        st.progress(done / total, text=f"{done} / {total} complete")
+        for section, title in SECTIONS[organ]:
+            section_mask = section_masks.get(section, 0)
+            if not section_mask:
+                continue
+            filled = bin(mask & section_mask).count("1")
+            needed = bin(section_mask).count("1")
+            if filled == needed:
+                st.markdown(f"✅ [{title}](#{section}) ({filled}/{needed})")
+            else:
+                missing = "".join(f"\n- {_field_link(element)}" for element in missing_required(organ, section))
+                st.markdown(f"⬜ [{title}](#{section}) ({filled}/{needed}), missing:\n{missing}")
+        st.iframe(FIELD_LINKS, height="content")
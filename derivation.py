@@ -0,0 +1,402 @@
+import re
+from bisect import bisect_right
+from collections import namedtuple
+
+import streamlit as st
+
+# pT / pN derivation from the findings already on the form (AJCC 8th edition).
+# Each organ's pT rules are an ordered decision table over boolean facts; rows
+# are compiled once into bitmasks, so deriving a case is a fact extraction plus
+# a scan of a dozen integer ANDs. The engine only reads a mapping with .get(),
+# so it works on st.session_state and on stored case dicts (batch audits) alike.
+Derivation = namedtuple("Derivation", "category reasons")
+
+NOT_ASSESSED = "pTX"
+NODES_NOT_ASSESSED = "pNX"
+NO_NODES = "pN not assigned"
+
+FACT_LABELS = {
+    # colon
+    "colon_no_primary": "No evidence of primary tumor",
+    "colon_hgd": "No invasion (high-grade dysplasia)",
+    "colon_lamina_propria": "Invades lamina propria / muscularis mucosae",
+    "colon_submucosa": "Invades submucosa",
+    "colon_muscularis": "Invades into muscularis propria",
+    "colon_pericolic": "Invades through muscularis propria into pericolic / perirectal tissue",
+    "colon_peritoneum": "Invades visceral peritoneum",
+    "colon_adjacent": "Directly invades or adheres to adjacent structure(s)",
+    "colon_cannot": "Tumor extent cannot be determined",
+    # ampulla
+    "ampulla_no_primary": "No evidence of primary tumor",
+    "ampulla_cis": "Carcinoma in situ / high-grade dysplasia",
+    "ampulla_limited": "Limited to ampulla of Vater or sphincter of Oddi",
+    "ampulla_sphincter": "Invades beyond sphincter of Oddi",
+    "ampulla_submucosa": "Invades into duodenal submucosa",
+    "ampulla_muscularis": "Invades into muscularis propria of duodenum",
+    "ampulla_pancreas_05": "Directly invades pancreas (up to 0.5 cm)",
+    "ampulla_pancreas_more": "Extends more than 0.5 cm into pancreas",
+    "ampulla_peripancreatic": "Extends into peripancreatic soft tissues",
+    "ampulla_periduodenal": "Extends into periduodenal tissue",
+    "ampulla_serosa": "Extends into duodenal serosa",
+    "ampulla_other_organs": "Invades other adjacent organ(s)",
+    "ampulla_artery": "Involves celiac axis, superior mesenteric and / or common hepatic artery",
+    "ampulla_cannot": "Tumor extent cannot be determined",
+    # kidney
+    "kidney_beyond_gerota": "Extends beyond Gerota's fascia / into other organ(s)",
+    "kidney_adrenal_direct": "Directly invades adrenal gland",
+    "kidney_ivc": "Extends into inferior vena cava (below diaphragm assumed)",
+    "kidney_renal_vein": "Extends into renal vein or its segmental branches",
+    "kidney_perinephric": "Extends into perinephric tissue",
+    "kidney_sinus": "Extends into renal sinus",
+    "kidney_pelvicalyceal": "Extends into pelvicalyceal system",
+    "kidney_cannot": "Tumor extent cannot be determined",
+    "kidney_size_le_4": "Greatest dimension ≤ 4 cm",
+    "kidney_size_gt_4": "Greatest dimension > 4 cm and ≤ 7 cm",
+    "kidney_size_gt_7": "Greatest dimension > 7 cm and ≤ 10 cm",
+    "kidney_size_gt_10": "Greatest dimension > 10 cm",
+    # hcc
+    "hcc_major_vessel": "Involves a major branch of the portal or hepatic vein",
+    "hcc_invasion": "Perforates visceral peritoneum / invades adjacent organ other than gallbladder",
+    "hcc_no_primary": "No evidence of primary tumor",
+    "hcc_cannot": "Tumor extent cannot be determined",
+    "hcc_multiple": "Multiple tumors",
+    "hcc_solitary": "Solitary tumor",
+    "hcc_size_gt_5": "A tumor is > 5 cm",
+    "hcc_sizes_le_5": "No tumor is > 5 cm",
+    "hcc_size_le_2": "Tumor ≤ 2 cm",
+    "hcc_size_gt_2": "Tumor > 2 cm",
+    "hcc_vi_present": "Vascular invasion present",
+    "hcc_vi_absent": "Vascular invasion not identified"
+}
+
+# Ordered decision tables: (facts that must all be present, category). The
+# first matching row wins, so more advanced categories come first.
+T_TABLES = {
+    "colon": [
+        (("colon_adjacent",), "pT4b"),
+        (("colon_peritoneum",), "pT4a"),
+        (("colon_pericolic",), "pT3"),
+        (("colon_muscularis",), "pT2"),
+        (("colon_submucosa",), "pT1"),
+        (("colon_lamina_propria",), "pTis"),
+        (("colon_hgd",), "pTis"),
+        (("colon_no_primary",), "pT0"),
+        (("colon_cannot",), NOT_ASSESSED)
+    ],
+    "ampulla": [
+        (("ampulla_artery",), "pT4"),
+        (("ampulla_pancreas_more",), "pT3b"),
+        (("ampulla_peripancreatic",), "pT3b"),
+        (("ampulla_periduodenal",), "pT3b"),
+        (("ampulla_serosa",), "pT3b"),
+        (("ampulla_other_organs",), "pT3b"),
+        (("ampulla_pancreas_05",), "pT3a"),
+        (("ampulla_muscularis",), "pT2"),
+        (("ampulla_sphincter",), "pT1b"),
+        (("ampulla_submucosa",), "pT1b"),
+        (("ampulla_limited",), "pT1a"),
+        (("ampulla_cis",), "pTis"),
+        (("ampulla_no_primary",), "pT0"),
+        (("ampulla_cannot",), NOT_ASSESSED)
+    ],
+    "kidney": [
+        (("kidney_beyond_gerota",), "pT4"),
+        (("kidney_adrenal_direct",), "pT4"),
+        (("kidney_ivc",), "pT3b"),
+        (("kidney_renal_vein",), "pT3a"),
+        (("kidney_perinephric",), "pT3a"),
+        (("kidney_sinus",), "pT3a"),
+        (("kidney_pelvicalyceal",), "pT3a"),
+        (("kidney_cannot",), NOT_ASSESSED),
+        (("kidney_size_gt_10",), "pT2b"),
+        (("kidney_size_gt_7",), "pT2a"),
+        (("kidney_size_gt_4",), "pT1b"),
+        (("kidney_size_le_4",), "pT1a")
+    ],
+    "hcc": [
+        (("hcc_major_vessel",), "pT4"),
+        (("hcc_invasion",), "pT4"),
+        (("hcc_no_primary",), "pT0"),
+        (("hcc_cannot",), NOT_ASSESSED),
+        (("hcc_multiple", "hcc_size_gt_5"), "pT3"),
+        (("hcc_multiple", "hcc_sizes_le_5"), "pT2"),
+        (("hcc_solitary", "hcc_size_le_2"), "pT1a"),
+        (("hcc_solitary", "hcc_size_gt_2", "hcc_vi_present"), "pT2"),
+        (("hcc_solitary", "hcc_size_gt_2", "hcc_vi_absent"), "pT1b")
+    ]
+}
+
+# pN by number of positive nodes: (lower bounds, categories), searched with bisect
+N_TABLES = {
+    "colon": ((1, 2, 4, 7), ("pN1a", "pN1b", "pN2a", "pN2b")),
+    "ampulla": ((1, 4), ("pN1", "pN2")),
+    "kidney": ((1,), ("pN1",)),
+    "hcc": ((1,), ("pN1",))
+}
+N_DESCRIPTIONS = {
+    "pN1a": "1 positive node",
+    "pN1b": "2-3 positive nodes",
+    "pN2a": "4-6 positive nodes",
+    "pN2b": "7 or more positive nodes",
+    "pN2": "4 or more positive nodes"
+}
+
+COLON_EXTENT_FACTS = {
+    "No invasion (high-grade dysplasia)": "colon_hgd",
+    "Invades lamina propria / muscularis mucosae (intramucosal carcinoma)": "colon_lamina_propria",
+    "Invades submucosa": "colon_submucosa",
+    "Invades into muscularis propria": "colon_muscularis",
+    "Invades through muscularis propria into the pericolic or perirectal tissue": "colon_pericolic",
+    "Invades visceral peritoneum": "colon_peritoneum",
+    "Directly invades or adheres to adjacent structure(s)": "colon_adjacent",
+    "Cannot be determined": "colon_cannot",
+    "No evidence of primary tumor": "colon_no_primary"
+}
+
+AMPULLA_CHECKBOX_FACTS = {
+    "extent_cis": "ampulla_cis",
+    "extent_ampulla": "ampulla_limited",
+    "extent_sphincter": "ampulla_sphincter",
+    "extent_submucosa": "ampulla_submucosa",
+    "extent_muscularis": "ampulla_muscularis",
+    "extent_pancreas_05": "ampulla_pancreas_05",
+    "extent_pancreas_more": "ampulla_pancreas_more",
+    "extent_peripancreatic": "ampulla_peripancreatic",
+    "extent_periduodenal": "ampulla_periduodenal",
+    "extent_serosa": "ampulla_serosa",
+    "extent_other_organs": "ampulla_other_organs",
+    "organ_celiac": "ampulla_artery",
+    "organ_sma": "ampulla_artery",
+    "organ_hepatic": "ampulla_artery",
+    "extent_no_evidence": "ampulla_no_primary",
+    "extent_cannot_determine": "ampulla_cannot"
+}
+
+KIDNEY_CHECKBOX_FACTS = {
+    "extent_gerota": "kidney_beyond_gerota",
+    "extent_other_organs": "kidney_beyond_gerota",
+    "extent_adrenal_direct": "kidney_adrenal_direct",
+    "extent_ivc": "kidney_ivc",
+    "extent_renal_vein": "kidney_renal_vein",
+    "extent_perinephric": "kidney_perinephric",
+    "extent_renal_sinus": "kidney_sinus",
+    "extent_pelvicalyceal": "kidney_pelvicalyceal",
+    "extent_cannot_determine": "kidney_cannot"
+}
+
+FACT_BITS = {fact: 1 << bit for bit, fact in enumerate(FACT_LABELS)}
+
+
+def _compile(table):
+    rows = []
+    for facts, category in table:
+        mask = 0
+        for fact in facts:
+            mask |= FACT_BITS[fact]
+        rows.append((mask, category, facts))
+    return tuple(rows)
+
+
+COMPILED_T_TABLES = {organ: _compile(table) for organ, table in T_TABLES.items()}
+
+
+def _number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _colon_facts(values):
+    fact = COLON_EXTENT_FACTS.get(values.get("tumor_extent"))
+    return FACT_BITS[fact] if fact else 0
+
+
+def _checkbox_facts(values, table):
+    mask = 0
+    for key, fact in table.items():
+        if values.get(key):
+            mask |= FACT_BITS[fact]
+    return mask
+
+
+def _ampulla_facts(values):
+    return _checkbox_facts(values, AMPULLA_CHECKBOX_FACTS)
+
+
+def _kidney_facts(values):
+    mask = _checkbox_facts(values, KIDNEY_CHECKBOX_FACTS)
+    size = _number(values.get("greatest_dimension"))
+    if size > 10:
+        mask |= FACT_BITS["kidney_size_gt_10"]
+    elif size > 7:
+        mask |= FACT_BITS["kidney_size_gt_7"]
+    elif size > 4:
+        mask |= FACT_BITS["kidney_size_gt_4"]
+    elif size > 0:
+        mask |= FACT_BITS["kidney_size_le_4"]
+    return mask
+
+
+def _hcc_facts(values):
+    mask = 0
+    nodules = int(values.get("num_tumors") or 1)
+    sizes = []
+    vi_present = vi_absent = False
+    for i in range(nodules):
+        if values.get(f"major_portal_{i}") or values.get(f"hepatic_vein_{i}") or values.get(f"vascular_large_{i}"):
+            mask |= FACT_BITS["hcc_major_vessel"]
+        if values.get(f"visceral_peritoneum_{i}") or values.get(f"adjacent_organs_{i}") or values.get(f"diaphragm_{i}"):
+            mask |= FACT_BITS["hcc_invasion"]
+        if values.get(f"no_primary_{i}"):
+            mask |= FACT_BITS["hcc_no_primary"]
+        if values.get(f"extent_cannot_{i}"):
+            mask |= FACT_BITS["hcc_cannot"]
+        if values.get(f"vascular_small_{i}") or values.get(f"vascular_present_nos_{i}"):
+            vi_present = True
+        if values.get(f"vascular_not_identified_{i}"):
+            vi_absent = True
+        size = _number(values.get(f"size_cm_{i}"))
+        if size > 0 and values.get(f"size_method_{i}", "Greatest dimension of viable tumor in cm") != "Cannot be determined":
+            sizes.append(size)
+
+    multiple = values.get("focality") == "Multiple" or nodules > 1
+    if multiple:
+        mask |= FACT_BITS["hcc_multiple"]
+    elif values.get("focality") == "Solitary":
+        mask |= FACT_BITS["hcc_solitary"]
+    if sizes:
+        largest = max(sizes)
+        if largest > 5:
+            mask |= FACT_BITS["hcc_size_gt_5"]
+        elif len(sizes) == nodules:
+            mask |= FACT_BITS["hcc_sizes_le_5"]
+        mask |= FACT_BITS["hcc_size_gt_2"] if largest > 2 else FACT_BITS["hcc_size_le_2"]
+    if vi_present:
+        mask |= FACT_BITS["hcc_vi_present"]
+    elif vi_absent:
+        mask |= FACT_BITS["hcc_vi_absent"]
+    return mask
+
+
+FACT_EXTRACTORS = {
+    "colon": _colon_facts,
+    "ampulla": _ampulla_facts,
+    "kidney": _kidney_facts,
+    "hcc": _hcc_facts
+}
+
+
+def derive_pt(organ, values):
+    mask = FACT_EXTRACTORS[organ](values)
+    for row_mask, category, facts in COMPILED_T_TABLES[organ]:
+        if mask & row_mask == row_mask:
+            reasons = [FACT_LABELS[fact] for fact in facts]
+            if organ == "kidney" and category == "pT3b":
+                reasons.append("pT3c if above the diaphragm or invading the caval wall")
+            return Derivation(category, reasons)
+    return None
+
+
+def derive_pn(organ, values):
+    status = values.get("ln_status")
+    if status == "Not applicable (no regional lymph nodes submitted or found)":
+        return Derivation(NO_NODES, ["No regional lymph nodes submitted or found"])
+    if status == "Cannot be determined":
+        return Derivation(NODES_NOT_ASSESSED, ["Lymph node status cannot be determined"])
+    if status != "Regional lymph nodes present":
+        return None
+
+    bounds, categories = N_TABLES[organ]
+    tumor_status = values.get("ln_tumor_status")
+    if tumor_status == "All regional lymph nodes negative for tumor":
+        if organ == "colon" and values.get("tumor_deposits") == "Present":
+            return Derivation("pN1c", ["All regional lymph nodes negative", "Tumor deposits present"])
+        return Derivation("pN0", ["All regional lymph nodes negative"])
+    if tumor_status != "Tumor present in regional lymph node(s)":
+        return None
+
+    method = values.get("ln_positive_method")
+    positive = int(_number(values.get("ln_positive_exact")))
+    if method in ("Exact number", None) and positive > 0:
+        category = categories[bisect_right(bounds, positive) - 1]
+        reasons = [f"{positive} positive node(s)"]
+        if values.get("ln_examined_method") == "Exact number" and values.get("ln_examined_exact"):
+            reasons[0] = f"{positive} of {int(_number(values.get('ln_examined_exact')))} nodes positive"
+        if category in N_DESCRIPTIONS:
+            reasons.append(N_DESCRIPTIONS[category])
+        return Derivation(category, reasons)
+    if len(categories) == 1:
+        return Derivation(categories[0], ["Tumor present in regional lymph node(s)"])
+    if method == "At least":
+        at_least = int(_number(values.get("ln_positive_atleast")))
+        index = bisect_right(bounds, at_least) - 1
+        # Only decidable once the lower bound reaches the last category
+        if at_least and index == len(categories) - 1:
+            return Derivation(categories[index], [f"At least {at_least} positive nodes", N_DESCRIPTIONS.get(categories[index], "")])
+        if organ == "colon" and at_least >= 4:
+            return Derivation("pN2", [f"At least {at_least} positive nodes", N_DESCRIPTIONS["pN2"]])
+    return None
+
+
+def option_label(option):
+    # "pT3a: Tumor ..." -> "pT3a", "pT4 (subcategory ...)" -> "pT4", "G2, ..." -> "G2"
+    return re.split(r"[:,]| \(", option, maxsplit=1)[0].strip()
+
+
+def category_option(category, options):
+    # Map a derived category to the exact option string of the app's selectbox
+    if category in (NOT_ASSESSED, NODES_NOT_ASSESSED):
+        prefix = category[:2] + " not assigned (cannot"
+    elif category == NO_NODES:
+        prefix = "pN not assigned (no nodes"
+    else:
+        matches = [o for o in options if option_label(o) == category]
+        exact = [o for o in matches if "subcategory" not in o]
+        return (exact or matches or [None])[0]
+    return next((o for o in options if o.startswith(prefix)), None)
+
+
+def disagreements(organ, values, derived=None):
+    # (axis, manual option, derived category) for every manual pick that differs
+    derived = derived or {"pt": derive_pt(organ, values), "pn": derive_pn(organ, values)}
+    found = []
+    for axis, key in (("pt", "pt_category"), ("pn", "pn_category")):
+        manual = values.get(key)
+        result = derived[axis]
+        if not manual or result is None:
+            continue
+        if manual.startswith(("pT not assigned", "pN not assigned")):
+            same = category_option(result.category, [manual]) == manual
+        else:
+            same = option_label(manual) == result.category
+        if not same:
+            found.append((axis, manual, result.category))
+    return found
+
+
+def audit_cases(organ, cases):
+    # Batch audit: [(case index, axis, manual option, derived category)]
+    return [(index,) + found for index, case in enumerate(cases) for found in disagreements(organ, case)]
+
+
+def _use_suggestion(key, option):
+    st.session_state[key] = option
+
+
+def derivation_panel(organ, pt_options, pn_options):
+    derived = {"pt": derive_pt(organ, st.session_state), "pn": derive_pn(organ, st.session_state)}
+    conflicts = {axis: category for axis, _, category in disagreements(organ, st.session_state, derived)}
+    with st.expander("🧮 Suggested pT / pN (AJCC 8)", expanded=bool(conflicts)):
+        for axis, key, options in (("pt", "pt_category", pt_options), ("pn", "pn_category", pn_options)):
+            result = derived[axis]
+            name = "pT" if axis == "pt" else "pN"
+            if result is None:
+                st.caption(f"{name}: not enough information on the form yet.")
+                continue
+            option = category_option(result.category, options)
+            st.markdown(f"**{name}: {result.category}** ← " + "; ".join(reason for reason in result.reasons if reason))
+            if axis in conflicts:
+                st.warning(f"Selected {name} ({option_label(st.session_state.get(key, ''))}) differs from the derived {result.category}.")
+            if option and st.session_state.get(key) != option:
+                st.button(f"Use {result.category}", key=f"use_derived_{axis}", on_click=_use_suggestion, args=(key, option))
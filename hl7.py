@@ -0,0 +1,227 @@
+import re
+import uuid
+from datetime import datetime
+
+from derivation import option_label
+from units import FINDINGS, normalize_values
+
+# HL7 v2.5.1 messages exchanged with the LIS/EHR: ORU^R01 results for
+# signed-out reports, ORM^O01 orders coming in, and the ACKs of both.
+# Messages are "\r"-separated segments of "|"-separated fields; components
+# are split by "^", repetitions by "~" and subcomponents by "&". Text is
+# escaped when it is written and unescaped when a field is read.
+ENCODING_CHARACTERS = "^~\\&"
+VERSION = "2.5.1"
+SENDING_APPLICATION = "CHECKLIST"
+SENDING_FACILITY = "PATHOLOGY"
+
+# \E\ must be first so the backslashes of the other escapes are not re-escaped
+ESCAPES = (("\\", "\\E\\"), ("|", "\\F\\"), ("^", "\\S\\"), ("&", "\\T\\"), ("~", "\\R\\"))
+UNESCAPES = {"E": "\\", "F": "|", "S": "^", "T": "&", "R": "~", ".br": "\n"}
+UNESCAPE_PATTERN = re.compile(r"\\(E|F|S|T|R|\.br)\\")
+
+# Case summary keys carried by PID/OBR instead of an OBX
+HEADER_KEYS = ("case_id", "patient_name", "pathologist", "date_of_procedure")
+
+# Read by the HCC nodule findings to know which nodules count, but an answer of its own
+SHARED_FINDING_KEYS = ("num_tumors",)
+
+# Measurement units as UCUM codes
+UCUM = {"mm": "mm^millimeter^UCUM", "%": "%^percent^UCUM", "g": "g^gram^UCUM", "count": "{count}^count^UCUM"}
+
+# HL7 table 0136 answers for checked boxes
+YES = "Y^Yes^HL70136"
+
+
+def escape(text):
+    text = str(text)
+    for char, escaped in ESCAPES:
+        text = text.replace(char, escaped)
+    return text
+
+
+def unescape(text):
+    # One pass, so an escaped backslash never starts another escape
+    return UNESCAPE_PATTERN.sub(lambda match: UNESCAPES[match.group(1)], text)
+
+
+def formatted_text(text):
+    # FT value: escaped lines joined with the line break escape
+    return "\\.br\\".join(escape(line) for line in text.splitlines())
+
+
+def timestamp(value=None):
+    # DTM from a datetime, an ISO date/time string or now
+    if value is None:
+        value = datetime.now()
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.strftime("%Y%m%d%H%M%S")
+
+
+def control_id():
+    return uuid.uuid4().hex[:20]
+
+
+def person_name(name, separator="^"):
+    # "Doe, Jane" / "Jane Doe" -> family^given
+    name = " ".join(str(name).split())
+    if "," in name:
+        family, given = (part.strip() for part in name.split(",", 1))
+    else:
+        given, _, family = name.rpartition(" ")
+    return escape(family) + separator + escape(given) if given else escape(family)
+
+
+def segment(*fields):
+    return "|".join(str(field) for field in fields).rstrip("|")
+
+
+def numbered_segment(name, fields):
+    # Segment from {field number: value}; fields not given are empty
+    return segment(name, *(fields.get(number, "") for number in range(1, max(fields) + 1)))
+
+
+def message_header(message_type, message_control_id, receiver=("", "")):
+    return segment(
+        "MSH", ENCODING_CHARACTERS, SENDING_APPLICATION, SENDING_FACILITY, receiver[0], receiver[1], timestamp(), "",
+        message_type, message_control_id, "P", VERSION
+    )
+
+
+def parse_message(text):
+    # [[segment id, field 1, field 2, ...]] with the raw (escaped) field text;
+    # MSH gets its field separator back as field 1 so indexes match MSH-n
+    segments = []
+    for line in text.replace("\n", "\r").split("\r"):
+        if not line:
+            continue
+        fields = line.split("|")
+        if fields[0] == "MSH":
+            fields.insert(1, "|")
+        segments.append(fields)
+    return segments
+
+
+def field(segment_fields, number, component=1):
+    # Unescaped component of SEG-number ("" when absent); component=0 for the whole field
+    if number >= len(segment_fields):
+        return ""
+    value = segment_fields[number].split("~")[0]
+    if component:
+        parts = value.split("^")
+        value = parts[component - 1] if component <= len(parts) else ""
+    return unescape(value)
+
+
+def segments_named(segments, name):
+    return [fields for fields in segments if fields[0] == name]
+
+
+def ack_message(message, code, text=""):
+    # ACK for a received message: AA accepted, AE error (may be resent), AR rejected
+    segments = parse_message(message)
+    header = segments[0] if segments and segments[0][0] == "MSH" else ["MSH"]
+    trigger = field(header, 9, 2)
+    return "\r".join([
+        segment(
+            "MSH", ENCODING_CHARACTERS, field(header, 5, 0) or SENDING_APPLICATION, field(header, 6, 0) or SENDING_FACILITY,
+            field(header, 3, 0), field(header, 4, 0), timestamp(), "", f"ACK^{trigger}^ACK", control_id(), "P", VERSION
+        ),
+        segment("MSA", code, escape(field(header, 10)), escape(text))
+    ]) + "\r"
+
+
+def parse_ack(message):
+    # (acknowledgment code, control id of the acknowledged message, text)
+    msa = segments_named(parse_message(message), "MSA")
+    if not msa:
+        return "", "", ""
+    return field(msa[0], 1), field(msa[0], 2), field(msa[0], 3)
+
+
+def label(key):
+    return escape(key.replace("_", " ").capitalize())
+
+
+def _observation(key, value):
+    # (value type, OBX-5) of one checklist answer, or None when unanswered
+    if value is True:
+        return "CWE", YES
+    if value in (None, "", False) or isinstance(value, (list, dict)):
+        return None
+    if isinstance(value, (int, float)):
+        return "NM", f"{value:g}"
+    value = str(value)
+    if "\n" in value:
+        return "FT", formatted_text(value)
+    code = option_label(value)
+    if code != value:
+        return "CWE", f"{escape(code)}^{escape(value)}^L"
+    return "ST", escape(value)
+
+
+def _measurement_observations(measurement):
+    # [(value type, OBX-5, sub-ID)]: SN for censored values, one OBX per value of a list
+    values = measurement.value if isinstance(measurement.value, list) else [measurement.value]
+    found = []
+    for i, value in enumerate(values):
+        sub_id = str(i + 1) if len(values) > 1 else ""
+        if measurement.censor:
+            found.append(("SN", f"{escape(measurement.censor)}^{value:g}", sub_id))
+        else:
+            found.append(("NM", f"{value:g}", sub_id))
+    return found
+
+
+def observations(organ, values):
+    # OBX segments (without set IDs) of the synoptic elements: one per answered
+    # checklist key, with numeric findings as typed measurements in UCUM units
+    # instead of the raw inputs they were read from
+    measurements = normalize_values(organ, values)
+    measured_keys = {key for finding in FINDINGS[organ] if finding.name in measurements for key in finding.keys}
+    found = []
+    for name, measurement in measurements.items():
+        for value_type, value, sub_id in _measurement_observations(measurement):
+            found.append((value_type, f"{name}^{label(name)}^L", sub_id, value, UCUM.get(measurement.unit, "")))
+    for key, value in values.items():
+        if key in HEADER_KEYS or (key in measured_keys and key not in SHARED_FINDING_KEYS):
+            continue
+        observation = _observation(key, value)
+        if observation:
+            found.append((observation[0], f"{key}^{label(key)}^L", "", observation[1], ""))
+    return found
+
+
+def oru_message(organ, organ_name, values, report, version, signed_out_at, message_control_id=None,
+                receiver=("", "")):
+    # ORU^R01 of one signed-out report: the report text as an FT observation
+    # followed by the structured answers. Amendments (version > 1) are sent
+    # as corrected results.
+    status = "F" if version == 1 else "C"
+    case_id = escape(values["case_id"])
+    pathologist = values.get("pathologist")
+    procedure_date = values.get("date_of_procedure") or ""
+    segments = [
+        message_header("ORU^R01^ORU_R01", message_control_id or control_id(), receiver),
+        numbered_segment("PID", {
+            1: "1",
+            5: person_name(values["patient_name"]) if values.get("patient_name") else "",
+            8: {"Male": "M", "Female": "F"}.get(values.get("gender"), "")
+        }),
+        segment("ORC", "RE", case_id, case_id, "", "CM"),
+        numbered_segment("OBR", {
+            1: "1",
+            2: case_id,
+            3: case_id,
+            4: f"{organ}^{escape(organ_name)} synoptic report^L",
+            7: str(procedure_date).replace("-", ""),
+            22: timestamp(signed_out_at),
+            25: status,
+            32: "&" + person_name(pathologist, "&") if pathologist else ""
+        })
+    ]
+    rows = [("FT", "report^Synoptic report^L", "", formatted_text(report), "")] + observations(organ, values)
+    for set_id, (value_type, identifier, sub_id, value, units) in enumerate(rows, 1):
+        segments.append(segment("OBX", set_id, value_type, identifier, sub_id, value, units, "", "", "", "", status))
+    return "\r".join(segments) + "\r"
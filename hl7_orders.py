@@ -0,0 +1,293 @@
+import argparse
+import glob
+import os
+import queue
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from datetime import date
+from functools import partial
+
+from cases import DRAFT, connect, load_case_version, save_case
+from hl7 import field, parse_message, segments_named, unescape
+from mllp import MLLPServer
+from orders import normalize_order, parse_date, procedure_values
+from storage import DATA_DIR, log
+
+# Order interface from the LIS. ORM^O01 messages arrive over MLLP or as files
+# in <data dir>/hl7_inbox/; each OBR becomes a draft case in the worklist
+# with the apps' keys filled in (case_id, patient_name, date_of_procedure,
+# procedure, and age, gender, clinical_diagnosis and laterality for kidney),
+# so opening it from the worklist starts a prefilled checklist.
+#
+# Runs as its own process (python hl7_orders.py --listen 0.0.0.0:2576
+# --watch) so a burst of orders never competes with a UI session for CPU.
+# Both sources feed one writer thread that commits the orders of everything
+# received meanwhile in a single short transaction; with WAL the worklist
+# keeps reading while it writes. An MLLP message is acknowledged once its
+# orders are committed, a file is removed once all of its orders are.
+#
+# An order only ever creates or updates a worklist entry nobody has saved
+# yet: entries carry the "_order" key (the placer order number) until their
+# first save, and a cancelled order (ORC-1 CA/OC/DC) removes such an entry.
+INBOX_DIR = "hl7_inbox"
+FAILED_DIR = "failed"
+BATCH = 500
+WATCH_INTERVAL = 1.0
+READ_SIZE = 65536
+
+CANCEL_CONTROLS = ("CA", "OC", "DC")
+
+# First organ whose pattern matches the ordered procedure or specimen text
+ORDER_ORGANS = (
+    ("kidney", r"\b(nephrectomy|nephroureterectomy|kidney|renal)\b"),
+    ("hcc", r"\b(hepatectomy|liver|hepatic|hepatocellular|segmentectomy)\b"),
+    ("ampulla", r"\b(ampulla|ampullary|ampullectomy|pancreaticoduodenectomy|whipple)\b"),
+    ("colon", r"\b(colon|colonic|colectomy|hemicolectomy|sigmoid\w*|rectum|rectal|proctectomy|cecum|colorectal)\b")
+)
+
+# HL7 table 0495 body site modifiers
+SITE_MODIFIERS = {"L": "Left", "R": "Right"}
+
+Order = namedtuple("Order", "organ case_id values cancel")
+
+
+class MessageSplitter:
+    # Incremental splitter for files of concatenated messages (any line
+    # endings, with or without MLLP framing): a message ends where the next
+    # MSH segment starts
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, text):
+        self._buffer += re.sub("[\x0b\x1c]", "", text).replace("\n", "\r")
+        parts = self._buffer.split("\rMSH|")
+        if len(parts) == 1:
+            return []
+        self._buffer = "MSH|" + parts.pop()
+        return [parts[0]] + ["MSH|" + part for part in parts[1:]]
+
+    def close(self):
+        rest, self._buffer = self._buffer, ""
+        return [rest] if rest.strip("\r") else []
+
+
+def _person(parts):
+    # [family, given, middle] -> "Family, Given Middle"
+    family, given, middle = (parts + ["", "", ""])[:3]
+    given = " ".join(part for part in (given, middle) if part)
+    return f"{family}, {given}" if family and given else family or given
+
+
+def _interpreter(obr):
+    # OBR-32 is id&family&given&middle in its first component
+    raw = obr[32].split("~")[0].split("^")[0] if len(obr) > 32 else ""
+    return _person([unescape(part) for part in raw.split("&")[1:]])
+
+
+def _age(birth, on):
+    birth = parse_date(birth[:8]) if birth else None
+    if birth is None:
+        return None
+    return on.year - birth.year - ((on.month, on.day) < (birth.month, birth.day))
+
+
+def _organ(text):
+    for organ, pattern in ORDER_ORGANS:
+        if re.search(pattern, text, re.IGNORECASE):
+            return organ
+    return None
+
+
+def _laterality(modifier, text):
+    if modifier.upper() in SITE_MODIFIERS:
+        return SITE_MODIFIERS[modifier.upper()]
+    found = {side for side in ("left", "right") if re.search(rf"\b{side}\b", text, re.IGNORECASE)}
+    return found.pop().capitalize() if len(found) == 1 else None
+
+
+def parse_orm(message):
+    # [Order] of an ORM^O01: one per OBR whose procedure or specimen maps to
+    # an organ. Raises ValueError for anything that is not a usable ORM.
+    segments = parse_message(message)
+    if not segments or segments[0][0] != "MSH":
+        raise ValueError("no MSH segment")
+    if field(segments[0], 9) != "ORM":
+        raise ValueError(f"unsupported message type {field(segments[0], 9, 0)}")
+    pid = (segments_named(segments, "PID") or [["PID"]])[0]
+    patient = {"patient_name": _person([field(pid, 5, n) for n in (1, 2, 3)]), "gender": field(pid, 8)}
+    orders = []
+    orc = ["ORC"]
+    # Each order is an ORC followed by its OBR and the specimens (SPM) after it
+    for number, fields in enumerate(segments):
+        if fields[0] == "ORC":
+            orc = fields
+        if fields[0] != "OBR":
+            continue
+        specimens = []
+        for following in segments[number + 1:]:
+            if following[0] in ("ORC", "OBR"):
+                break
+            if following[0] == "SPM":
+                specimens.append(following)
+        case_id = field(fields, 3) or field(orc, 3) or field(fields, 2) or field(orc, 2)
+        if not case_id:
+            raise ValueError("order without an accession or placer order number")
+        procedure = field(fields, 4, 2) or field(fields, 4, 1)
+        # Specimen: SPM-4 type, SPM-8 source site, SPM-9 site modifier (v2.5), or OBR-15 (v2.3)
+        specimen = " ".join(field(spm, n, c) for spm in specimens for n, c in ((4, 2), (8, 2), (8, 1))) \
+            or " ".join(field(fields, 15, c) for c in (1, 4))
+        modifier = next((field(spm, 9) for spm in specimens if field(spm, 9)), "") or field(fields, 15, 5)
+        organ = _organ(f"{procedure} {specimen}")
+        if organ is None:
+            continue
+        collected = parse_date(field(fields, 7)[:8]) if field(fields, 7) else None
+        raw = dict(patient, case_id=case_id, procedure=procedure,
+                   date_of_procedure=collected, pathologist=_interpreter(fields),
+                   age=_age(field(pid, 7), collected or date.today()),
+                   clinical_diagnosis=field(fields, 13) or field((segments_named(segments, "DG1") or [["DG1"]])[0], 3, 2),
+                   laterality=_laterality(modifier, f"{procedure} {specimen}"))
+        values = normalize_order(organ, {key: value for key, value in raw.items() if value is not None})
+        if "date_of_procedure" in values:
+            values["date_of_procedure"] = values["date_of_procedure"].isoformat()
+        values.update(procedure_values(organ, values.pop("procedure")) if "procedure" in values else {})
+        values["_order"] = field(fields, 2) or field(orc, 2) or case_id
+        orders.append(Order(organ, case_id, values, field(orc, 1) in CANCEL_CONTROLS))
+    return orders
+
+
+def store_orders(connection, orders):
+    # Create, update or withdraw the worklist entries of the orders; entries
+    # someone has already saved are left alone. Returns the number changed. The caller commits.
+    changed = 0
+    for order in orders:
+        if order.cancel:
+            changed += connection.execute(
+                """DELETE FROM cases WHERE organ = ? AND case_id = ? AND status = ?
+                   AND json_extract(fields, '$._order') IS NOT NULL""",
+                (order.organ, order.case_id, DRAFT)
+            ).rowcount
+            continue
+        if save_case(connection, order.organ, order.values, DRAFT):
+            changed += 1
+            continue
+        stored, version = load_case_version(connection, order.organ, order.case_id)
+        if "_order" in stored and stored != order.values:
+            changed += save_case(connection, order.organ, order.values, None, version) is not None
+    return changed
+
+
+class OrderWriter:
+    # The single writer: orders submitted from any connection or file are
+    # committed together, up to BATCH at a time
+    def __init__(self, path=None, batch=BATCH):
+        self.path = path
+        self.batch = batch
+        self.queue = queue.Queue()
+        self.stored = 0
+        threading.Thread(target=self._run, name="order-writer", daemon=True).start()
+
+    def submit(self, orders):
+        # Future resolved once the orders are committed
+        future = Future()
+        self.queue.put((orders, future))
+        return future
+
+    def _run(self):
+        connection = connect(self.path)
+        while True:
+            items = [self.queue.get()]
+            count = len(items[0][0])
+            while count < self.batch:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+                count += len(items[-1][0])
+            try:
+                with connection:
+                    self.stored += store_orders(connection, [order for orders, _ in items for order in orders])
+            except Exception as error:
+                for _, future in items:
+                    future.set_exception(error)
+                continue
+            for _, future in items:
+                future.set_result(None)
+
+
+def ingest(writer, messages):
+    # (acknowledgment code, text) per message once its orders are committed
+    answers, orders = [], []
+    for message in messages:
+        try:
+            orders += parse_orm(message)
+            answers.append(("AA", ""))
+        except ValueError as error:
+            answers.append(("AR", str(error)))
+    if orders:
+        writer.submit(orders).result()
+    return answers
+
+
+def inbox_dir(*parts):
+    path = os.path.join(DATA_DIR, INBOX_DIR, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def ingest_file(writer, path):
+    # Stream a dropped file through the splitter, committing BATCH messages at a
+    # time; the file is removed, or moved to failed/ if any message was rejected
+    splitter = MessageSplitter()
+    pending, rejected = [], []
+    with open(path, encoding="utf-8", errors="replace", newline="") as f:
+        while True:
+            chunk = f.read(READ_SIZE)
+            pending += splitter.feed(chunk) if chunk else splitter.close()
+            if len(pending) >= BATCH or not chunk:
+                rejected += [answer[1] for answer in ingest(writer, pending) if answer[0] != "AA"]
+                pending = []
+            if not chunk:
+                break
+    if rejected:
+        os.replace(path, os.path.join(inbox_dir(FAILED_DIR), os.path.basename(path)))
+        log.warning("%s: %d rejected (%s), moved to %s/", os.path.basename(path), len(rejected), rejected[0], FAILED_DIR)
+    else:
+        os.remove(path)
+
+
+def watch_inbox(writer, interval=WATCH_INTERVAL):
+    # The LIS writes each file under another name and renames it to *.hl7 when complete
+    while True:
+        for path in sorted(glob.glob(os.path.join(inbox_dir(), "*.hl7")), key=os.path.getmtime):
+            try:
+                ingest_file(writer, path)
+            except Exception:
+                log.exception("%s: ingest failed", os.path.basename(path))
+        time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create worklist entries from HL7 ORM orders")
+    parser.add_argument("--listen", metavar="HOST:PORT", help="accept orders over MLLP")
+    parser.add_argument("--watch", action="store_true", help=f"ingest *.hl7 files dropped into <data dir>/{INBOX_DIR}/")
+    args = parser.parse_args()
+    if not args.listen and not args.watch:
+        parser.error("give --listen, --watch or both")
+    writer = OrderWriter()
+    if not args.listen:
+        print(f"Watching {inbox_dir()}")
+        watch_inbox(writer)
+    if args.watch:
+        threading.Thread(target=watch_inbox, args=(writer,), name="order-inbox", daemon=True).start()
+        print(f"Watching {inbox_dir()}")
+    host, _, port = args.listen.rpartition(":")
+    with MLLPServer((host or "0.0.0.0", int(port)), partial(ingest, writer)) as server:
+        print(f"Listening for MLLP on {host or '0.0.0.0'}:{port}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import argparse
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+from functools import partial
+
+from hl7 import control_id, oru_message
+from mllp import MLLPSender
+from storage import connect_db, log
+
+# Results interface to the LIS/EHR. Signing out a case queues its ORU^R01 in
+# hl7_outbox in the same transaction as the report, so no result is lost
+# between the sign-out and the receiver; a dispatcher thread per process
+# sends queued messages over MLLP and records their ACKs.
+#
+# Only the oldest unacknowledged message of a case is sent at a time, so an
+# amendment never overtakes the result it corrects. Replicas sharing the
+# database claim messages with a lease (claimed_by, claimed_until) that the
+# owner renews while the message waits for its ACK; a replica that died
+# leaves its claims to expire and be resent, under the same MSH-10.
+#
+# Enabled with CHECKLIST_HL7_OUTBOUND=host:port (the receiver's MLLP
+# listener); CHECKLIST_HL7_RECEIVER=application^facility fills MSH-5/MSH-6.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hl7_outbox (
+    control_id TEXT PRIMARY KEY,
+    organ TEXT NOT NULL,
+    case_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    queued_at TEXT NOT NULL,
+    status TEXT NOT NULL,
+    claimed_by TEXT NOT NULL DEFAULT '',
+    claimed_until REAL NOT NULL DEFAULT 0,
+    acked_at TEXT,
+    error TEXT NOT NULL DEFAULT '',
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS hl7_outbox_status ON hl7_outbox (status, organ, case_id, version);
+"""
+
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+
+LEASE = 300
+POLL_INTERVAL = 5
+MAX_IN_FLIGHT = 1000
+
+
+def configured():
+    return bool(os.environ.get("CHECKLIST_HL7_OUTBOUND"))
+
+
+def queue_result(connection, organ, organ_name, values, report, version, signed_out_at):
+    # Queue the ORU of a sign-out when the interface is enabled; the caller commits
+    if not configured():
+        return None
+    receiver = (os.environ.get("CHECKLIST_HL7_RECEIVER", "") + "^").split("^")[:2]
+    message_control_id = control_id()
+    connection.execute(
+        """INSERT INTO hl7_outbox (control_id, organ, case_id, version, queued_at, status, message)
+           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        (message_control_id, organ, values["case_id"], version, datetime.now().isoformat(timespec="seconds"), PENDING,
+         oru_message(organ, organ_name, values, report, version, signed_out_at, message_control_id, receiver))
+    )
+    return message_control_id
+
+
+class Dispatcher:
+    def __init__(self, host, port, path=None):
+        self.sender = MLLPSender(host, port)
+        self.path = path
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self._in_flight = {}
+        self._results = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        threading.Thread(target=self._run, name="hl7-outbound", daemon=True).start()
+
+    def wake(self):
+        self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._in_flight)
+
+    def _run(self):
+        while True:
+            self._wake.wait(POLL_INTERVAL)
+            self._wake.clear()
+            try:
+                self.dispatch()
+            except Exception:
+                log.exception("HL7 outbound dispatch failed")
+
+    def _acknowledged(self, message_control_id, future):
+        # Runs on the sender's reader thread; recorded by the next dispatch pass
+        error = future.exception()
+        with self._lock:
+            self._results.append((message_control_id, str(error) if error else None))
+        self.wake()
+
+    def dispatch(self):
+        # Record the ACKs received since the last pass, renew this worker's
+        # claims, then claim and send the next message of each idle case
+        now = time.time()
+        with self._lock:
+            results, self._results = self._results, []
+        connection = connect_db(SCHEMA, self.path)
+        with connection:
+            acked_at = datetime.now().isoformat(timespec="seconds")
+            connection.executemany(
+                "UPDATE hl7_outbox SET status = ?, acked_at = ?, error = ?, claimed_until = 0 WHERE control_id = ?",
+                [(FAILED if error else SENT, acked_at, error or "", message_control_id)
+                 for message_control_id, error in results]
+            )
+            connection.execute(
+                "UPDATE hl7_outbox SET claimed_until = ? WHERE claimed_by = ? AND status = ?",
+                (now + LEASE, self.worker, PENDING)
+            )
+        with self._lock:
+            for message_control_id, _ in results:
+                self._in_flight.pop(message_control_id, None)
+            busy = set(self._in_flight.values())
+            room = MAX_IN_FLIGHT - len(self._in_flight)
+        # Bare columns of a MIN() aggregate come from the row holding the minimum
+        candidates = [
+            row for row in connection.execute(
+                f"""SELECT control_id, organ, case_id, MIN(version), claimed_by, claimed_until FROM hl7_outbox
+                    WHERE status = '{PENDING}' GROUP BY organ, case_id"""
+            )
+            if (row["organ"], row["case_id"]) not in busy
+            and (row["claimed_until"] < now or row["claimed_by"] == self.worker)
+        ][:room]
+        claimed = []
+        with connection:
+            for row in candidates:
+                claim = connection.execute(
+                    """UPDATE hl7_outbox SET claimed_by = ?, claimed_until = ?
+                       WHERE control_id = ? AND status = ? AND (claimed_until < ? OR claimed_by = ?) RETURNING message""",
+                    (self.worker, now + LEASE, row["control_id"], PENDING, now, self.worker)
+                ).fetchone()
+                if claim:
+                    claimed.append((row, claim["message"]))
+        connection.close()
+        for row, message in claimed:
+            with self._lock:
+                self._in_flight[row["control_id"]] = (row["organ"], row["case_id"])
+            self.sender.send(message).add_done_callback(partial(self._acknowledged, row["control_id"]))
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def dispatcher():
+    # The process-wide dispatcher, or None when the interface is not enabled
+    global _dispatcher
+    if not configured():
+        return None
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            host, _, port = os.environ["CHECKLIST_HL7_OUTBOUND"].rpartition(":")
+            _dispatcher = Dispatcher(host or "localhost", int(port))
+    return _dispatcher
+
+
+def send_queued():
+    # Start sending what is queued (after a sign-out commits, or when an app starts)
+    current = dispatcher()
+    if current:
+        current.wake()
+
+
+def outbox_counts(connection):
+    return dict(connection.execute("SELECT status, COUNT(*) FROM hl7_outbox GROUP BY status").fetchall())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send queued HL7 results to the LIS/EHR")
+    parser.add_argument("--retry-failed", action="store_true", help="queue rejected messages again")
+    parser.add_argument("--drain", action="store_true", help="send what is pending, then exit")
+    args = parser.parse_args()
+    connection = connect_db(SCHEMA)
+    if args.retry_failed:
+        with connection:
+            connection.execute("UPDATE hl7_outbox SET status = ?, error = '' WHERE status = ?", (PENDING, FAILED))
+    if args.drain:
+        current = dispatcher()
+        if current is None:
+            parser.error("set CHECKLIST_HL7_OUTBOUND=host:port first")
+        current.wake()
+        while outbox_counts(connection).get(PENDING):
+            time.sleep(0.5)
+    print(outbox_counts(connection))
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+from collections import namedtuple
+
+import numpy as np
+import streamlit as st
+
+# IHC-based kidney subtype suggestions. Each row gives the expected fraction
+# of tumors of a subtype that stain positive for each marker (CD10, CK7,
+# vimentin, PAX8, RCC marker), summarized from the usual WHO / ISUP
+# references. The log-likelihood matrices are built once per process; a
+# recorded profile is scored against every subtype in one matrix product.
+MARKERS = ("cd10", "ck7", "vimentin", "pax8", "rcc")
+
+EXPRESSION = (
+    # histologic checkbox key, label, expected positivity per marker
+    ("clear_cell_rcc", "Clear cell renal cell carcinoma", (0.95, 0.10, 0.90, 0.95, 0.80)),
+    ("papillary_rcc", "Papillary renal cell carcinoma", (0.70, 0.85, 0.85, 0.95, 0.90)),
+    ("chromophobe_rcc", "Chromophobe renal cell carcinoma", (0.25, 0.90, 0.05, 0.85, 0.30)),
+    ("other_oncocytic", "Other oncocytic tumors (oncocytoma)", (0.20, 0.15, 0.05, 0.95, 0.10)),
+    ("clear_cell_papillary", "Clear cell papillary renal cell tumor", (0.10, 0.98, 0.90, 0.95, 0.10)),
+    ("collecting_duct", "Collecting duct carcinoma", (0.30, 0.70, 0.85, 0.90, 0.10)),
+    ("mucinous_tubular", "Mucinous tubular and spindle renal cell carcinoma", (0.20, 0.90, 0.80, 0.95, 0.40)),
+    ("tfe3_rearranged", "TFE3-rearranged renal cell carcinoma", (0.90, 0.10, 0.50, 0.90, 0.80)),
+    ("fh_deficient", "Fumarate hydratase-deficient renal cell carcinoma", (0.60, 0.10, 0.70, 0.90, 0.30))
+)
+
+SUBTYPE_KEYS = tuple(key for key, _, _ in EXPRESSION)
+SUBTYPE_LABELS = {key: label for key, label, _ in EXPRESSION}
+
+INTENSITY_WEIGHTS = {"Weak": 0.5, "Moderate": 0.8, "Strong": 1.0}
+# Positive in at least this percentage of tumor cells counts as diffuse
+DIFFUSE_PERCENT = 50.0
+
+_expected = np.clip(np.array([row for _, _, row in EXPRESSION]), 0.02, 0.98)
+LOG_POSITIVE = np.log(_expected)
+LOG_NEGATIVE = np.log(1 - _expected)
+
+Suggestion = namedtuple("Suggestion", "key label probability")
+
+
+def marker_profile(values):
+    # Form values -> (staining strength 0..1 per marker, marker recorded mask)
+    strength = np.zeros(len(MARKERS))
+    recorded = np.zeros(len(MARKERS), dtype=bool)
+    for i, marker in enumerate(MARKERS):
+        result = values.get(f"{marker}_result")
+        if not values.get(f"{marker}_antibody") or result not in ("Positive", "Negative"):
+            continue
+        recorded[i] = True
+        if result == "Positive":
+            # Missing intensity / percentage are read as strong / diffuse
+            intensity = INTENSITY_WEIGHTS.get(values.get(f"{marker}_intensity"), 1.0)
+            percentage = float(values.get(f"{marker}_percentage") or 0)
+            extent = min(percentage / DIFFUSE_PERCENT, 1.0) if percentage > 0 else 1.0
+            strength[i] = intensity * extent
+    return strength, recorded
+
+
+def score_profiles(strength, recorded):
+    # Vectorized: (cases x markers) strengths and recorded masks -> (cases x subtypes)
+    # posterior probabilities under a uniform prior; cases with nothing recorded get 0
+    strength = np.atleast_2d(strength)
+    recorded = np.atleast_2d(recorded)
+    positive = np.where(recorded, strength, 0.0)
+    negative = np.where(recorded, 1 - strength, 0.0)
+    log_likelihood = positive @ LOG_POSITIVE.T + negative @ LOG_NEGATIVE.T
+    log_likelihood -= log_likelihood.max(axis=1, keepdims=True)
+    probabilities = np.exp(log_likelihood)
+    probabilities /= probabilities.sum(axis=1, keepdims=True)
+    return np.where(recorded.any(axis=1, keepdims=True), probabilities, 0.0)
+
+
+def rank_subtypes(values, limit=3):
+    # Ranked suggestions for one form; empty until at least one marker result is recorded
+    strength, recorded = marker_profile(values)
+    if not recorded.any():
+        return []
+    probabilities = score_profiles(strength, recorded)[0]
+    order = np.argsort(probabilities)[::-1][:limit]
+    return [Suggestion(SUBTYPE_KEYS[i], SUBTYPE_LABELS[SUBTYPE_KEYS[i]], float(probabilities[i])) for i in order]
+
+
+def _check_subtype(key):
+    st.session_state[key] = True
+
+
+def ihc_suggestions():
+    # Kidney IHC section: subtypes most consistent with the recorded profile
+    suggestions = rank_subtypes(st.session_state)
+    if not suggestions:
+        return
+    with st.expander("🔬 Subtypes consistent with the IHC profile", expanded=True):
+        for suggestion in suggestions:
+            col1, col2 = st.columns([4, 1])
+            with col1:
+                st.markdown(f"**{suggestion.label}** — {suggestion.probability:.0%}")
+                st.progress(suggestion.probability)
+            with col2:
+                if not st.session_state.get(suggestion.key):
+                    st.button("Check", key=f"use_ihc_{suggestion.key}", on_click=_check_subtype, args=(suggestion.key,))
+        st.caption("Decision support only: relative fit of the five recorded markers, not a diagnosis.")
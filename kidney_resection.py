@@ -2,6 +2,18 @@ import streamlit as st
 import json
 from datetime import datetime
 
+from cases import case_form_rendered, case_sidebar, resume_session, sign_out_button
+from completeness import completeness_navigator, missing_required
+from derivation import derivation_panel
+from ihc_profile import ihc_suggestions
+from orders import prefill_from_order, resolve_order_procedure
+from presets import presets_sidebar
+from prognosis import FORMULA_VERSION, leibovich, leibovich_score
+from quick_entry import quick_entry_bar
+from reveal_group import apply_reveal_commits, reveal_group
+from stage_groups import stage_group_for
+from validation import inline_warnings, report_allowed, update_validation, validation_summary
+
 # Set page config
 st.set_page_config(
     page_title="Kidney Tumor Pathology Reporting Checklist",
@@ -49,6 +61,25 @@ def main():
     if 'form_data' not in st.session_state:
         st.session_state.form_data = {}
     
+    # Resume this browser session's state after a replica switch or restart (optional session store)
+    resume_session("kidney")
+    # Checkbox groups' last commits, so everything below reads this run's answers
+    apply_reveal_commits()
+
+    # Prefill case summary fields from an LIS order (?order=... or the order-drop folder)
+    prefill_from_order("kidney")
+    case_sidebar("kidney")
+    
+    # One-click presets and personal macros (applied before any widget renders)
+    presets_sidebar("kidney")
+    
+    # Consistency rules; only rules reading keys changed since the last run are re-checked
+    update_validation("kidney")
+    
+    # Required-element completeness, kept as a bitmask and shown as a sidebar navigator
+    # (filled in once the form has rendered)
+    navigator = st.sidebar.container()
+    
     # ========== CASE SUMMARY SECTION ==========
     st.markdown('<div class="section-header"><h2>📋 CASE SUMMARY</h2></div>', unsafe_allow_html=True)
     st.markdown("**(KIDNEY: Nephrectomy)**")
@@ -66,7 +97,7 @@ def main():
     clinical_diagnosis = st.text_input("Clinical Diagnosis:", key="clinical_diagnosis")
     
     # ========== SPECIMEN SECTION ==========
-    st.markdown('<div class="section-header"><h2>🧪 SPECIMEN</h2></div>', unsafe_allow_html=True)
+    st.markdown('<div class="section-header" id="specimen"><h2>🧪 SPECIMEN</h2></div>', unsafe_allow_html=True)
     
     st.markdown('<div class="subsection"><h4>Procedure</h4></div>', unsafe_allow_html=True)
     procedure_options = [
@@ -76,6 +107,7 @@ def main():
         "Other",
         "Not specified"
     ]
+    resolve_order_procedure(procedure_options)
     procedure = st.selectbox("Select procedure:", [""] + procedure_options, key="procedure")
     if procedure == "Other":
         procedure_other = st.text_input("Specify other procedure:", key="procedure_other")
@@ -105,7 +137,8 @@ def main():
             kidney_height = st.number_input("Height (cm):", min_value=0.0, step=0.1, key="kidney_height")
     
     # ========== TUMOR SECTION ==========
-    st.markdown('<div class="section-header"><h2>🎯 TUMOR</h2></div>', unsafe_allow_html=True)
+    st.markdown('<div class="section-header" id="tumor"><h2>🎯 TUMOR</h2></div>', unsafe_allow_html=True)
+    inline_warnings("kidney", "tumor")
     
     # Tumor Focality
     st.markdown('<div class="subsection"><h4>Tumor Focality</h4></div>', unsafe_allow_html=True)
@@ -305,7 +338,7 @@ def main():
     tumor_comment = st.text_area("Tumor Comment:", key="tumor_comment")
     
     # ========== MARGINS SECTION ==========
-    st.markdown('<div class="section-header"><h2>📏 MARGINS</h2></div>', unsafe_allow_html=True)
+    st.markdown('<div class="section-header" id="margins"><h2>📏 MARGINS</h2></div>', unsafe_allow_html=True)
     
     # Margin Status
     st.markdown('<div class="subsection"><h4>Margin Status</h4></div>', unsafe_allow_html=True)
@@ -320,55 +353,28 @@ def main():
         st.write("**Margin(s) Involved by Invasive Carcinoma (select all that apply):**")
         st.info("For partial nephrectomy only")
         
-        col1, col2 = st.columns(2)
-        with col1:
-            renal_parenchymal_margin = st.checkbox("Renal parenchymal", key="margin_renal_parenchymal")
-            if renal_parenchymal_margin:
-                renal_parenchymal_detail = st.text_input("Distance (mm):", key="renal_parenchymal_detail")
-            
-            renal_capsular_margin = st.checkbox("Renal capsular", key="margin_renal_capsular")
-            if renal_capsular_margin:
-                renal_capsular_detail = st.text_input("Distance (mm):", key="renal_capsular_detail")
-            
-            renal_sinus_margin = st.checkbox("Renal sinus soft tissue", key="margin_renal_sinus")
-            if renal_sinus_margin:
-                renal_sinus_detail = st.text_input("Distance (mm):", key="renal_sinus_detail")
-            
-            renal_hilar_margin = st.checkbox("Renal hilar soft tissue", key="margin_renal_hilar")
-            if renal_hilar_margin:
-                renal_hilar_detail = st.text_input("Distance (mm):", key="renal_hilar_detail")
-        
-        with col2:
-            renal_vein_margin = st.checkbox("Renal vein (tumor invades or is adherent to vein wall at margin)", key="margin_renal_vein")
-            if renal_vein_margin:
-                renal_vein_detail = st.text_input("Details:", key="renal_vein_detail")
-            
-            ureteral_margin = st.checkbox("Ureteral", key="margin_ureteral")
-            if ureteral_margin:
-                ureteral_detail = st.text_input("Distance (mm):", key="ureteral_detail")
-            
-            perinephric_fat_margin = st.checkbox("Perinephric fat", key="margin_perinephric_fat")
-            if perinephric_fat_margin:
-                perinephric_fat_detail = st.text_input("Distance (mm):", key="perinephric_fat_detail")
-            
-            gerota_fascia_margin = st.checkbox("Gerota's fascia", key="margin_gerota_fascia")
-            if gerota_fascia_margin:
-                gerota_fascia_detail = st.text_input("Distance (mm):", key="gerota_fascia_detail")
-    
-    margin_other = st.checkbox("Other", key="margin_other")
-    if margin_other:
-        margin_other_detail = st.text_input("Specify other margin:", key="margin_other_detail")
-    
-    margin_cannot_determine = st.checkbox("Cannot be determined", key="margin_cannot_determine")
-    if margin_cannot_determine:
-        margin_explain = st.text_input("Explain:", key="margin_explain")
-    
-    margin_not_applicable = st.checkbox("Not applicable", key="margin_not_applicable")
+        reveal_group([
+            ("margin_renal_parenchymal", "Renal parenchymal", "renal_parenchymal_detail", "Distance (mm):"),
+            ("margin_renal_capsular", "Renal capsular", "renal_capsular_detail", "Distance (mm):"),
+            ("margin_renal_sinus", "Renal sinus soft tissue", "renal_sinus_detail", "Distance (mm):"),
+            ("margin_renal_hilar", "Renal hilar soft tissue", "renal_hilar_detail", "Distance (mm):"),
+            ("margin_renal_vein", "Renal vein (tumor invades or is adherent to vein wall at margin)", "renal_vein_detail", "Details:"),
+            ("margin_ureteral", "Ureteral", "ureteral_detail", "Distance (mm):"),
+            ("margin_perinephric_fat", "Perinephric fat", "perinephric_fat_detail", "Distance (mm):"),
+            ("margin_gerota_fascia", "Gerota's fascia", "gerota_fascia_detail", "Distance (mm):")
+        ], key="involved_margin_group", columns=2)
+    
+    reveal_group([
+        ("margin_other", "Other", "margin_other_detail", "Specify other margin:"),
+        ("margin_cannot_determine", "Cannot be determined", "margin_explain", "Explain:"),
+        ("margin_not_applicable", "Not applicable")
+    ], key="margin_extra_group")
     
     margin_comment = st.text_area("Margin Comment:", key="margin_comment")
     
     # ========== REGIONAL LYMPH NODES SECTION ==========
-    st.markdown('<div class="section-header"><h2>🔗 REGIONAL LYMPH NODES</h2></div>', unsafe_allow_html=True)
+    st.markdown('<div class="section-header" id="lymph_nodes"><h2>🔗 REGIONAL LYMPH NODES</h2></div>', unsafe_allow_html=True)
+    inline_warnings("kidney", "lymph_nodes")
     
     # Regional Lymph Node Status
     st.markdown('<div class="subsection"><h4>Regional Lymph Node Status</h4></div>', unsafe_allow_html=True)
@@ -406,45 +412,17 @@ def main():
             
             # Nodal Site(s) with Tumor
             st.write("**Nodal Site(s) with Tumor (select all that apply):**")
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                hilar_nodes = st.checkbox("Hilar", key="node_hilar")
-                if hilar_nodes:
-                    hilar_detail = st.text_input("Hilar node details:", key="hilar_detail")
-                
-                precaval_nodes = st.checkbox("Precaval", key="node_precaval")
-                if precaval_nodes:
-                    precaval_detail = st.text_input("Precaval node details:", key="precaval_detail")
-                
-                interaortocaval_nodes = st.checkbox("Interaortocaval", key="node_interaortocaval")
-                if interaortocaval_nodes:
-                    interaortocaval_detail = st.text_input("Interaortocaval node details:", key="interaortocaval_detail")
-                
-                paracaval_nodes = st.checkbox("Paracaval", key="node_paracaval")
-                if paracaval_nodes:
-                    paracaval_detail = st.text_input("Paracaval node details:", key="paracaval_detail")
-            
-            with col2:
-                retrocaval_nodes = st.checkbox("Retrocaval", key="node_retrocaval")
-                if retrocaval_nodes:
-                    retrocaval_detail = st.text_input("Retrocaval node details:", key="retrocaval_detail")
-                
-                preaortic_nodes = st.checkbox("Preaortic", key="node_preaortic")
-                if preaortic_nodes:
-                    preaortic_detail = st.text_input("Preaortic node details:", key="preaortic_detail")
-                
-                paraaortic_nodes = st.checkbox("Paraaortic", key="node_paraaortic")
-                if paraaortic_nodes:
-                    paraaortic_detail = st.text_input("Paraaortic node details:", key="paraaortic_detail")
-                
-                retroaortic_nodes = st.checkbox("Retroaortic", key="node_retroaortic")
-                if retroaortic_nodes:
-                    retroaortic_detail = st.text_input("Retroaortic node details:", key="retroaortic_detail")
-            
-            other_nodal_site = st.checkbox("Other", key="node_other")
-            if other_nodal_site:
-                other_nodal_detail = st.text_input("Specify other nodal site:", key="other_nodal_detail")
+            reveal_group([
+                ("node_hilar", "Hilar", "hilar_detail", "Hilar node details:"),
+                ("node_precaval", "Precaval", "precaval_detail", "Precaval node details:"),
+                ("node_interaortocaval", "Interaortocaval", "interaortocaval_detail", "Interaortocaval node details:"),
+                ("node_paracaval", "Paracaval", "paracaval_detail", "Paracaval node details:"),
+                ("node_retrocaval", "Retrocaval", "retrocaval_detail", "Retrocaval node details:"),
+                ("node_preaortic", "Preaortic", "preaortic_detail", "Preaortic node details:"),
+                ("node_paraaortic", "Paraaortic", "paraaortic_detail", "Paraaortic node details:"),
+                ("node_retroaortic", "Retroaortic", "retroaortic_detail", "Retroaortic node details:"),
+                ("node_other", "Other", "other_nodal_detail", "Specify other nodal site:")
+            ], key="nodal_site_group", columns=2)
             
             # Size of Largest Nodal Metastatic Deposit
             st.write("**Size of Largest Nodal Metastatic Deposit:**")
@@ -502,21 +480,19 @@ def main():
     
     # ========== DISTANT METASTASIS SECTION ==========
     st.markdown('<div class="section-header"><h2>🎯 DISTANT METASTASIS</h2></div>', unsafe_allow_html=True)
+    inline_warnings("kidney", "distant_metastasis")
     
     st.markdown('<div class="subsection"><h4>Distant Site(s) Involved, if applicable</h4></div>', unsafe_allow_html=True)
     
-    dm_not_applicable = st.checkbox("Not applicable", key="dm_not_applicable")
-    
-    dm_specify = st.checkbox("Specify site(s)", key="dm_specify")
-    if dm_specify:
-        dm_sites = st.text_area("Specify distant metastasis sites:", key="dm_sites")
-    
-    dm_cannot_determine = st.checkbox("Cannot be determined", key="dm_cannot_determine")
-    if dm_cannot_determine:
-        dm_explain = st.text_input("Explain:", key="dm_explain")
+    reveal_group([
+        ("dm_not_applicable", "Not applicable"),
+        ("dm_specify", "Specify site(s)", "dm_sites", "Specify distant metastasis sites:"),
+        ("dm_cannot_determine", "Cannot be determined", "dm_explain", "Explain:")
+    ], key="dm_group")
     
     # ========== pTNM CLASSIFICATION SECTION ==========
-    st.markdown('<div class="section-header"><h2>📊 pTNM CLASSIFICATION (AJCC 8th Edition)</h2></div>', unsafe_allow_html=True)
+    st.markdown('<div class="section-header" id="ptnm"><h2>📊 pTNM CLASSIFICATION (AJCC 8th Edition)</h2></div>', unsafe_allow_html=True)
+    inline_warnings("kidney", "ptnm")
     
     st.info("Reporting of pT, pN, and (when applicable) pM categories is based on information available to the pathologist at the time the report is issued. As per the AJCC (Chapter 1, 8th Ed.) it is the managing physician's responsibility to establish the final pathologic stage based upon all pertinent information, including but potentially not limited to this pathology report.")
     
@@ -569,6 +545,9 @@ def main():
     
     pn_category = st.selectbox("pN Category:", [""] + pn_options, key="pn_category")
     
+    # pT / pN suggested from the findings above, with disagreement flags
+    derivation_panel("kidney", pt_options, pn_options)
+    
     # pM Category
     st.markdown('<div class="subsection"><h4>pM Category (required only if confirmed pathologically)</h4></div>', unsafe_allow_html=True)
     
@@ -579,37 +558,29 @@ def main():
     
     pm_category = st.selectbox("pM Category:", [""] + pm_options, key="pm_category")
     
+    # AJCC prognostic stage group from pT / pN / pM
+    stage = stage_group_for("kidney", st.session_state)
+    if stage:
+        st.info(f"**AJCC Stage Group:** {stage}")
+
+    # Shorthand quick entry, resolved against the option lists above
+    quick_entry_bar("kidney", pt_options, pn_options, pm_options, grade_options)
+    
     # ========== ADDITIONAL FINDINGS SECTION ==========
     st.markdown('<div class="section-header"><h2>🔍 ADDITIONAL FINDINGS</h2></div>', unsafe_allow_html=True)
     
     st.markdown('<div class="subsection"><h4>Additional Findings in Kidney (select all that apply)</h4></div>', unsafe_allow_html=True)
     
-    additional_insufficient = st.checkbox("Insufficient tissue", key="additional_insufficient")
-    additional_no_change = st.checkbox("No significant pathologic change identified", key="additional_no_change")
-    
-    additional_glomerular = st.checkbox("Glomerular disease", key="additional_glomerular")
-    if additional_glomerular:
-        glomerular_type = st.text_input("Specify type of glomerular disease:", key="glomerular_type")
-    
-    additional_tubulointerstitial = st.checkbox("Tubulointerstitial disease", key="additional_tubulointerstitial")
-    if additional_tubulointerstitial:
-        tubulointerstitial_type = st.text_input("Specify type of tubulointerstitial disease:", key="tubulointerstitial_type")
-    
-    additional_vascular = st.checkbox("Vascular disease", key="additional_vascular")
-    if additional_vascular:
-        vascular_type = st.text_input("Specify type of vascular disease:", key="vascular_type")
-    
-    additional_cysts = st.checkbox("Cyst(s)", key="additional_cysts")
-    if additional_cysts:
-        cysts_type = st.text_input("Specify type of cyst(s):", key="cysts_type")
-    
-    additional_adenomas = st.checkbox("Papillary adenoma(s)", key="additional_adenomas")
-    if additional_adenomas:
-        adenomas_detail = st.text_input("Papillary adenoma details:", key="adenomas_detail")
-    
-    additional_other = st.checkbox("Other", key="additional_other")
-    if additional_other:
-        additional_other_detail = st.text_input("Specify other findings:", key="additional_other_detail")
+    reveal_group([
+        ("additional_insufficient", "Insufficient tissue"),
+        ("additional_no_change", "No significant pathologic change identified"),
+        ("additional_glomerular", "Glomerular disease", "glomerular_type", "Specify type of glomerular disease:"),
+        ("additional_tubulointerstitial", "Tubulointerstitial disease", "tubulointerstitial_type", "Specify type of tubulointerstitial disease:"),
+        ("additional_vascular", "Vascular disease", "vascular_type", "Specify type of vascular disease:"),
+        ("additional_cysts", "Cyst(s)", "cysts_type", "Specify type of cyst(s):"),
+        ("additional_adenomas", "Papillary adenoma(s)", "adenomas_detail", "Papillary adenoma details:"),
+        ("additional_other", "Other", "additional_other_detail", "Specify other findings:")
+    ], key="additional_group")
     
     # ========== IMMUNOHISTOCHEMISTRY SECTION ==========
     st.markdown('<div class="section-header"><h2>🧬 IMMUNOHISTOCHEMISTRY</h2></div>', unsafe_allow_html=True)
@@ -671,6 +642,7 @@ def main():
                 rcc_percentage = st.number_input("RCC %:", min_value=0.0, max_value=100.0, step=1.0, key="rcc_percentage")
         
         other_ihc = st.text_area("Other Immunohistochemistry Results:", key="other_ihc")
+        ihc_suggestions()
     
     # ========== MOLECULAR TESTING SECTION ==========
     st.markdown('<div class="section-header"><h2>🧪 MOLECULAR TESTING</h2></div>', unsafe_allow_html=True)
@@ -697,23 +669,28 @@ def main():
     
     if prognostic_assessment:
         st.markdown('<div class="subsection"><h4>Prognostic Factors</h4></div>', unsafe_allow_html=True)
+        st.caption(f"Computed from the form: {FORMULA_VERSION}")
+        
+        components, missing = leibovich(st.session_state)
         
         col1, col2 = st.columns(2)
         
         with col1:
-            tumor_size_score = st.number_input("Tumor Size Score:", min_value=0, max_value=10, key="tumor_size_score")
-            grade_score = st.number_input("Grade Score:", min_value=0, max_value=10, key="grade_score")
+            st.metric("Tumor Size Score", components["Tumor size"] if components["Tumor size"] is not None else "—")
+            st.metric("Grade Score", components["Nuclear grade"] if components["Nuclear grade"] is not None else "—")
+            st.metric("Necrosis Score", components["Tumor necrosis"] if components["Tumor necrosis"] is not None else "—")
         
         with col2:
-            stage_score = st.number_input("Stage Score:", min_value=0, max_value=10, key="stage_score")
-            overall_score = st.number_input("Overall Prognostic Score:", min_value=0, max_value=30, key="overall_score")
+            stage_points = [components["T stage"], components["N stage"]]
+            st.metric("Stage Score", sum(stage_points) if None not in stage_points else "—")
+            score = leibovich_score(st.session_state)
+            st.metric("Overall Prognostic Score", score[0] if score else "—")
+            st.metric("Risk Stratification", score[1] if score else "—")
         
-        risk_stratification_options = [
-            "Low risk",
-            "Intermediate risk", 
-            "High risk"
-        ]
-        risk_stratification = st.selectbox("Risk Stratification:", [""] + risk_stratification_options, key="risk_stratification")
+        if missing:
+            st.warning(f"Score incomplete - missing or unscorable: {', '.join(missing)}")
+        if not st.session_state.get('clear_cell_rcc'):
+            st.caption("The Leibovich score is validated for clear cell renal cell carcinoma.")
     
     # ========== COMMENTS SECTION ==========
     st.markdown('<div class="section-header"><h2>💬 COMMENTS</h2></div>', unsafe_allow_html=True)
@@ -745,9 +722,19 @@ def main():
     # ========== GENERATE REPORT SECTION ==========
     st.markdown("---")
     st.markdown("### 📋 Generate Final Report")
+    validation_summary("kidney")
+    case_form_rendered("kidney")
+    completeness_navigator("kidney", navigator)
     
     # Large Generate Report Button
     if st.button("🫘 GENERATE COMPLETE KIDNEY PATHOLOGY REPORT", type="primary", use_container_width=True):
+        if not report_allowed("kidney"):
+            st.error("❌ Report not generated: resolve or acknowledge the consistency issues above.")
+            st.stop()
+        missing = missing_required("kidney")
+        if missing:
+            st.warning(f"⚠️ {len(missing)} required element(s) missing: {', '.join(element.label for element in missing)}")
+        
         st.success("✅ Complete kidney pathology report generated successfully!")
         
         # Large Report Display Area
@@ -994,6 +981,9 @@ CASE SUMMARY (KIDNEY: Nephrectomy)
             report_content += f"pN: {st.session_state.pn_category}\n"
         if st.session_state.get('pm_category'):
             report_content += f"pM: {st.session_state.pm_category}\n"
+        stage = stage_group_for("kidney", st.session_state)
+        if stage:
+            report_content += f"Stage Group (AJCC 8th Edition): {stage}\n"
         
         # Add Additional Findings Section
         report_content += f"\nADDITIONAL FINDINGS\n"
@@ -1115,16 +1105,17 @@ CASE SUMMARY (KIDNEY: Nephrectomy)
         if st.session_state.get('prognostic_assessment'):
             report_content += f"\nPROGNOSTIC ASSESSMENT\n"
             
-            if st.session_state.get('tumor_size_score'):
-                report_content += f"Tumor Size Score: {st.session_state.tumor_size_score}\n"
-            if st.session_state.get('grade_score'):
-                report_content += f"Grade Score: {st.session_state.grade_score}\n"
-            if st.session_state.get('stage_score'):
-                report_content += f"Stage Score: {st.session_state.stage_score}\n"
-            if st.session_state.get('overall_score'):
-                report_content += f"Overall Prognostic Score: {st.session_state.overall_score}\n"
-            if st.session_state.get('risk_stratification'):
-                report_content += f"Risk Stratification: {st.session_state.risk_stratification}\n"
+            components, missing = leibovich(st.session_state)
+            for name, points in components.items():
+                if points is not None:
+                    report_content += f"{name} points: {points}\n"
+            score = leibovich_score(st.session_state)
+            if score:
+                report_content += f"Overall Prognostic Score: {score[0]}\n"
+                report_content += f"Risk Stratification: {score[1]}\n"
+            else:
+                report_content += f"Overall Prognostic Score: not calculable (missing: {', '.join(missing)})\n"
+            report_content += f"Formula: {FORMULA_VERSION}\n"
         
         # Add Final Diagnosis Section
         if st.session_state.get('final_diagnosis'):
@@ -1159,6 +1150,8 @@ CASE SUMMARY (KIDNEY: Nephrectomy)
             mime="text/plain",
             use_container_width=True
         )
+        
+        sign_out_button("kidney", report_content)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,183 @@
+import streamlit as st
+
+from presets import apply_values
+
+# One table of per-margin distances instead of ticking the closest margin(s)
+# and converting the distance by hand. Each distance is kept in mm under its
+# margin's own key; the margin(s) at the smallest distance get the
+# closest-margin flags and distance_method / distance_mm follow, so reports,
+# units.py and the exports read the same keys as before.
+MARGINS = {
+    # (closest-margin flag, label, details, distance in mm)
+    "colon": [
+        ("proximal_closest", "Proximal", "proximal_detail", "proximal_distance_mm"),
+        ("distal_closest", "Distal", "distal_detail", "distal_distance_mm"),
+        ("radial_closest", "Radial (circumferential)", "radial_detail", "radial_distance_mm"),
+        ("mesenteric_closest", "Mesenteric", "mesenteric_detail", "mesenteric_distance_mm"),
+        ("deep_closest", "Deep", "deep_detail", "deep_distance_mm"),
+        ("mucosal_closest", "Mucosal", "mucosal_detail", "mucosal_distance_mm")
+    ],
+    "ampulla": [
+        ("margin_deep", "Deep (radial)", "margin_deep_detail", "margin_deep_distance_mm"),
+        ("margin_duodenal", "Duodenal mucosal", "margin_duodenal_detail", "margin_duodenal_distance_mm"),
+        ("margin_pancreatic_duct", "Pancreatic duct", "margin_pancreatic_duct_detail", "margin_pancreatic_duct_distance_mm"),
+        ("margin_bile_duct", "Bile duct", "margin_bile_duct_detail", "margin_bile_duct_distance_mm"),
+        ("margin_pancreatic_neck", "Pancreatic neck / parenchymal", "margin_pancreatic_neck_detail",
+         "margin_pancreatic_neck_distance_mm"),
+        ("margin_uncinate", "Uncinate (retroperitoneal / SMA)", "margin_uncinate_detail", "margin_uncinate_distance_mm"),
+        ("margin_proximal", "Proximal (gastric or duodenal)", "margin_proximal_detail", "margin_proximal_distance_mm"),
+        ("margin_distal", "Distal (duodenal or jejunal)", "margin_distal_detail", "margin_distal_distance_mm")
+    ]
+}
+
+UNITS_TO_MM = {"mm": 1.0, "cm": 10.0}
+
+# distance_method answers under the table: an exact distance only comes from
+# the table, the others are for margins that were not measured
+MEASURED = "Exact distance in mm"
+DISTANCE_METHODS = {
+    "colon": [MEASURED, "Greater than 1 cm", "Greater than 10 mm", "Other", "Cannot be determined"],
+    "ampulla": [MEASURED, "Greater than 1 cm", "Greater than 10 mm", "Other", "Cannot be determined", "Not applicable"]
+}
+DISTANCE_LABELS = {MEASURED: "Exact distance (per margin, in the table above)"}
+
+# Drafts from before the table: one exact distance for the ticked margin(s)
+LEGACY_DISTANCES = {"Exact distance in cm": ("distance_cm", 10.0), MEASURED: ("distance_mm", 1.0)}
+
+
+def margin_distances(organ, values):
+    # {closest-margin flag: distance in mm} of the margins with a distance
+    return {
+        flag: values[distance_key] for flag, _, _, distance_key in MARGINS[organ]
+        if values.get(distance_key) is not None
+    }
+
+
+def closest_margin_values(organ, distances):
+    # Closest-margin flags and distance fields for the measured distances;
+    # ties are all flagged, no distances clears the flags
+    if not distances:
+        return {flag: False for flag, _, _, _ in MARGINS[organ]}
+    closest = min(distances.values())
+    values = {flag: distances.get(flag) == closest for flag, _, _, _ in MARGINS[organ]}
+    values.update({"distance_method": MEASURED, "distance_mm": closest})
+    return values
+
+
+def _table_data(organ):
+    state = st.session_state
+    margins = MARGINS[organ]
+    return {
+        "Margin": [label for _, label, _, _ in margins],
+        "Distance": [state.get(distance_key) for _, _, _, distance_key in margins],
+        "Unit": ["mm"] * len(margins),
+        "Details": [state.get(detail_key) or "" for _, _, detail_key, _ in margins]
+    }
+
+
+def _migrate_legacy_distance(organ):
+    state = st.session_state
+    if state.get("distance_method") not in LEGACY_DISTANCES or margin_distances(organ, state):
+        return
+    value_key, to_mm = LEGACY_DISTANCES[state.distance_method]
+    if not state.get(value_key):
+        return
+    distance = round(float(state[value_key]) * to_mm, 2)
+    state.pop("distance_cm", None)
+    state.distance_method = MEASURED
+    state.distance_mm = distance
+    for flag, _, _, distance_key in MARGINS[organ]:
+        if state.get(flag):
+            state[distance_key] = distance
+
+
+def _apply_distances(organ, key):
+    # Edits are relative to the data the editor was given; every stored distance is in mm
+    state = st.session_state
+    edited_rows = state[key].get("edited_rows", {})
+    data = state.get("_margin_table_data") or _table_data(organ)
+    distances = {}
+    values = {}
+    reset = False
+    for row, (flag, _, detail_key, distance_key) in enumerate(MARGINS[organ]):
+        edits = edited_rows.get(row, edited_rows.get(str(row), {}))
+        if "Distance" in edits:
+            # Only a distance typed in this edit is in the row's unit
+            distance = edits["Distance"]
+            if distance is not None:
+                distance = round(float(distance) * UNITS_TO_MM[edits.get("Unit") or data["Unit"][row]], 2)
+        else:
+            # A unit picked for a stored distance would show it as cm; the editor is reset
+            distance = data["Distance"][row]
+            reset = reset or ("Unit" in edits and distance is not None)
+        if distance is not None:
+            distances[flag] = values[distance_key] = distance
+        detail = edits.get("Details", data["Details"][row]) or ""
+        if detail or state.get(detail_key):
+            values[detail_key] = detail
+    values.update(closest_margin_values(organ, distances))
+    apply_values("Margin distances", values)
+    # Cleared distances are dropped, and with the last one the exact distance
+    for _, _, _, distance_key in MARGINS[organ]:
+        if distance_key not in values:
+            state.pop(distance_key, None)
+    if not distances:
+        state.pop("distance_mm", None)
+        if state.get("distance_method") == MEASURED:
+            del state["distance_method"]
+    state._margin_table_data = _table_data(organ)
+    if reset:
+        state._margin_table_generation = state.get("_margin_table_generation", 0) + 1
+
+
+def margin_distance_table(organ, key="margin_distance_table"):
+    state = st.session_state
+    _migrate_legacy_distance(organ)
+    # Answers set elsewhere (a draft, a preset, another session) start a fresh
+    # editor, which would otherwise keep showing its own earlier edits
+    data = _table_data(organ)
+    if data != state.get("_margin_table_data"):
+        state._margin_table_generation = state.get("_margin_table_generation", 0) + 1
+        state._margin_table_data = data
+    editor_key = f"{key}_{state._margin_table_generation}"
+    st.data_editor(
+        data,
+        key=editor_key,
+        hide_index=True,
+        width="stretch",
+        on_change=_apply_distances,
+        args=(organ, editor_key),
+        column_config={
+            "Margin": st.column_config.TextColumn(disabled=True),
+            "Distance": st.column_config.NumberColumn(min_value=0.0, step=0.1),
+            "Unit": st.column_config.SelectboxColumn(options=list(UNITS_TO_MM), required=True),
+            "Details": st.column_config.TextColumn()
+        }
+    )
+    labels = {flag: label for flag, label, _, _ in MARGINS[organ]}
+    names = ", ".join(labels[flag] for flag in labels if state.get(flag))
+    if names and margin_distances(organ, state):
+        st.caption(f"Closest: {names} at {state.distance_mm:g} mm")
+    elif names:
+        st.caption(f"Closest (no distances entered): {names}")
+    elif state.get("distance_method") == MEASURED and state.get("distance_mm"):
+        st.caption(f"Distance to closest margin: {state.distance_mm:g} mm, margin not recorded; enter it in the table")
+
+
+def closest_distance_method(organ):
+    # The distance_method radio: fixed to the table's exact distance while it has one
+    return st.radio(
+        "Distance from invasive carcinoma to closest margin:",
+        DISTANCE_METHODS[organ],
+        format_func=lambda option: DISTANCE_LABELS.get(option, option),
+        key="distance_method",
+        disabled=bool(margin_distances(organ, st.session_state))
+    )
+
+
+def margin_distance_lines(organ):
+    # Report lines listing every measured margin, closest first
+    distances = margin_distances(organ, st.session_state)
+    labels = {flag: label for flag, label, _, _ in MARGINS[organ]}
+    ordered = sorted(distances.items(), key=lambda item: item[1])
+    return "".join(f"  Distance to {labels[margin]} margin: {distance:g} mm\n" for margin, distance in ordered)
@@ -0,0 +1,294 @@
+import argparse
+import queue
+import random
+import socket
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from hl7 import ack_message, field, parse_ack, parse_message
+
+# MLLP, the TCP framing of HL7 v2: every message is sent as
+# <VT> message <FS><CR> and the receiver answers each one with an ACK on the
+# same connection.
+START_BLOCK = b"\x0b"
+END_BLOCK = b"\x1c\r"
+RECV_SIZE = 65536
+
+# Outbound defaults: persistent connections per receiver, messages awaiting
+# an ACK per connection, frames coalesced into one write, seconds without an
+# ACK before a connection is considered dead, resends after an AE NACK
+CONNECTIONS = 2
+WINDOW = 32
+BATCH = 16
+ACK_TIMEOUT = 30
+RETRIES = 5
+BACKOFF = 0.5
+MAX_BACKOFF = 30
+
+
+def frame(message):
+    return START_BLOCK + message.encode("utf-8") + END_BLOCK
+
+
+class FrameReader:
+    # Incremental decoder: feed() the bytes as they arrive, get back the complete messages
+    def __init__(self):
+        self._buffer = bytearray()
+        self._scanned = 0
+
+    def feed(self, data):
+        self._buffer += data
+        messages = []
+        while True:
+            end = self._buffer.find(END_BLOCK, max(self._scanned - 1, 0))
+            if end < 0:
+                self._scanned = len(self._buffer)
+                return messages
+            start = self._buffer.find(START_BLOCK, 0, end)
+            if start >= 0:
+                messages.append(self._buffer[start + 1:end].decode("utf-8", "replace"))
+            # Bytes outside a frame are dropped
+            del self._buffer[:end + len(END_BLOCK)]
+            self._scanned = 0
+
+
+class NackError(Exception):
+    def __init__(self, code, text):
+        super().__init__(f"{code or 'no ACK'}: {text}")
+        self.code = code
+
+
+class _Pending:
+    def __init__(self, control_id, data):
+        self.control_id = control_id
+        self.data = data
+        self.future = Future()
+        self.attempts = 0
+
+
+class _Channel:
+    # One persistent connection: a writer thread pipelines queued messages (up to
+    # the window without an ACK) and a reader thread matches ACKs to them by
+    # MSA-2. A dropped or silent connection is closed and whatever was still
+    # awaiting an ACK goes back to the queue for any connection to resend.
+    def __init__(self, sender, number):
+        self.sender = sender
+        self.sock = None
+        self.in_flight = OrderedDict()
+        self.lock = threading.Lock()
+        self.slots = threading.Semaphore(sender.window)
+        self.failures = 0
+        threading.Thread(target=self._write_loop, name=f"mllp-writer-{number}", daemon=True).start()
+
+    def _connect(self):
+        sock = socket.create_connection(self.sender.address, timeout=self.sender.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.lock:
+            self.sock = sock
+        threading.Thread(target=self._read_loop, args=(sock,), name="mllp-reader", daemon=True).start()
+
+    def _take(self):
+        # Block for one message, then batch whatever else is queued while the window allows
+        self.slots.acquire()
+        pending = self.sender.queue.get()
+        if pending is None:
+            self.slots.release()
+            return None
+        batch = [pending]
+        while len(batch) < self.sender.batch and self.slots.acquire(blocking=False):
+            try:
+                pending = self.sender.queue.get_nowait()
+            except queue.Empty:
+                pending = None
+            if pending is None:
+                self.slots.release()
+                break
+            batch.append(pending)
+        return batch
+
+    def _give_back(self, batch):
+        for pending in batch:
+            self.slots.release()
+            self.sender.queue.put(pending)
+
+    def _write_loop(self):
+        while not self.sender.closed:
+            batch = self._take()
+            if batch is None:
+                return
+            if self.sock is None:
+                try:
+                    self._connect()
+                    self.failures = 0
+                except OSError:
+                    self._give_back(batch)
+                    self.failures += 1
+                    time.sleep(min(self.sender.backoff * 2 ** self.failures, MAX_BACKOFF))
+                    continue
+            with self.lock:
+                sock = self.sock
+                if sock is not None:
+                    for pending in batch:
+                        self.in_flight[pending.control_id] = pending
+            if sock is None:
+                self._give_back(batch)
+                continue
+            try:
+                sock.sendall(b"".join(pending.data for pending in batch))
+            except OSError:
+                self._reset(sock)
+
+    def _read_loop(self, sock):
+        reader = FrameReader()
+        while True:
+            try:
+                data = sock.recv(RECV_SIZE)
+            except socket.timeout:
+                with self.lock:
+                    stalled = self.sock is not sock or bool(self.in_flight)
+                if stalled:
+                    break
+                continue
+            except OSError:
+                break
+            if not data:
+                break
+            for message in reader.feed(data):
+                self._acknowledged(message)
+        self._reset(sock)
+
+    def _acknowledged(self, message):
+        code, control_id, text = parse_ack(message)
+        with self.lock:
+            pending = self.in_flight.pop(control_id, None)
+        if pending is None:
+            return
+        self.slots.release()
+        if code in ("AA", "CA"):
+            pending.future.set_result(message)
+        elif code in ("AE", "CE") and pending.attempts < self.sender.retries:
+            # AE: the receiver could not process it now; AR (rejected) is never resent unchanged
+            pending.attempts += 1
+            self.sender.retry_later(pending, min(self.sender.backoff * 2 ** (pending.attempts - 1), MAX_BACKOFF))
+        else:
+            pending.future.set_exception(NackError(code, text))
+
+    def _reset(self, sock):
+        with self.lock:
+            current = self.sock is sock
+            if current:
+                self.sock = None
+                lost, self.in_flight = list(self.in_flight.values()), OrderedDict()
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+        if current:
+            self._give_back(lost)
+
+    def close(self):
+        sock = self.sock
+        if sock is not None:
+            self._reset(sock)
+
+
+class MLLPSender:
+    # Pooled, pipelining MLLP client for one receiver. send() only queues the
+    # message; under load each connection writes up to `batch` queued frames
+    # at once and keeps up to `window` of them awaiting an ACK, so throughput
+    # is not bound by the round trip of each message.
+    def __init__(self, host, port, connections=CONNECTIONS, window=WINDOW, batch=BATCH, timeout=ACK_TIMEOUT,
+                 retries=RETRIES, backoff=BACKOFF):
+        self.address = (host, port)
+        self.window = window
+        self.batch = batch
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.queue = queue.Queue()
+        self.closed = False
+        self._channels = [_Channel(self, number) for number in range(connections)]
+
+    def send(self, message):
+        # Future of the message's ACK text; fails with NackError when rejected or out of retries
+        pending = _Pending(field(parse_message(message.split("\r", 1)[0])[0], 10), frame(message))
+        self.queue.put(pending)
+        return pending.future
+
+    def retry_later(self, pending, delay):
+        timer = threading.Timer(delay, self.queue.put, (pending,))
+        timer.daemon = True
+        timer.start()
+
+    def close(self):
+        self.closed = True
+        for channel in self._channels:
+            self.queue.put(None)
+            channel.close()
+
+
+class _MLLPHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        reader = FrameReader()
+        while True:
+            try:
+                data = self.request.recv(RECV_SIZE)
+            except OSError:
+                return
+            if not data:
+                return
+            messages = reader.feed(data)
+            if not messages:
+                continue
+            try:
+                answers = self.server.handler(messages)
+            except Exception as error:
+                answers = [("AE", str(error))] * len(messages)
+            # Pipelined messages are acknowledged in one write, in arrival order
+            try:
+                self.request.sendall(b"".join(
+                    frame(ack_message(message, code, text)) for message, (code, text) in zip(messages, answers)
+                ))
+            except OSError:
+                return
+
+
+class MLLPServer(socketserver.ThreadingTCPServer):
+    # MLLP listener. handler(messages) gets the messages that arrived together
+    # on a connection and returns an (acknowledgment code, text) per message:
+    # "AA" accepted, "AE" error (the sender may resend) or "AR" rejected. An
+    # exception is answered with AE for all of them.
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, handler):
+        self.handler = handler
+        super().__init__(address, _MLLPHandler)
+
+
+def main():
+    # Local stand-in for the LIS/EHR receiver, for testing the outbound interface
+    parser = argparse.ArgumentParser(description="Accept HL7 messages over MLLP and acknowledge them")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2575)
+    parser.add_argument("--nack-rate", type=float, default=0.0, help="share of messages answered with AE")
+    parser.add_argument("--quiet", action="store_true", help="do not print the received messages")
+    args = parser.parse_args()
+
+    def handler(messages):
+        if not args.quiet:
+            for message in messages:
+                print(message.replace("\r", "\n"))
+        return [("AE" if random.random() < args.nack_rate else "AA", "") for _ in messages]
+
+    with MLLPServer((args.host, args.port), handler) as server:
+        print(f"Listening for MLLP on {args.host}:{args.port}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
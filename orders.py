@@ -0,0 +1,144 @@
+import json
+import os
+from datetime import date, datetime
+
+import streamlit as st
+
+from storage import data_path
+
+# Order prefill. An order reference arrives either as URL query parameters
+# (?order=S25-01234 or ?case_id=...&patient_name=...) or as a JSON file the LIS
+# drops into <data dir>/orders/<reference>.json. Known case summary fields are
+# written to session state at the top of main(), before any widget renders.
+ORDER_DIR = "orders"
+
+ORDER_FIELDS = {
+    "colon": ["case_id", "patient_name", "date_of_procedure", "pathologist", "procedure"],
+    "ampulla": ["case_id", "patient_name", "date_of_procedure", "pathologist", "procedure"],
+    "kidney": ["case_id", "patient_name", "date_of_procedure", "pathologist", "procedure",
+               "age", "gender", "clinical_diagnosis", "laterality"],
+    "hcc": ["case_id", "patient_name", "date_of_procedure", "pathologist", "procedure"]
+}
+
+# HCC records the procedure as checkboxes rather than a selectbox
+HCC_PROCEDURES = {
+    "wedge resection": "wedge_resection",
+    "partial hepatectomy, major (3 segments or more)": "partial_major",
+    "partial hepatectomy, minor (less than 3 segments)": "partial_minor",
+    "partial hepatectomy (not otherwise specified)": "partial_nos",
+    "partial hepatectomy": "partial_nos",
+    "total hepatectomy": "total_hepatectomy",
+    "not specified": "procedure_not_specified"
+}
+
+GENDERS = {"m": "Male", "male": "Male", "f": "Female", "female": "Female"}
+LATERALITIES = {"r": "Right", "right": "Right", "l": "Left", "left": "Left"}
+
+
+def order_path(reference):
+    # Keep the reference from escaping the drop directory
+    return data_path(ORDER_DIR, os.path.basename(reference) + ".json")
+
+
+def load_order(reference):
+    path = order_path(reference)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_order(reference, fields):
+    path = order_path(reference)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(fields, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+def parse_date(value):
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    for fmt in ("%Y-%m-%d", "%Y%m%d", "%Y%m%d%H%M%S", "%Y%m%d%H%M", "%m/%d/%Y"):
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+
+def normalize_order(organ, fields):
+    # Convert raw order values to what the widgets accept; unknown values are dropped
+    values = {}
+    for key in ORDER_FIELDS[organ]:
+        value = fields.get(key)
+        if value in (None, ""):
+            continue
+        if key == "date_of_procedure":
+            value = parse_date(value)
+        elif key == "age":
+            try:
+                value = int(float(value))
+            except (ValueError, OverflowError):
+                value = None
+            if value is not None and not 0 <= value <= 120:
+                value = None
+        elif key == "gender":
+            value = GENDERS.get(str(value).strip().lower())
+        elif key == "laterality":
+            value = LATERALITIES.get(str(value).strip().lower())
+        else:
+            value = str(value).strip()
+        if value not in (None, ""):
+            values[key] = value
+    return values
+
+
+def procedure_values(organ, procedure):
+    # Session keys recording an ordered procedure
+    if organ == "hcc":
+        key = HCC_PROCEDURES.get(procedure.lower())
+        return {key: True} if key else {"procedure_other": True, "procedure_other_specify": procedure}
+    # Matched against the app's option list right before the selectbox renders
+    return {"_order_procedure": procedure}
+
+
+def _apply_procedure(organ, procedure):
+    for key, value in procedure_values(organ, procedure).items():
+        st.session_state[key] = value
+
+
+def prefill_from_order(organ):
+    params = st.query_params.to_dict()
+    reference = params.get("order") or params.get("case_id")
+    if not reference or st.session_state.get("_order_loaded") == reference:
+        return
+    # Order file first, explicit query parameters override it
+    fields = load_order(reference)
+    fields.update({key: value for key, value in params.items() if key in ORDER_FIELDS[organ]})
+    values = normalize_order(organ, fields)
+    procedure = values.pop("procedure", None)
+    for key, value in values.items():
+        st.session_state[key] = value
+    if procedure:
+        _apply_procedure(organ, procedure)
+    st.session_state._order_loaded = reference
+
+
+def _procedure_name(text):
+    return text.split(" (")[0].strip().lower()
+
+
+def resolve_order_procedure(procedure_options):
+    procedure = st.session_state.pop("_order_procedure", None)
+    if not procedure:
+        return
+    # Exact name first, then the name without its parenthetical ("Pancreaticoduodenectomy (Whipple)")
+    matches = [option for option in procedure_options if option.lower() == procedure.lower()] or \
+        [option for option in procedure_options if _procedure_name(option) == _procedure_name(procedure)]
+    if matches:
+        st.session_state.procedure = matches[0]
+    else:
+        st.session_state.procedure = "Other"
+        st.session_state.procedure_other = procedure
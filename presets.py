@@ -0,0 +1,137 @@
+import streamlit as st
+
+from user_prefs import load_prefs, save_pref
+
+# Organ-specific one-click presets. Values must be valid options of the widgets
+# they target; checkbox groups are written through their per-option keys.
+NEGATIVE_MARGINS = "All margins negative for invasive carcinoma"
+NODES_PRESENT = "Regional lymph nodes present"
+NODES_NEGATIVE = "All regional lymph nodes negative for tumor"
+
+PRESETS = {
+    "colon": {
+        "Negative resection": {
+            "margin_status": NEGATIVE_MARGINS,
+            "non_invasive_status": "All margins negative for high-grade dysplasia / intramucosal carcinoma and low-grade dysplasia",
+            "ln_status": NODES_PRESENT,
+            "ln_tumor_status": NODES_NEGATIVE,
+            "tumor_deposits": "Not identified",
+            "dm_not_applicable": True,
+            "lvi_not_identified": True,
+            "lvi_small": False,
+            "lvi_large_intramural": False,
+            "lvi_large_extramural": False,
+            "lvi_present_nos": False,
+            "pni": "Not identified"
+        }
+    },
+    "ampulla": {
+        "Negative resection": {
+            "margin_status": NEGATIVE_MARGINS,
+            "dysplasia_status": "All margins negative for high-grade dysplasia and / or high-grade intraepithelial neoplasia",
+            "ln_status": NODES_PRESENT,
+            "ln_tumor_status": NODES_NEGATIVE,
+            "dm_not_applicable": True,
+            "lvi": "Not identified",
+            "pni": "Not identified"
+        }
+    },
+    "kidney": {
+        "Negative resection": {
+            "margin_status": NEGATIVE_MARGINS,
+            "ln_status": NODES_PRESENT,
+            "ln_tumor_status": NODES_NEGATIVE,
+            "dm_not_applicable": True,
+            "vascular_invasion": "Not identified"
+        },
+        "Negative resection, no nodes": {
+            "margin_status": NEGATIVE_MARGINS,
+            "ln_status": "Not applicable (no regional lymph nodes submitted or found)",
+            "dm_not_applicable": True,
+            "vascular_invasion": "Not identified"
+        }
+    },
+    "hcc": {
+        "Negative resection (tumor 1)": {
+            "margin_status": NEGATIVE_MARGINS,
+            "ln_status": "Not applicable (no regional lymph nodes submitted or found)",
+            "dm_not_applicable": True,
+            "vascular_not_identified_0": True,
+            "vascular_small_0": False,
+            "vascular_large_0": False,
+            "vascular_present_nos_0": False,
+            "pni_0": "Not identified"
+        }
+    }
+}
+
+# Case-specific fields and app plumbing that must never end up in a macro
+MACRO_EXCLUDED_KEYS = {
+    "case_id", "patient_name", "date_of_procedure", "pathologist", "age", "gender",
+    "clinical_diagnosis", "form_data", "final_report", "batch_entry", "quick_entry",
+    "validation_override"
+}
+MACRO_EXCLUDED_PREFIXES = ("_", "FormSubmitter:", "preset_", "macro_")
+
+
+def apply_values(name, values):
+    changes = []
+    for key, value in values.items():
+        old = st.session_state.get(key)
+        if old != value:
+            changes.append((key, old, value))
+        st.session_state[key] = value
+    st.session_state._preset_diff = (name, changes)
+
+
+def _capture_macro(organ):
+    name = st.session_state.get("macro_name", "").strip()
+    if not name:
+        return
+    values = {}
+    for key, value in st.session_state.items():
+        if key in MACRO_EXCLUDED_KEYS or key.startswith(MACRO_EXCLUDED_PREFIXES):
+            continue
+        # Only filled-in scalar answers; component group values and dates are skipped
+        if isinstance(value, bool) or isinstance(value, (int, float, str)):
+            if value not in (False, "", 0, 0.0):
+                values[key] = value
+    macros = load_prefs().get("macros", {})
+    macros.setdefault(organ, {})[name] = values
+    save_pref("macros", macros)
+    st.session_state.macro_name = ""
+
+
+def _delete_macro(organ, name):
+    macros = load_prefs().get("macros", {})
+    macros.get(organ, {}).pop(name, None)
+    save_pref("macros", macros)
+
+
+def presets_sidebar(organ):
+    with st.sidebar:
+        st.markdown("### ⚡ Presets")
+        for name, values in PRESETS.get(organ, {}).items():
+            st.button(name, key=f"preset_{name}", on_click=apply_values, args=(name, values), use_container_width=True)
+
+        st.markdown("### 🧩 My Macros")
+        macros = load_prefs().get("macros", {}).get(organ, {})
+        if macros:
+            choice = st.selectbox("Macro:", list(macros), key="macro_choice")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.button("Apply", key="macro_apply", on_click=apply_values, args=(choice, macros[choice]), use_container_width=True)
+            with col2:
+                st.button("Delete", key="macro_delete", on_click=_delete_macro, args=(organ, choice), use_container_width=True)
+        st.text_input("New macro name:", key="macro_name")
+        st.button("Save current form as macro", key="macro_save", on_click=_capture_macro, args=(organ,), use_container_width=True)
+
+        # Diff of the last preset / macro application
+        if st.session_state.get("_preset_diff"):
+            name, changes = st.session_state._preset_diff
+            with st.expander(f"Applied: {name} ({len(changes)} changed)", expanded=True):
+                if changes:
+                    for key, old, new in changes:
+                        st.markdown(f"- `{key}`: {old if old not in (None, '') else '—'} → **{new}**")
+                else:
+                    st.write("Nothing changed.")
@@ -0,0 +1,80 @@
+import numpy as np
+
+from derivation import option_label
+
+# Computed RCC prognostic score: Leibovich et al., Cancer 2003;97:1663-71
+# (progression to metastasis after nephrectomy for clear cell RCC). Points
+# tables are shared by the single-case path and the vectorized cohort path.
+FORMULA_VERSION = "Leibovich 2003 (clear cell RCC, metastasis-free survival), v1"
+
+T_POINTS = {
+    "pT1a": 0, "pT1b": 2,
+    "pT2": 3, "pT2a": 3, "pT2b": 3,
+    "pT3": 4, "pT3a": 4, "pT3b": 4, "pT3c": 4, "pT4": 4
+}
+N_POINTS = {"pN0": 0, "pN not assigned": 0, "pN1": 2}
+GRADE_POINTS = {"G1": 0, "G2": 0, "G3": 1, "G4": 3}
+RISK_GROUPS = ((2, "Low risk"), (5, "Intermediate risk"), (None, "High risk"))
+RISK_LABELS = np.array(["", "Low risk", "Intermediate risk", "High risk"])
+
+
+def _size_points(size_cm):
+    return 1 if size_cm >= 10 else 0
+
+
+def risk_group(total):
+    for upper, label in RISK_GROUPS:
+        if upper is None or total <= upper:
+            return label
+
+
+def leibovich(values):
+    # Returns (component points, missing input labels)
+    grade = option_label(values.get("grade") or "")
+    if values.get("sarcomatoid_present"):
+        # Sarcomatoid differentiation is grade 4 by definition
+        grade = "G4"
+    size = float(values.get("greatest_dimension") or 0)
+    necrosis = values.get("necrosis")
+    components = {
+        "T stage": T_POINTS.get(option_label(values.get("pt_category") or "")),
+        "N stage": N_POINTS.get(option_label(values.get("pn_category") or "")),
+        "Tumor size": _size_points(size) if size > 0 else None,
+        "Nuclear grade": GRADE_POINTS.get(grade),
+        "Tumor necrosis": {"Present": 1, "Not identified": 0}.get(necrosis)
+    }
+    missing = [name for name, points in components.items() if points is None]
+    return components, missing
+
+
+def leibovich_score(values):
+    # Total and risk group, or None when any input is missing
+    components, missing = leibovich(values)
+    if missing:
+        return None
+    total = sum(components.values())
+    return total, risk_group(total)
+
+
+def _lookup(table, labels):
+    # Category labels -> points; unknown labels -> -1
+    unique, inverse = np.unique(np.asarray(labels, dtype=str), return_inverse=True)
+    return np.array([table.get(label, -1) for label in unique], dtype=np.int16)[inverse]
+
+
+def leibovich_cohort(pt, pn, size_cm, grade, necrosis, sarcomatoid=None):
+    # Vectorized scoring of a whole archive. pt / pn / grade are category labels
+    # ("pT1b", "pN0", "G3"), size_cm floats, necrosis / sarcomatoid booleans.
+    # Returns (totals, risk labels); unscorable cases get -1 and "".
+    t_points = _lookup(T_POINTS, pt)
+    n_points = _lookup(N_POINTS, pn)
+    g_points = _lookup(GRADE_POINTS, grade)
+    if sarcomatoid is not None:
+        g_points = np.where(np.asarray(sarcomatoid, dtype=bool), GRADE_POINTS["G4"], g_points)
+    size_cm = np.asarray(size_cm, dtype=float)
+    s_points = np.where(size_cm >= 10, 1, 0)
+    totals = t_points + n_points + g_points + s_points + np.asarray(necrosis, dtype=np.int16)
+    valid = (t_points >= 0) & (n_points >= 0) & (g_points >= 0) & (size_cm > 0)
+    totals = np.where(valid, totals, -1)
+    risk = np.select([~valid, totals <= 2, totals <= 5], [0, 1, 2], default=3)
+    return totals, RISK_LABELS[risk]
@@ -0,0 +1,209 @@
+import re
+
+import streamlit as st
+
+from derivation import option_label
+from presets import NEGATIVE_MARGINS, NODES_NEGATIVE, NODES_PRESENT, apply_values
+
+# Shorthand quick entry, e.g. "pT3 pN1b G2 LVI+ PNI- 14/3 R0". TNM and grade
+# tokens are resolved against the option lists of the calling app, so a token
+# can only ever select an option the checklist actually offers.
+TNM_TOKEN = re.compile(r"^(y|r|yr|ry)?p?([tnm])(is|x|[0-4])([a-d])?$")
+GRADE_TOKEN = re.compile(r"^g([1-4x])$")
+FLAG_TOKEN = re.compile(r"^(lvi|pni)(\+|-|pos|neg)$")
+NODES_TOKEN = re.compile(r"^(\d+)/(\d+)$")
+MARGIN_TOKEN = re.compile(r"^r([0-2x])$")
+
+POSITIVE_MARGIN = "Invasive carcinoma present at margin"
+NODES_TUMOR_PRESENT = "Tumor present in regional lymph node(s)"
+
+LVI_VALUES = {
+    "colon": {
+        "+": {"lvi_present_nos": True, "lvi_not_identified": False, "lvi_cannot_determine": False},
+        "-": {"lvi_not_identified": True, "lvi_small": False, "lvi_large_intramural": False,
+              "lvi_large_extramural": False, "lvi_present_nos": False, "lvi_cannot_determine": False}
+    },
+    "ampulla": {"+": {"lvi": "Present"}, "-": {"lvi": "Not identified"}},
+    "kidney": {"+": {"vascular_invasion": "Present"}, "-": {"vascular_invasion": "Not identified"}},
+    "hcc": {
+        "+": {"vascular_present_nos_0": True, "vascular_not_identified_0": False, "vascular_cannot_0": False},
+        "-": {"vascular_not_identified_0": True, "vascular_small_0": False, "vascular_large_0": False,
+              "vascular_present_nos_0": False, "vascular_cannot_0": False}
+    }
+}
+
+PNI_VALUES = {
+    "colon": {"+": {"pni": "Present"}, "-": {"pni": "Not identified"}},
+    "ampulla": {"+": {"pni": "Present"}, "-": {"pni": "Not identified"}},
+    "hcc": {"+": {"pni_0": "Present"}, "-": {"pni_0": "Not identified"}}
+}
+
+# Organs whose margin widget offers "Cannot be determined"
+MARGIN_CANNOT_DETERMINE = {"colon", "ampulla", "hcc"}
+
+# Key prefix of the y / r descriptor checkboxes and their "Not applicable" box
+TNM_MODIFIERS = {
+    "colon": "modified",
+    "ampulla": "modified",
+    "kidney": "modified",
+    "hcc": "tnm"
+}
+
+
+def _option_code(option):
+    return option_label(option).lower()
+
+
+def _match_category(prefix, code, sub, options, flags, token):
+    if code == "x":
+        matches = [o for o in options if o.lower().startswith(f"{prefix} not assigned (cannot")]
+        if matches:
+            return matches[0]
+        flags.append(f"`{token}`: no '{prefix.upper()}X' option in this checklist")
+        return None
+    label = f"{prefix}{code}{sub or ''}"
+    exact = [o for o in options if _option_code(o) == label and "subcategory" not in o]
+    if exact:
+        return exact[0]
+    general = [o for o in options if _option_code(o) == label]
+    if general and not sub:
+        subs = sorted({option_label(o) for o in options if _option_code(o).startswith(label) and _option_code(o) != label})
+        flags.append(f"`{token}`: subcategory not given ({', '.join(subs)}); recorded as subcategory cannot be determined")
+        return general[0]
+    flags.append(f"`{token}`: not a category of this checklist")
+    return None
+
+
+def parse_shorthand(text, organ, options):
+    # Returns ({session key: value}, [flag messages]); nothing is written here
+    values = {}
+    sources = {}
+    conflicts = set()
+    flags = []
+    nodes = None
+
+    def put(key, value, token):
+        if key in values and values[key] != value:
+            flags.append(f"`{token}` conflicts with `{sources[key]}`; neither applied")
+            conflicts.add(key)
+        values[key] = value
+        sources[key] = token
+
+    for token in re.split(r"[\s,;]+", text.strip()):
+        if not token:
+            continue
+        lowered = token.lower()
+
+        match = TNM_TOKEN.match(lowered)
+        if match:
+            modifiers, axis, code, sub = match.groups()
+            if axis == "m" and code in ("0", "x"):
+                flags.append(f"`{token}`: pM is only recorded when metastasis is confirmed; pM left as not applicable")
+                put("pm_category", options["m"][0], token)
+                continue
+            option = _match_category(f"p{axis}", code, sub, options[axis], flags, token)
+            if option:
+                put(f"p{axis}_category", option, token)
+            if modifiers:
+                prefix = TNM_MODIFIERS[organ]
+                put(f"{prefix}_not_applicable", False, token)
+                for modifier in modifiers:
+                    put(f"{prefix}_{modifier}", True, token)
+            continue
+
+        match = GRADE_TOKEN.match(lowered)
+        if match:
+            code = match.group(1)
+            grades = [o for o in options["grade"] if _option_code(o) == f"g{code}"]
+            if grades:
+                put("grade", grades[0], token)
+            else:
+                flags.append(f"`{token}`: not a grade of this checklist")
+            continue
+
+        match = FLAG_TOKEN.match(lowered)
+        if match:
+            kind, sign = match.groups()
+            sign = "+" if sign in ("+", "pos") else "-"
+            table = (LVI_VALUES if kind == "lvi" else PNI_VALUES).get(organ)
+            if table is None:
+                flags.append(f"`{token}`: not recorded in this checklist")
+                continue
+            for key, value in table[sign].items():
+                put(key, value, token)
+            if organ == "hcc" and st.session_state.get("num_tumors", 1) > 1:
+                flags.append(f"`{token}`: applied to tumor 1 only")
+            continue
+
+        match = NODES_TOKEN.match(lowered)
+        if match:
+            first, second = int(match.group(1)), int(match.group(2))
+            # Both "14/3" and "3/14" are in use; the larger number is the total examined
+            positive, examined = min(first, second), max(first, second)
+            nodes = positive
+            put("ln_status", NODES_PRESENT, token)
+            put("ln_examined_method", "Exact number", token)
+            put("ln_examined_exact", examined, token)
+            if positive:
+                put("ln_tumor_status", NODES_TUMOR_PRESENT, token)
+                put("ln_positive_method", "Exact number", token)
+                put("ln_positive_exact", positive, token)
+            else:
+                put("ln_tumor_status", NODES_NEGATIVE, token)
+            continue
+
+        match = MARGIN_TOKEN.match(lowered)
+        if match:
+            code = match.group(1)
+            if code == "0":
+                put("margin_status", NEGATIVE_MARGINS, token)
+            elif code == "x":
+                if organ in MARGIN_CANNOT_DETERMINE:
+                    put("margin_status", "Cannot be determined", token)
+                else:
+                    flags.append(f"`{token}`: margin status cannot be recorded as undetermined here")
+            else:
+                put("margin_status", POSITIVE_MARGIN, token)
+                if code == "2":
+                    flags.append(f"`{token}`: recorded as carcinoma present at margin; note gross residual tumor in the margin comment")
+            continue
+
+        flags.append(f"`{token}`: not recognized")
+
+    for key in conflicts:
+        values.pop(key)
+
+    # Node count against the pN category, when both were typed
+    pn = values.get("pn_category", "")
+    if nodes is not None and pn:
+        if pn.startswith("pN0") and nodes > 0:
+            flags.append(f"pN0 entered with {nodes} positive node(s)")
+        elif re.match(r"pN[12]", pn) and not pn.startswith("pN1c") and nodes == 0:
+            flags.append(f"{option_label(pn)} entered with no positive nodes")
+
+    return values, flags
+
+
+def _apply_shorthand(organ, options):
+    text = st.session_state.get("quick_entry", "")
+    if not text.strip():
+        return
+    values, flags = parse_shorthand(text, organ, options)
+    apply_values(f"Quick entry: {text.strip()}", values)
+    st.session_state._quick_entry_flags = flags
+
+
+def quick_entry_bar(organ, pt_options, pn_options, pm_options, grade_options):
+    options = {"t": pt_options, "n": pn_options, "m": pm_options, "grade": grade_options}
+    with st.sidebar:
+        st.markdown("### ⌨️ Quick Entry")
+        st.text_input(
+            "Shorthand:",
+            key="quick_entry",
+            placeholder="pT3 pN1b G2 LVI+ PNI- 14/3 R0",
+            on_change=_apply_shorthand,
+            args=(organ, options),
+            help="TNM, grade (G1-G4, GX), LVI+/-, PNI+/-, positive/examined nodes and R0/R1/R2/RX. Press Enter to fill in the checklist."
+        )
+        for flag in st.session_state.get("_quick_entry_flags", []):
+            st.warning(flag)
@@ -0,0 +1,193 @@
+import gzip
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+from collections import Counter
+
+from segment_store import SegmentStore
+from storage import DATA_DIR, data_path
+
+# Signed-out report archive. Reports of one organ repeat the same headings,
+# option strings and disclaimer paragraphs, which per-report compression has
+# to spell out again every time. Each organ gets a preset deflate dictionary
+# trained on the lines its reports share; every report is still its own zlib
+# stream and decodes alone. The stream header carries the Adler-32 id of the
+# dictionary it needs (RFC 1950 FDICT), so retraining never breaks old entries.
+# Archived reports live in an append-only segment store keyed "organ/case_id",
+# the compressed report as text and the answered fields (JSON) as payload.
+# zlib can only reference the last 32 KiB, so that is all a dictionary can use
+MAX_DICTIONARY = 32 * 1024
+LEVEL = 9
+
+_dictionaries = {}
+_store = None
+
+
+def archive_store():
+    # One store per process; superseded (amended) records are compacted away hourly
+    global _store
+    if _store is None:
+        _store = SegmentStore(os.path.join(DATA_DIR, "archive_segments"))
+        _store.start_compaction()
+    return _store
+
+
+def _dictionary_path(organ, dictionary_id=None):
+    name = f"{organ}-{dictionary_id:08x}.zdict" if dictionary_id is not None else f"{organ}.current"
+    return data_path("archive_dictionaries", name)
+
+
+def train_dictionary(reports, min_share=0.2):
+    # Lines found in at least `min_share` of the sample reports, most common
+    # last (closest to the data, cheapest to reference), capped at 32 KiB
+    counts = Counter()
+    for report in reports:
+        counts.update(set(report.splitlines(keepends=True)))
+    threshold = max(2, min_share * len(reports))
+    common = [line for line, count in sorted(counts.items(), key=lambda item: (item[1], len(item[0]))) if count >= threshold]
+    dictionary = "".join(common).encode("utf-8")
+    return dictionary[-MAX_DICTIONARY:]
+
+
+def save_dictionary(organ, dictionary):
+    # Stored under its id (old streams keep decoding) and made current for new ones
+    dictionary_id = zlib.adler32(dictionary)
+    path = _dictionary_path(organ, dictionary_id)
+    with open(path + ".tmp", "wb") as f:
+        f.write(dictionary)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+    tmp_path = _dictionary_path(organ) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(f"{dictionary_id:08x}")
+    os.replace(tmp_path, _dictionary_path(organ))
+    _dictionaries[(organ, dictionary_id)] = dictionary
+    _dictionaries.pop((organ, None), None)
+    return dictionary_id
+
+
+def _dictionary(organ, dictionary_id=None):
+    # Cached per process; dictionary_id None -> the current one (b"" if none trained yet)
+    key = (organ, dictionary_id)
+    if key not in _dictionaries:
+        if dictionary_id is None:
+            path = _dictionary_path(organ)
+            if not os.path.exists(path):
+                return b""
+            with open(path, encoding="utf-8") as f:
+                _dictionaries[key] = _dictionary(organ, int(f.read(), 16))
+        else:
+            with open(_dictionary_path(organ, dictionary_id), "rb") as f:
+                _dictionaries[key] = f.read()
+    return _dictionaries[key]
+
+
+def compress_report(organ, report, dictionary=None):
+    dictionary = _dictionary(organ) if dictionary is None else dictionary
+    compressor = zlib.compressobj(LEVEL, zdict=dictionary) if dictionary else zlib.compressobj(LEVEL)
+    return compressor.compress(report.encode("utf-8")) + compressor.flush()
+
+
+def decompress_report(organ, blob, dictionary=None):
+    if blob[1] & 0x20:
+        # FDICT: the 4 bytes after the header name the dictionary
+        if dictionary is None:
+            dictionary = _dictionary(organ, struct.unpack(">I", blob[2:6])[0])
+        decompressor = zlib.decompressobj(zdict=dictionary)
+    else:
+        decompressor = zlib.decompressobj()
+    return (decompressor.decompress(blob) + decompressor.flush()).decode("utf-8")
+
+
+# The first dictionary of an organ is trained automatically once enough
+# reports have been signed out; `python report_archive.py train` retrains.
+TRAIN_AFTER = 50
+TRAIN_SAMPLE = 1000
+
+# Sign-outs archived without a dictionary since this process last tried to train one
+_untrained = Counter()
+
+
+def train_from_index(connection, organ):
+    # New dictionary id, or None if there are too few reports or they share no lines
+    reports = [row[0] for row in connection.execute(
+        "SELECT report FROM reports WHERE organ = ? ORDER BY id DESC LIMIT ?", (organ, TRAIN_SAMPLE))]
+    if len(reports) < TRAIN_AFTER:
+        return None
+    dictionary = train_dictionary(reports)
+    if not dictionary:
+        return None
+    return save_dictionary(organ, dictionary)
+
+
+def archive_report(connection, organ, case_id, report, fields, archived_at):
+    # `connection` (report index) is only read to train a first dictionary,
+    # tried again every TRAIN_AFTER sign-outs rather than on each one
+    if not _dictionary(organ):
+        if _untrained[organ] % TRAIN_AFTER == 0:
+            train_from_index(connection, organ)
+        _untrained[organ] += 1
+    payload = json.dumps({"archived_at": archived_at, "fields": fields}).encode("utf-8")
+    archive_store().append(f"{organ}/{case_id}", compress_report(organ, report), payload)
+
+
+def load_archived_report(organ, case_id):
+    # (report text, {"archived_at", "fields"}) or None
+    record = archive_store().get(f"{organ}/{case_id}")
+    if record is None:
+        return None
+    blob, payload = record
+    return decompress_report(organ, blob), json.loads(payload)
+
+
+def benchmark(organ, reports, train_share=0.2):
+    # Per-report gzip vs per-organ dictionary: compression ratio and decode throughput.
+    # The dictionary is trained on the first `train_share` of the reports and measured on the rest.
+    split = max(1, int(len(reports) * train_share))
+    dictionary = train_dictionary(reports[:split])
+    sample = reports[split:] or reports
+    raw = sum(len(report.encode("utf-8")) for report in sample)
+    results = {}
+    codecs = {
+        "gzip -9": (lambda r: gzip.compress(r.encode("utf-8"), 9), lambda b: gzip.decompress(b).decode("utf-8")),
+        "zlib -9": (lambda r: compress_report(organ, r, b""), lambda b: decompress_report(organ, b, b"")),
+        "zlib -9 + zdict": (lambda r: compress_report(organ, r, dictionary), lambda b: decompress_report(organ, b, dictionary))
+    }
+    for name, (encode, decode) in codecs.items():
+        blobs = [encode(report) for report in sample]
+        started = time.perf_counter()
+        for blob in blobs:
+            decode(blob)
+        elapsed = time.perf_counter() - started
+        results[name] = {
+            "ratio": raw / sum(len(blob) for blob in blobs),
+            "decode_mb_s": raw / elapsed / 1e6,
+            "decode_reports_s": len(blobs) / elapsed
+        }
+    return len(dictionary), len(sample), results
+
+
+if __name__ == "__main__":
+    # python report_archive.py [bench|train] [organ ...] on the signed-out reports in the data directory
+    from report_index import connect as connect_index
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "bench"
+    index = connect_index()
+    for organ in sys.argv[2:] or ["colon", "ampulla", "kidney", "hcc"]:
+        if command == "train":
+            dictionary_id = train_from_index(index, organ)
+            print(f"{organ}: " + (f"dictionary {dictionary_id:08x}" if dictionary_id is not None else "not enough reports, or no lines in common"))
+            continue
+        reports = [row[0] for row in index.execute("SELECT report FROM reports WHERE organ = ? ORDER BY id", (organ,))]
+        if len(reports) < 10:
+            print(f"{organ}: {len(reports)} signed-out report(s), need at least 10")
+            continue
+        size, count, results = benchmark(organ, reports)
+        print(f"{organ}: {count} reports, {size} byte dictionary")
+        for name, result in results.items():
+            print(f"  {name:16} ratio {result['ratio']:5.2f}x  decode {result['decode_mb_s']:7.1f} MB/s"
+                  f"  {result['decode_reports_s']:9.0f} reports/s")
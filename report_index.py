@@ -0,0 +1,99 @@
+import json
+from datetime import datetime
+
+from derivation import option_label
+from report_stats import SCHEMA as STATS_SCHEMA
+from report_stats import apply_delta
+from stage_groups import stage_group_for
+from storage import connect_db
+
+# Full-text index of signed-out reports. `reports` holds one row per
+# (organ, case_id) with the latest signed-out text; `reports_fts` is an FTS5
+# table sharing its rowid, with the structured fields as separate columns so
+# queries can be field-filtered ("pt:pT3a AND sarcomatoid"). Each sign-out
+# updates them and the monthly summary (report_stats) in one transaction.
+FTS_COLUMNS = ("case_id", "organ", "pathologist", "pt", "pn", "pm", "stage", "findings", "report")
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    organ TEXT NOT NULL,
+    case_id TEXT NOT NULL,
+    pathologist TEXT NOT NULL DEFAULT '',
+    signed_out_at TEXT NOT NULL,
+    stage TEXT NOT NULL DEFAULT '',
+    report TEXT NOT NULL,
+    fields TEXT NOT NULL,
+    UNIQUE (organ, case_id)
+);
+CREATE INDEX IF NOT EXISTS reports_signed_out ON reports (signed_out_at);
+CREATE VIRTUAL TABLE IF NOT EXISTS reports_fts USING fts5({", ".join(FTS_COLUMNS)}, tokenize = 'unicode61');
+""" + STATS_SCHEMA
+
+
+def connect(path=None):
+    return connect_db(SCHEMA, path)
+
+
+def findings_text(values):
+    # Structured answers as searchable text; checked boxes contribute their key
+    lines = []
+    for key, value in values.items():
+        if value is True:
+            lines.append(key)
+        elif value not in (None, "", False):
+            lines.append(f"{key}: {value}")
+    return "\n".join(lines)
+
+
+def index_report(connection, organ, values, report, signed_out_at=None):
+    # Replace the report of (organ, case_id); a re-signed case gets a new rowid so
+    # it sorts as the newest. The caller commits.
+    signed_out_at = signed_out_at or datetime.now().isoformat(timespec="seconds")
+    stage = stage_group_for(organ, values) or ""
+    for old_rowid, old_signed_out_at, old_fields in connection.execute(
+            "DELETE FROM reports WHERE organ = ? AND case_id = ? RETURNING id, signed_out_at, fields",
+            (organ, values["case_id"])).fetchall():
+        connection.execute("DELETE FROM reports_fts WHERE rowid = ?", (old_rowid,))
+        apply_delta(connection, organ, json.loads(old_fields), old_signed_out_at, -1)
+    rowid = connection.execute(
+        """INSERT INTO reports (organ, case_id, pathologist, signed_out_at, stage, report, fields)
+           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        (organ, values["case_id"], values.get("pathologist") or "", signed_out_at, stage, report, json.dumps(values))
+    ).lastrowid
+    connection.execute(
+        f"INSERT INTO reports_fts (rowid, {', '.join(FTS_COLUMNS)}) VALUES (?{', ?' * len(FTS_COLUMNS)})",
+        (
+            rowid, values["case_id"], organ, values.get("pathologist") or "",
+            option_label(values.get("pt_category") or ""), option_label(values.get("pn_category") or ""),
+            option_label(values.get("pm_category") or ""), stage, findings_text(values), report
+        )
+    )
+    apply_delta(connection, organ, values, signed_out_at)
+    return rowid
+
+
+# Newest first walks the FTS doclists backwards and stops at `limit`, which
+# stays in the low milliseconds however many reports match; ranking by bm25
+# has to score every match first.
+ORDERINGS = {"newest": "reports_fts.rowid DESC", "relevance": "rank"}
+
+
+def search_reports(connection, query, organs=None, limit=50, order="newest"):
+    # FTS5 query syntax: phrases in quotes, AND / OR / NOT, column filters (pt:pT3a).
+    # Raises sqlite3.OperationalError on a malformed query.
+    sql = """SELECT r.id, r.organ, r.case_id, r.pathologist, r.signed_out_at, r.stage,
+                    snippet(reports_fts, -1, '**', '**', ' … ', 16) AS snippet
+             FROM reports_fts JOIN reports r ON r.id = reports_fts.rowid
+             WHERE reports_fts MATCH ?"""
+    params = [query]
+    if organs:
+        sql += f" AND r.organ IN ({', '.join('?' * len(organs))})"
+        params += list(organs)
+    sql += f" ORDER BY {ORDERINGS[order]} LIMIT ?"
+    params.append(limit)
+    return connection.execute(sql, params).fetchall()
+
+
+def load_report(connection, rowid):
+    return connection.execute("SELECT * FROM reports WHERE id = ?", (rowid,)).fetchone()
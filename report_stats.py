@@ -0,0 +1,105 @@
+import json
+from collections import Counter
+from datetime import date
+
+from derivation import option_label
+from units import normalize_values
+
+# Monthly summary of signed-out reports for the analytics page, kept next to
+# the report index. Each report contributes (month, metric, bucket) counts and
+# totals; index_report() adds them when a case is signed out and subtracts
+# the previous version's when it is re-signed, in the same transaction, so
+# the page only ever reads this table (a few rows per organ and month).
+#
+# metric      bucket                   total
+# cases       ""                       -
+# pt / pn     short category label     -
+# grade       short grade label        -
+# margin      "positive" / "negative"  -
+# node_yield  ""                       lymph nodes examined
+# turnaround  ""                       days from procedure to sign-out
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS report_stats (
+    organ TEXT NOT NULL,
+    month TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    cases INTEGER NOT NULL,
+    total REAL NOT NULL,
+    PRIMARY KEY (organ, month, metric, bucket)
+) WITHOUT ROWID;
+"""
+
+MARGIN_BUCKETS = {
+    "All margins negative for invasive carcinoma": "negative",
+    "Invasive carcinoma present at margin": "positive"
+}
+
+
+def contributions(organ, values, signed_out_at):
+    # [(month, metric, bucket, total)] of one signed-out report
+    month = signed_out_at[:7]
+    rows = [(month, "cases", "", 0.0)]
+    for metric, key in (("pt", "pt_category"), ("pn", "pn_category"), ("grade", "grade")):
+        if values.get(key):
+            rows.append((month, metric, option_label(values[key]), 0.0))
+    if values.get("margin_status") in MARGIN_BUCKETS:
+        rows.append((month, "margin", MARGIN_BUCKETS[values["margin_status"]], 0.0))
+    examined = normalize_values(organ, values).get("ln_examined")
+    if examined:
+        rows.append((month, "node_yield", "", float(examined.value)))
+    if values.get("date_of_procedure"):
+        days = (date.fromisoformat(signed_out_at[:10]) - date.fromisoformat(values["date_of_procedure"])).days
+        if days >= 0:
+            rows.append((month, "turnaround", "", float(days)))
+    return rows
+
+
+def apply_delta(connection, organ, values, signed_out_at, sign=1):
+    # Add (sign=1) or remove (sign=-1) a report's contributions; the caller commits
+    connection.executemany(
+        """INSERT INTO report_stats (organ, month, metric, bucket, cases, total) VALUES (?, ?, ?, ?, ?, ?)
+           ON CONFLICT (organ, month, metric, bucket) DO UPDATE SET
+               cases = cases + excluded.cases, total = total + excluded.total""",
+        [(organ, month, metric, bucket, sign, sign * total)
+         for month, metric, bucket, total in contributions(organ, values, signed_out_at)]
+    )
+
+
+def rebuild(connection):
+    # Recompute the whole table from the reports (first use on an existing archive)
+    cases = Counter()
+    totals = Counter()
+    for row in connection.execute("SELECT organ, signed_out_at, fields FROM reports"):
+        for month, metric, bucket, total in contributions(row["organ"], json.loads(row["fields"]), row["signed_out_at"]):
+            cases[(row["organ"], month, metric, bucket)] += 1
+            totals[(row["organ"], month, metric, bucket)] += total
+    with connection:
+        connection.execute("DELETE FROM report_stats")
+        connection.executemany(
+            "INSERT INTO report_stats (organ, month, metric, bucket, cases, total) VALUES (?, ?, ?, ?, ?, ?)",
+            [key + (count, totals[key]) for key, count in cases.items()]
+        )
+
+
+def ensure_stats(connection):
+    # Backfill once if reports were signed out before the summary existed
+    if not connection.execute("SELECT 1 FROM report_stats LIMIT 1").fetchone() \
+            and connection.execute("SELECT 1 FROM reports LIMIT 1").fetchone():
+        rebuild(connection)
+
+
+def load_stats(connection, organs, first_month, last_month):
+    # {(month, metric, bucket): (cases, total)} summed over the organs
+    placeholders = ", ".join("?" * len(organs))
+    rows = connection.execute(
+        f"""SELECT month, metric, bucket, SUM(cases), SUM(total) FROM report_stats
+            WHERE organ IN ({placeholders}) AND month BETWEEN ? AND ?
+            GROUP BY month, metric, bucket HAVING SUM(cases) > 0""",
+        list(organs) + [first_month, last_month]
+    )
+    return {(row[0], row[1], row[2]): (row[3], row[4]) for row in rows}
+
+
+def months(connection):
+    return [row[0] for row in connection.execute("SELECT DISTINCT month FROM report_stats WHERE cases > 0 ORDER BY 1")]
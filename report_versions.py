@@ -0,0 +1,184 @@
+import difflib
+import json
+
+import streamlit as st
+
+from derivation import option_label
+
+# Every sign-out of a case is a numbered version. Version 1, every
+# SNAPSHOT_EVERY-th version and any version whose delta would not be smaller
+# are stored in full; the others store what changed against the version
+# before them:
+# - fields: {"set": {key: value}, "unset": [key, ...]}
+# - report: JSON list of [start, end] (copy those lines of the previous
+#   version) and strings (new lines)
+# so an amendment costs about the size of the change. Reading a version
+# replays at most SNAPSHOT_EVERY - 1 deltas onto the snapshot before it.
+SNAPSHOT_EVERY = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS report_versions (
+    organ TEXT NOT NULL,
+    case_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    signed_out_at TEXT NOT NULL,
+    pathologist TEXT NOT NULL DEFAULT '',
+    snapshot INTEGER NOT NULL,
+    fields TEXT NOT NULL,
+    report TEXT NOT NULL,
+    PRIMARY KEY (organ, case_id, version)
+) WITHOUT ROWID;
+"""
+
+
+def field_delta(old, new):
+    return {
+        "set": {key: value for key, value in new.items() if old.get(key) != value},
+        "unset": [key for key in old if key not in new]
+    }
+
+
+def apply_field_delta(fields, delta):
+    fields = {key: value for key, value in fields.items() if key not in delta["unset"]}
+    fields.update(delta["set"])
+    return fields
+
+
+def text_delta(old, new):
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    ops = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        else:
+            ops += new_lines[j1:j2]
+    return ops
+
+
+def apply_text_delta(text, ops):
+    lines = text.splitlines(keepends=True)
+    return "".join("".join(lines[op[0]:op[1]]) if isinstance(op, list) else op for op in ops)
+
+
+def _replay(connection, organ, case_id, versions):
+    # {version: (fields, report)} of the requested versions, replaying deltas from the snapshot before the oldest
+    start = connection.execute(
+        "SELECT MAX(version) FROM report_versions WHERE organ = ? AND case_id = ? AND snapshot = 1 AND version <= ?",
+        (organ, case_id, min(versions))
+    ).fetchone()[0]
+    found = {}
+    fields, report = {}, ""
+    for row in connection.execute(
+            """SELECT version, snapshot, fields, report FROM report_versions
+               WHERE organ = ? AND case_id = ? AND version BETWEEN ? AND ? ORDER BY version""",
+            (organ, case_id, start or 0, max(versions))):
+        if row["snapshot"]:
+            fields, report = json.loads(row["fields"]), row["report"]
+        else:
+            fields = apply_field_delta(fields, json.loads(row["fields"]))
+            report = apply_text_delta(report, json.loads(row["report"]))
+        if row["version"] in versions:
+            found[row["version"]] = (fields, report)
+    return found
+
+
+def latest_version(connection, organ, case_id):
+    row = connection.execute(
+        "SELECT MAX(version) FROM report_versions WHERE organ = ? AND case_id = ?", (organ, case_id)
+    ).fetchone()
+    return row[0] or 0
+
+
+def record_version(connection, organ, values, report, signed_out_at):
+    # Store a sign-out as the next version of the case; returns its number. The caller commits.
+    case_id = values["case_id"]
+    previous = latest_version(connection, organ, case_id)
+    version = previous + 1
+    stored_fields, stored_report, snapshot = json.dumps(values), report, 1
+    if previous and previous % SNAPSHOT_EVERY:
+        old_fields, old_report = _replay(connection, organ, case_id, {previous})[previous]
+        delta_fields = json.dumps(field_delta(old_fields, values))
+        delta_report = json.dumps(text_delta(old_report, report))
+        if len(delta_fields) + len(delta_report) < len(stored_fields) + len(stored_report):
+            stored_fields, stored_report, snapshot = delta_fields, delta_report, 0
+    connection.execute(
+        """INSERT INTO report_versions (organ, case_id, version, signed_out_at, pathologist, snapshot, fields, report)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        (organ, case_id, version, signed_out_at, values.get("pathologist") or "", snapshot, stored_fields, stored_report)
+    )
+    return version
+
+
+def list_versions(connection, organ, case_id):
+    return connection.execute(
+        """SELECT version, signed_out_at, pathologist, snapshot, length(fields) + length(report) AS stored_bytes
+           FROM report_versions WHERE organ = ? AND case_id = ? ORDER BY version""",
+        (organ, case_id)
+    ).fetchall()
+
+
+def load_version(connection, organ, case_id, version):
+    # (fields, report) of one version, or None
+    return _replay(connection, organ, case_id, {version}).get(version)
+
+
+def diff_versions(connection, organ, case_id, old, new):
+    # ([(key, old value, new value)], unified diff lines of the report text)
+    found = _replay(connection, organ, case_id, {old, new})
+    (old_fields, old_report), (new_fields, new_report) = found[old], found[new]
+    changes = [(key, old_fields.get(key), new_fields.get(key))
+               for key in sorted(set(old_fields) | set(new_fields)) if old_fields.get(key) != new_fields.get(key)]
+    lines = list(difflib.unified_diff(
+        old_report.splitlines(), new_report.splitlines(), f"version {old}", f"version {new}", lineterm="", n=1
+    ))
+    return changes, lines
+
+
+def display_value(value):
+    if value is None:
+        return "—"
+    if value is True:
+        return "☑"
+    return option_label(value) if isinstance(value, str) and len(value) > 40 else str(value)
+
+
+def version_history(connection, organ, case_id, key):
+    # Amendment history of a signed-out case with a diff between any two versions
+    versions = list_versions(connection, organ, case_id)
+    if len(versions) < 2:
+        return
+    with st.expander(f"🕓 Amendment history ({len(versions)} versions)"):
+        st.dataframe(
+            {
+                "Version": [row["version"] for row in versions],
+                "Signed out": [row["signed_out_at"].replace("T", " ") for row in versions],
+                "Pathologist": [row["pathologist"] for row in versions],
+                "Stored": [("full" if row["snapshot"] else "delta") + f", {row['stored_bytes']} B" for row in versions]
+            },
+            hide_index=True,
+            width="stretch"
+        )
+        numbers = [row["version"] for row in versions]
+        col1, col2 = st.columns(2)
+        with col1:
+            old = st.selectbox("Compare version:", numbers[:-1], index=len(numbers) - 2, key=f"{key}_old")
+        with col2:
+            new = st.selectbox("With version:", [n for n in numbers if n > old], index=len([n for n in numbers if n > old]) - 1,
+                               key=f"{key}_new")
+        changes, lines = diff_versions(connection, organ, case_id, old, new)
+        if not changes and not lines:
+            st.info("No differences.")
+            return
+        if changes:
+            st.dataframe(
+                {
+                    "Field": [change[0] for change in changes],
+                    f"Version {old}": [display_value(change[1]) for change in changes],
+                    f"Version {new}": [display_value(change[2]) for change in changes]
+                },
+                hide_index=True,
+                width="stretch"
+            )
+        if lines:
+            st.code("\n".join(lines), language="diff")
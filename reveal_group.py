@@ -0,0 +1,57 @@
+import os
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+# Checkbox groups whose options reveal a "details" / "Explain:" input. The
+# show/hide happens in the browser and the whole group is sent back to Python
+# as one value, so a section costs one rerun instead of one per click.
+_reveal_group = components.declare_component(
+    "reveal_group",
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend", "reveal_group")
+)
+
+
+def _apply_commit(key, committed):
+    # Copy a commit of the group into its session keys, once per rev; afterwards
+    # the session keys are the source of truth again (presets or a loaded draft
+    # may overwrite them later). Returns the fields it set.
+    state = st.session_state
+    rev_key = f"_{key}_rev"
+    if not committed or committed.get("rev") == state.get(rev_key):
+        return {}
+    state[rev_key] = committed["rev"]
+    fields = state.get("_reveal_group_fields", {}).get(key, ())
+    applied = {field: value for field, value in committed["value"].items() if field in fields}
+    for field, value in applied.items():
+        state[field] = value
+    return applied
+
+
+def apply_reveal_commits():
+    # Call near the top of main(), before anything reads the answers: the groups
+    # rendered last run already have this run's commit, like any other widget,
+    # but would only copy it into the session keys when they render again
+    state = st.session_state
+    for key in state.get("_reveal_group_fields", {}):
+        if key in state:
+            _apply_commit(key, state[key])
+
+
+def reveal_group(items, key, columns=1):
+    # items: (checkbox_key, label) or (checkbox_key, label, detail_key, detail_label)
+    specs = []
+    current = {}
+    for item in items:
+        checkbox_key, label = item[0], item[1]
+        spec = {"key": checkbox_key, "label": label, "detail_key": None, "detail_label": None}
+        current[checkbox_key] = bool(st.session_state.get(checkbox_key, False))
+        if len(item) > 2:
+            spec["detail_key"], spec["detail_label"] = item[2], item[3]
+            current[item[2]] = str(st.session_state.get(item[2], "") or "")
+        specs.append(spec)
+
+    st.session_state.setdefault("_reveal_group_fields", {})[key] = list(current)
+    committed = _reveal_group(items=specs, value=current, columns=columns, key=key, default=None)
+    current.update(_apply_commit(key, committed))
+    return current
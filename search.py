@@ -0,0 +1,75 @@
+import sqlite3
+import time
+
+import streamlit as st
+
+from cases import connect
+from report_archive import load_archived_report
+from report_index import load_report, search_reports
+from report_versions import version_history
+
+st.set_page_config(
+    page_title="Pathology Report Search",
+    page_icon="🔎",
+    layout="wide"
+)
+
+ORGANS = {"colon": "Colon and Rectum", "ampulla": "Ampulla of Vater", "kidney": "Kidney", "hcc": "Hepatocellular Carcinoma"}
+
+
+def main():
+    st.title("🔎 Signed-Out Report Search")
+    st.markdown("**Full-text search** across all signed-out checklist reports")
+
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        query = st.text_input(
+            "Search:",
+            key="search_query",
+            placeholder='pT3a AND sarcomatoid',
+            help='Words, "quoted phrases", AND / OR / NOT, prefixes (lymphovasc*) and field filters: '
+                 "case_id:, organ:, pathologist:, pt:, pn:, pm:, stage:, findings:, report:"
+        )
+    with col2:
+        organs = st.multiselect("Organs:", list(ORGANS), format_func=ORGANS.get, key="search_organs")
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        order = st.radio("Sort:", ["newest", "relevance"], format_func=str.capitalize, horizontal=True, key="search_order")
+    with col2:
+        limit = st.select_slider("Results:", [20, 50, 100, 200], value=50, key="search_limit")
+
+    if not query.strip():
+        st.info("Enter a search to list matching signed-out reports.")
+        return
+
+    connection = connect()
+    started = time.perf_counter()
+    try:
+        rows = search_reports(connection, query, organs, limit, order)
+    except sqlite3.OperationalError as error:
+        st.error(f"Invalid search: {error}")
+        connection.close()
+        return
+    elapsed = (time.perf_counter() - started) * 1000
+    st.caption(f"{len(rows)} report(s){' (first ' + str(limit) + ')' if len(rows) == limit else ''} in {elapsed:.1f} ms")
+
+    for row in rows:
+        title = f"{row['case_id']} — {ORGANS.get(row['organ'], row['organ'])}"
+        if row["stage"]:
+            title += f" — Stage {row['stage']}"
+        with st.expander(f"{title} · signed out {row['signed_out_at']} · {row['pathologist'] or 'no pathologist'}"):
+            st.markdown(row["snippet"])
+            if st.checkbox("Show full report", key=f"show_report_{row['id']}"):
+                st.text(load_report(connection, row["id"])["report"])
+                archived = load_archived_report(row["organ"], row["case_id"])
+                if archived:
+                    st.download_button(
+                        "⬇️ Download archived copy", archived[0], file_name=f"{row['case_id']}_{row['organ']}.txt",
+                        key=f"archived_{row['id']}", help=f"Archived {archived[1]['archived_at'].replace('T', ' ')}"
+                    )
+            version_history(connection, row["organ"], row["case_id"], f"versions_{row['id']}")
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
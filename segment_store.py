@@ -0,0 +1,324 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import namedtuple
+
+# Append-only segment files for the long-term archive. Every record carries a
+# key, a text part and a payload part; the newest record of a key wins. Each
+# process keeps an in-memory key -> (segment, offset) index, built from the
+# compact .idx files of sealed segments plus a scan of the active segment's
+# tail, so a lookup is one dict hit and one slice of a memory-mapped file.
+#
+# - Appends: one writer at a time (flock), a single write + fsync per record.
+#   A record is only visible once its CRC checks, so a crash mid-append
+#   leaves a torn tail that readers skip and the next writer truncates.
+# - Readers: any number of threads / processes; refresh() picks up what other
+#   processes appended by scanning only the new bytes.
+# - Compaction: rewrites the sealed segments keeping the live record of each
+#   key, renames the result over the highest sealed segment and deletes the
+#   others. A crash at any point leaves a readable store, because the
+#   rewritten segment sorts after every input it replaces.
+MAGIC = b"SG"
+# magic, crc32 of everything after it, key / text / payload lengths
+HEADER = struct.Struct("<2sIHII")
+# .idx file: segment inode and size it describes, then one entry per record
+INDEX_HEADER = struct.Struct("<QQ")
+INDEX_ENTRY = struct.Struct("<QIH")
+
+SEGMENT_SIZE = 64 * 1024 * 1024
+
+Location = namedtuple("Location", "segment offset length")
+
+
+def _segment_name(number):
+    return f"{number:08d}.seg"
+
+
+def _index_name(number):
+    return f"{number:08d}.idx"
+
+
+def encode_record(key, text, payload):
+    key = key.encode("utf-8")
+    body = struct.pack("<HII", len(key), len(text), len(payload)) + key + text + payload
+    return MAGIC + struct.pack("<I", zlib.crc32(body)) + body
+
+
+class SegmentStore:
+    def __init__(self, directory, segment_size=SEGMENT_SIZE, sync=True):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.sync = sync
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._compactor = None
+        self._reset()
+        self.refresh()
+
+    def _reset(self):
+        self._keydir = {}
+        # segment -> (inode, bytes validated so far)
+        self._scanned = {}
+        # segment -> (inode, mmap)
+        self._maps = {}
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _segments(self):
+        numbers = sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith(".seg"))
+        segments = {}
+        for number in numbers:
+            try:
+                segments[number] = os.stat(self._path(_segment_name(number)))
+            except FileNotFoundError:
+                # Removed by a compaction since the listing
+                pass
+        return segments
+
+    def _map(self, number, inode, needed):
+        # mmap of a segment covering at least `needed` bytes; None if the file was replaced
+        mapped = self._maps.get(number)
+        if mapped and mapped[0] == inode and len(mapped[1]) >= needed:
+            return mapped[1]
+        try:
+            f = open(self._path(_segment_name(number)), "rb")
+        except FileNotFoundError:
+            return None
+        with f:
+            if os.fstat(f.fileno()).st_ino != inode:
+                return None
+            view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps[number] = (inode, view)
+        return view
+
+    def _records(self, view, start, end=None):
+        # (key, offset, length) of each complete, CRC-valid record between `start` and `end`
+        position = start
+        size = len(view) if end is None else end
+        while position + HEADER.size <= size:
+            magic, crc, key_length, text_length, payload_length = HEADER.unpack_from(view, position)
+            end = position + HEADER.size + key_length + text_length + payload_length
+            if magic != MAGIC or end > size or zlib.crc32(view[position + 6:end]) != crc:
+                return
+            key = bytes(view[position + HEADER.size:position + HEADER.size + key_length]).decode("utf-8")
+            yield key, position, end - position
+            position = end
+
+    def _load_index(self, number, stat):
+        try:
+            with open(self._path(_index_name(number)), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return False
+        if len(data) < INDEX_HEADER.size or INDEX_HEADER.unpack_from(data, 0) != (stat.st_ino, stat.st_size):
+            # Stale: the segment was rewritten after this index
+            return False
+        position = INDEX_HEADER.size
+        while position < len(data):
+            offset, length, key_length = INDEX_ENTRY.unpack_from(data, position)
+            position += INDEX_ENTRY.size
+            key = data[position:position + key_length].decode("utf-8")
+            position += key_length
+            self._index(key, Location(number, offset, length))
+        self._scanned[number] = (stat.st_ino, stat.st_size)
+        return True
+
+    def _index(self, key, location):
+        # Newest record wins: higher segment, then higher offset
+        current = self._keydir.get(key)
+        if current is None or (current.segment, current.offset) < (location.segment, location.offset):
+            self._keydir[key] = location
+
+    def refresh(self):
+        # Pick up other processes' appends and compactions
+        with self._lock:
+            while not self._refresh():
+                # A compaction replaced a segment while it was being read
+                self._reset()
+
+    def _refresh(self):
+        segments = self._segments()
+        if any(number not in segments or segments[number].st_ino != inode for number, (inode, _) in self._scanned.items()):
+            self._reset()
+        for number, stat in segments.items():
+            inode, scanned = self._scanned.get(number, (stat.st_ino, 0))
+            if scanned == stat.st_size:
+                continue
+            if scanned == 0 and self._load_index(number, stat):
+                continue
+            if stat.st_size == 0:
+                self._scanned[number] = (inode, 0)
+                continue
+            view = self._map(number, inode, stat.st_size)
+            if view is None:
+                return False
+            for key, offset, length in self._records(view, scanned, stat.st_size):
+                self._index(key, Location(number, offset, length))
+                scanned = offset + length
+            self._scanned[number] = (inode, scanned)
+        return True
+
+    def _file_lock(self, name, blocking=True):
+        handle = open(self._path(name), "a+b")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            handle.close()
+            return None
+        return handle
+
+    def append(self, key, text=b"", payload=b""):
+        record = encode_record(key, text, payload)
+        with self._lock:
+            lock = self._file_lock("write.lock")
+            try:
+                self.refresh()
+                segments = self._segments()
+                number = max(segments) if segments else 1
+                valid_end = self._scanned.get(number, (None, 0))[1]
+                path = self._path(_segment_name(number))
+                if number in segments and segments[number].st_size > valid_end:
+                    # Torn tail of a crashed append; nobody else can be writing
+                    os.truncate(path, valid_end)
+                if valid_end >= self.segment_size:
+                    self._seal(number)
+                    number += 1
+                    valid_end = 0
+                    path = self._path(_segment_name(number))
+                with open(path, "ab") as f:
+                    f.write(record)
+                    f.flush()
+                    if self.sync:
+                        os.fsync(f.fileno())
+                    inode = os.fstat(f.fileno()).st_ino
+                location = Location(number, valid_end, len(record))
+                self._index(key, location)
+                self._scanned[number] = (inode, valid_end + len(record))
+                return location
+            finally:
+                lock.close()
+
+    def _write_index(self, number, entries, size):
+        # `size` is the segment length the entries cover; a later load checks it against the file
+        inode = os.stat(self._path(_segment_name(number))).st_ino
+        data = [INDEX_HEADER.pack(inode, size)]
+        for key, offset, length in entries:
+            encoded = key.encode("utf-8")
+            data.append(INDEX_ENTRY.pack(offset, length, len(encoded)) + encoded)
+        tmp_path = self._path(_index_name(number) + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(data))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path(_index_name(number)))
+
+    def _seal(self, number):
+        # Index the bytes validated by refresh(), from a map that covers all of them:
+        # a cached map can predate the latest appends, or reach into a truncated tail
+        inode, size = self._scanned[number]
+        view = self._map(number, inode, size)
+        self._write_index(number, list(self._records(view, 0, size)), size)
+
+    def _changed(self):
+        # Two stats: has another process appended to the active segment or started a new one?
+        if not self._scanned:
+            return True
+        number = max(self._scanned)
+        inode, scanned = self._scanned[number]
+        try:
+            stat = os.stat(self._path(_segment_name(number)))
+        except FileNotFoundError:
+            return True
+        return stat.st_ino != inode or stat.st_size != scanned or os.path.exists(self._path(_segment_name(number + 1)))
+
+    def get(self, key):
+        # (text, payload) of the newest record of `key`, or None
+        with self._lock:
+            for _ in range(2):
+                if self._changed():
+                    self.refresh()
+                location = self._keydir.get(key)
+                if location is None:
+                    return None
+                inode = self._scanned[location.segment][0]
+                view = self._map(location.segment, inode, location.offset + location.length)
+                if view is None:
+                    # Replaced by a compaction in another process
+                    self._reset()
+                    self.refresh()
+                    continue
+                _, _, key_length, text_length, payload_length = HEADER.unpack_from(view, location.offset)
+                start = location.offset + HEADER.size + key_length
+                return view[start:start + text_length], view[start + text_length:start + text_length + payload_length]
+            return None
+
+    def keys(self):
+        with self._lock:
+            self.refresh()
+            return list(self._keydir)
+
+    def compact(self):
+        # Rewrite the sealed segments without superseded records; returns (bytes before, bytes after)
+        lock = self._file_lock("compact.lock", blocking=False)
+        if lock is None:
+            return None
+        try:
+            with self._lock:
+                self.refresh()
+                sealed = sorted(self._scanned)[:-1]
+                if not sealed:
+                    return None
+                before = sum(self._scanned[number][1] for number in sealed)
+                live = sorted((location, key) for key, location in self._keydir.items() if location.segment in sealed)
+                if len(sealed) == 1 and sum(location.length for location, _ in live) == before:
+                    # Already compact
+                    return None
+                views = {number: self._map(number, self._scanned[number][0], self._scanned[number][1]) for number in sealed}
+            target = sealed[-1]
+            tmp_path = self._path(_segment_name(target) + ".compact")
+            entries = []
+            with open(tmp_path, "wb") as f:
+                offset = 0
+                for location, key in live:
+                    f.write(views[location.segment][location.offset:location.offset + location.length])
+                    entries.append((key, offset, location.length))
+                    offset += location.length
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._path(_segment_name(target)))
+            self._write_index(target, entries, offset)
+            for number in sealed[:-1]:
+                for name in (_segment_name(number), _index_name(number)):
+                    if os.path.exists(self._path(name)):
+                        os.remove(self._path(name))
+            with self._lock:
+                self._reset()
+                self.refresh()
+            return before, offset
+        finally:
+            lock.close()
+
+    def start_compaction(self, interval=3600):
+        # Background thread; only one process compacts at a time (compact.lock)
+        if self._compactor:
+            return
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                self.compact()
+        self._compactor = (threading.Thread(target=run, name="segment-compaction", daemon=True), stop)
+        self._compactor[0].start()
+
+    def close(self):
+        if self._compactor:
+            self._compactor[1].set()
+            self._compactor = None
+        with self._lock:
+            for _, view in self._maps.values():
+                view.close()
+            self._reset()
@@ -0,0 +1,203 @@
+import atexit
+import json
+import os
+import re
+import threading
+import uuid
+
+import streamlit as st
+
+from storage import connect_db, data_path, log
+
+# Optional mirror of each browser session's checklist state outside the
+# Streamlit process, so replicas behind a load balancer need no sticky
+# sessions and a restarted replica loses no open case. A session is named by
+# a ?session=<token> query parameter that stays in the browser's URL; a
+# replica that sees a token it has no state for resumes from the store.
+#
+# Enabled with CHECKLIST_SESSION_STORE=sqlite or =file (local stand-ins for a
+# shared store; point CHECKLIST_DATA_DIR at shared storage). Writes are
+# write-behind: a rerun only drops its snapshot into a per-process buffer
+# that coalesces per session, and a background thread flushes the buffer in
+# one batch every FLUSH_INTERVAL seconds (and at exit). Each snapshot carries
+# a per-session sequence number and the stores keep the highest one, so a
+# late flush from a replica the user has left cannot overwrite newer state.
+FLUSH_INTERVAL = 0.5
+
+# Tokens are issued as uuid4().hex; anything else in the URL gets a new one
+TOKEN_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+def _encoded(key, state):
+    # JSON of one session's state, or None (logged) so one bad snapshot never blocks the batch
+    try:
+        return json.dumps(state)
+    except (TypeError, ValueError) as error:
+        log.error("session %s not mirrored: %s", key, error)
+        return None
+
+
+class SQLiteSessionStore:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        key TEXT PRIMARY KEY,
+        seq INTEGER NOT NULL,
+        state TEXT NOT NULL
+    ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path=None):
+        self.path = path or data_path("sessions.sqlite3")
+
+    def load(self, key):
+        connection = connect_db(self.SCHEMA, self.path)
+        row = connection.execute("SELECT seq, state FROM sessions WHERE key = ?", (key,)).fetchone()
+        connection.close()
+        return (row["seq"], json.loads(row["state"])) if row else None
+
+    def save_batch(self, batch):
+        rows = []
+        for key, (seq, state) in batch.items():
+            text = _encoded(key, state)
+            if text is not None:
+                rows.append((key, seq, text))
+        connection = connect_db(self.SCHEMA, self.path)
+        with connection:
+            connection.executemany(
+                """INSERT INTO sessions (key, seq, state) VALUES (?, ?, ?)
+                   ON CONFLICT (key) DO UPDATE SET seq = excluded.seq, state = excluded.state
+                   WHERE excluded.seq > sessions.seq""",
+                rows
+            )
+        connection.close()
+
+
+class FileSessionStore:
+    # One JSON file per session, replaced atomically
+    def __init__(self, directory=None):
+        self.directory = directory or os.path.dirname(data_path("sessions", "session.json"))
+
+    def _path(self, key):
+        return os.path.join(self.directory, key.replace(":", "-") + ".json")
+
+    def load(self, key):
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                stored = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        return stored["seq"], stored["state"]
+
+    def save_batch(self, batch):
+        for key, (seq, state) in batch.items():
+            current = self.load(key)
+            if current and current[0] >= seq:
+                continue
+            text = _encoded(key, {"seq": seq, "state": state})
+            if text is None:
+                continue
+            tmp_path = self._path(key) + f".{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(text)
+                os.replace(tmp_path, self._path(key))
+            except OSError as error:
+                log.error("session %s not mirrored: %s", key, error)
+
+
+STORES = {"sqlite": SQLiteSessionStore, "file": FileSessionStore}
+
+
+class WriteBehind:
+    def __init__(self, store, interval=FLUSH_INTERVAL):
+        self.store = store
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flushing = threading.Lock()
+        self._closed = threading.Event()
+        threading.Thread(target=self._run, name="session-write-behind", daemon=True).start()
+        atexit.register(self.close)
+
+    def put(self, key, seq, state):
+        with self._lock:
+            self._pending[key] = (seq, state)
+
+    def get(self, key):
+        # (seq, state): this replica's unflushed snapshot, else the store's
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+        return self.store.load(key)
+
+    def flush(self):
+        with self._flushing:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return
+            try:
+                self.store.save_batch(batch)
+            except Exception:
+                # Keep the snapshots for the next flush unless a newer one arrived meanwhile
+                with self._lock:
+                    for key, value in batch.items():
+                        self._pending.setdefault(key, value)
+                raise
+
+    def close(self):
+        # Stop the flush thread and write what is still pending
+        self._closed.set()
+        self.flush()
+
+    def _run(self):
+        while not self._closed.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                log.exception("session store flush failed")
+
+
+_write_behind = None
+_write_behind_lock = threading.Lock()
+
+
+def write_behind():
+    # The process-wide buffer, or None when no session store is configured
+    global _write_behind
+    backend = os.environ.get("CHECKLIST_SESSION_STORE", "")
+    if backend not in STORES:
+        return None
+    with _write_behind_lock:
+        if _write_behind is None:
+            _write_behind = WriteBehind(STORES[backend]())
+    return _write_behind
+
+
+def _session_key(organ):
+    token = st.query_params.get("session")
+    if not token or not TOKEN_PATTERN.fullmatch(token):
+        token = uuid.uuid4().hex
+        st.query_params["session"] = token
+    return f"{organ}:{token}"
+
+
+def load_session(organ):
+    # Mirrored state of this browser session, or None (no store, or a new session)
+    buffer = write_behind()
+    if buffer is None:
+        return None
+    stored = buffer.get(_session_key(organ))
+    st.session_state._session_seq = stored[0] if stored else 0
+    return stored[1] if stored else None
+
+
+def mirror_session(organ, snapshot):
+    # Queue the snapshot if it changed since this session's last one
+    buffer = write_behind()
+    state = st.session_state
+    if buffer is None or state.get("_session_mirrored") == snapshot:
+        return
+    state._session_seq = state.get("_session_seq", 0) + 1
+    state._session_mirrored = snapshot
+    buffer.put(_session_key(organ), state._session_seq, snapshot)
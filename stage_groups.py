@@ -0,0 +1,167 @@
+import numpy as np
+
+from derivation import option_label
+
+# AJCC 8th edition prognostic stage groups. The rules below are evaluated once
+# per process over every (T, N, M) code combination of an organ and frozen into
+# a dict (single cases) and a numpy int8 cube (cohort restaging by fancy
+# indexing). Codes that leave a subcategory open (pT4, pN1, pTX, ...) expand to
+# their concrete categories; a group is only assigned when all of them agree.
+NOT_STAGED = ""
+
+CONCRETE = {
+    "colon": (
+        ("pT0", "pTis", "pT1", "pT2", "pT3", "pT4a", "pT4b"),
+        ("pN0", "pN1a", "pN1b", "pN1c", "pN2a", "pN2b"),
+        ("pM0", "pM1a", "pM1b", "pM1c")
+    ),
+    "ampulla": (
+        ("pT0", "pTis", "pT1a", "pT1b", "pT2", "pT3a", "pT3b", "pT4"),
+        ("pN0", "pN1", "pN2"),
+        ("pM0", "pM1")
+    ),
+    "kidney": (
+        ("pT0", "pT1a", "pT1b", "pT2a", "pT2b", "pT3a", "pT3b", "pT3c", "pT4"),
+        ("pN0", "pN1"),
+        ("pM0", "pM1")
+    ),
+    "hcc": (
+        ("pT0", "pT1a", "pT1b", "pT2", "pT3", "pT4"),
+        ("pN0", "pN1"),
+        ("pM0", "pM1")
+    )
+}
+
+
+def _colon_stage(t, n, m):
+    if m != "pM0":
+        return {"pM1a": "IVA", "pM1b": "IVB", "pM1c": "IVC"}[m]
+    if t == "pT0":
+        return None
+    if n == "pN0":
+        return {"pTis": "0", "pT1": "I", "pT2": "I", "pT3": "IIA", "pT4a": "IIB", "pT4b": "IIC"}[t]
+    if t == "pTis":
+        return None
+    if t == "pT4b":
+        return "IIIC"
+    if n in ("pN1a", "pN1b", "pN1c"):
+        return "IIIA" if t in ("pT1", "pT2") else "IIIB"
+    if n == "pN2a":
+        return {"pT1": "IIIA", "pT2": "IIIB", "pT3": "IIIB", "pT4a": "IIIC"}[t]
+    return "IIIB" if t in ("pT1", "pT2") else "IIIC"
+
+
+def _ampulla_stage(t, n, m):
+    if m == "pM1":
+        return "IV"
+    if t == "pT0" or (t == "pTis" and n != "pN0"):
+        return None
+    if t == "pT4" or n == "pN2":
+        return "IIIB"
+    if n == "pN1":
+        return "IIIA"
+    return {"pTis": "0", "pT1a": "IA", "pT1b": "IB", "pT2": "IB", "pT3a": "IIA", "pT3b": "IIB"}[t]
+
+
+def _kidney_stage(t, n, m):
+    if m == "pM1" or t == "pT4":
+        return "IV"
+    if t == "pT0":
+        return None
+    if n == "pN1" or t.startswith("pT3"):
+        return "III"
+    return "II" if t.startswith("pT2") else "I"
+
+
+def _hcc_stage(t, n, m):
+    if m == "pM1":
+        return "IVB"
+    if n == "pN1":
+        return "IVA"
+    if t == "pT0":
+        return None
+    return {"pT1a": "IA", "pT1b": "IB", "pT2": "II", "pT3": "IIIA", "pT4": "IIIB"}[t]
+
+
+STAGE_RULES = {
+    "colon": _colon_stage,
+    "ampulla": _ampulla_stage,
+    "kidney": _kidney_stage,
+    "hcc": _hcc_stage
+}
+
+
+def _expansions(concrete, prefix):
+    # Every concrete code maps to itself; parents ("pT4", "pN1") and X map to their children
+    expansions = {code: (code,) for code in concrete}
+    for code in concrete:
+        stem = code.rstrip("abc")
+        if stem != code:
+            expansions.setdefault(stem, tuple(c for c in concrete if c.rstrip("abc") == stem))
+    # pT0 / pTis are never implied by an undetermined category
+    expansions[prefix + "X"] = tuple(c for c in concrete if c not in ("pT0", "pTis"))
+    return expansions
+
+
+def _build(organ):
+    concrete = CONCRETE[organ]
+    axes = [_expansions(codes, prefix) for codes, prefix in zip(concrete, ("pT", "pN", "pM"))]
+    rule = STAGE_RULES[organ]
+    stages = [NOT_STAGED]
+    lookup = {}
+    cube = np.zeros(tuple(len(axis) for axis in axes), dtype=np.int8)
+    for i, (t, t_codes) in enumerate(axes[0].items()):
+        for j, (n, n_codes) in enumerate(axes[1].items()):
+            for k, (m, m_codes) in enumerate(axes[2].items()):
+                groups = {rule(tc, nc, mc) for tc in t_codes for nc in n_codes for mc in m_codes}
+                stage = groups.pop() if len(groups) == 1 else None
+                if stage:
+                    if stage not in stages:
+                        stages.append(stage)
+                    cube[i, j, k] = stages.index(stage)
+                lookup[(t, n, m)] = stage
+    codes = tuple({code: index for index, code in enumerate(axis)} for axis in axes)
+    return lookup, cube, codes, np.array(stages)
+
+
+TABLES = {organ: _build(organ) for organ in CONCRETE}
+
+
+def category_code(option, axis):
+    # App option string -> table code; pM "Not applicable" is staged as M0
+    if not option:
+        return None
+    label = option_label(option)
+    if label.startswith("Not applicable") and axis == "m":
+        return "pM0"
+    if label in ("pT not assigned", "pN not assigned"):
+        return label[:2] + "X"
+    return label
+
+
+def stage_group(organ, t, n, m):
+    lookup = TABLES[organ][0]
+    return lookup.get((t, n, m))
+
+
+def stage_group_for(organ, values):
+    # Stage group from the pt/pn/pm_category options of a form or stored case
+    return stage_group(
+        organ,
+        category_code(values.get("pt_category"), "t"),
+        category_code(values.get("pn_category"), "n"),
+        category_code(values.get("pm_category") or "Not applicable", "m")
+    )
+
+
+def encode(organ, axis, codes):
+    # Category codes -> int index arrays for restage_cohort(); unknown codes raise KeyError
+    index = TABLES[organ][2]["tnm".index(axis)]
+    unique, inverse = np.unique(np.asarray(codes), return_inverse=True)
+    return np.array([index[code] for code in unique], dtype=np.intp)[inverse]
+
+
+def restage_cohort(organ, t_index, n_index, m_index):
+    # Vectorized: int index arrays (see encode) -> array of stage group strings ("" = not staged)
+    cube, stages = TABLES[organ][1], TABLES[organ][3]
+    return stages[cube[t_index, n_index, m_index]]
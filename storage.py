@@ -0,0 +1,36 @@
+import logging
+import os
+import sqlite3
+
+# Everything the checklist apps persist (preferences, drafts, archives, indexes)
+# lives under one directory so a deployment only has to mount a single volume.
+DATA_DIR = os.environ.get("CHECKLIST_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "checklist_data"))
+
+
+# Failures in the background workers (session mirroring, HL7 dispatch, order
+# ingest) have no page to show them on; they all go to this logger
+log = logging.getLogger("checklist")
+
+
+def data_path(*parts):
+    path = os.path.join(DATA_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+# Cases, signed-out reports and their search index share one SQLite database,
+# so a sign-out updates all of them in a single transaction.
+DB_FILE = "checklist.sqlite3"
+_initialized = set()
+
+
+def connect_db(schema, path=None):
+    # WAL lets readers (worklist, search) run while a sign-out writes
+    path = path or data_path(DB_FILE)
+    connection = sqlite3.connect(path, timeout=30)
+    connection.row_factory = sqlite3.Row
+    if (path, schema) not in _initialized:
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(schema)
+        _initialized.add((path, schema))
+    return connection
@@ -0,0 +1,36 @@
+from segment_store import SegmentStore
+
+
+def test_seal_indexes_appends_after_a_read(tmp_path):
+    # A read maps segment 1 early; sealing it must still index every record
+    store = SegmentStore(str(tmp_path), segment_size=200, sync=False)
+    store.append("case/1", b"first")
+    assert store.get("case/1") == (b"first", b"")
+    store.append("case/2", b"second")
+    store.append("case/3", b"x" * 200)
+    store.append("case/4", b"fourth")
+
+    fresh = SegmentStore(str(tmp_path))
+    assert fresh.get("case/2") == (b"second", b"")
+    assert fresh.get("case/3") == (b"x" * 200, b"")
+    assert fresh.get("case/4") == (b"fourth", b"")
+
+
+def test_compaction_keeps_records_sealed_after_a_read(tmp_path):
+    # Another process compacts from the .idx files and deletes segment 1
+    store = SegmentStore(str(tmp_path), segment_size=200, sync=False)
+    store.append("case/1", b"v1")
+    assert store.get("case/1") == (b"v1", b"")
+    store.append("case/2", b"v1")
+    store.append("case/3", b"x" * 200)
+    store.append("case/1", b"v2" * 100)
+    store.append("case/4", b"y" * 200)
+    store.append("case/5", b"v1")
+    assert SegmentStore(str(tmp_path)).compact() is not None
+
+    fresh = SegmentStore(str(tmp_path))
+    assert fresh.get("case/1") == (b"v2" * 100, b"")
+    assert fresh.get("case/2") == (b"v1", b"")
+    assert fresh.get("case/3") == (b"x" * 200, b"")
+    assert fresh.get("case/4") == (b"y" * 200, b"")
+    assert store.get("case/2") == (b"v1", b"")
@@ -0,0 +1,230 @@
+import re
+from collections import namedtuple
+
+# Canonical typed values for the numeric findings of each checklist: lengths
+# in mm, percentages, counts and weights, with a censoring flag for "greater
+# than" / "at least" / "less than" answers. Each finding declares the case
+# fields it reads, and normalize_values() turns a stored case into
+# measurements next to the display string they came from, so the exports and
+# statistics never parse the form text themselves.
+Finding = namedtuple("Finding", "name keys normalize")
+
+# value: float (or list of floats), unit: "mm" / "%" / "count" / "g",
+# censor: None (exact), ">", ">=" or "<"
+Measurement = namedtuple("Measurement", "value unit censor display")
+
+MM_PER_UNIT = {"mm": 1.0, "cm": 10.0}
+
+
+def _number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _length(name, key, unit="cm"):
+    def normalize(values):
+        value = _number(values.get(key))
+        if value <= 0:
+            return None
+        return Measurement(round(value * MM_PER_UNIT[unit], 3), "mm", None, f"{value:g} {unit}")
+    return Finding(name, (key,), normalize)
+
+
+def _percent(name, key):
+    def normalize(values):
+        value = _number(values.get(key))
+        if value <= 0:
+            return None
+        return Measurement(value, "%", None, f"{value:g}%")
+    return Finding(name, (key,), normalize)
+
+
+def _quantity(name, key, unit):
+    def normalize(values):
+        value = _number(values.get(key))
+        if value <= 0:
+            return None
+        return Measurement(value, unit, None, f"{value:g} {unit}")
+    return Finding(name, (key,), normalize)
+
+
+def _count(name, method_key, exact_key, atleast_key):
+    # "Exact number" / "At least" radio with one number input per answer
+    def normalize(values):
+        method = values.get(method_key)
+        if method == "Exact number":
+            value = int(_number(values.get(exact_key)))
+            return Measurement(value, "count", None, str(value))
+        if method == "At least":
+            value = int(_number(values.get(atleast_key)))
+            return Measurement(value, "count", ">=", f"At least {value}")
+        return None
+    return Finding(name, (method_key, exact_key, atleast_key), normalize)
+
+
+def _plain_count(name, key):
+    def normalize(values):
+        value = int(_number(values.get(key)))
+        if value <= 0:
+            return None
+        return Measurement(value, "count", None, str(value))
+    return Finding(name, (key,), normalize)
+
+
+# Closest-margin distance: exact cm / mm, or censored at 10 mm
+DISTANCE_ANSWERS = {
+    "Exact distance in cm": ("distance_cm", "cm", None),
+    "Exact distance in mm": ("distance_mm", "mm", None),
+    "Greater than 1 cm": (None, "cm", ">"),
+    "Greater than 10 mm": (None, "mm", ">")
+}
+
+
+def _closest_distance():
+    def normalize(values):
+        method = values.get("distance_method")
+        if method not in DISTANCE_ANSWERS:
+            return None
+        key, unit, censor = DISTANCE_ANSWERS[method]
+        if censor:
+            return Measurement(10.0, "mm", censor, method)
+        value = _number(values.get(key))
+        if value <= 0:
+            return None
+        return Measurement(round(value * MM_PER_UNIT[unit], 3), "mm", None, f"{value:g} {unit}")
+    return Finding("margin_distance", ("distance_method", "distance_cm", "distance_mm"), normalize)
+
+
+# Kidney largest nodal deposit: one number input per qualifier
+LARGEST_MET_ANSWERS = {
+    "Exact size": ("largest_met_exact", None, ""),
+    "At least": ("largest_met_atleast", ">=", "At least "),
+    "Greater than": ("largest_met_greater", ">", "Greater than "),
+    "Less than": ("largest_met_less", "<", "Less than ")
+}
+
+
+def _largest_met():
+    def normalize(values):
+        answer = LARGEST_MET_ANSWERS.get(values.get("largest_met_method"))
+        if not answer:
+            return None
+        key, censor, prefix = answer
+        value = _number(values.get(key))
+        if value <= 0:
+            return None
+        return Measurement(round(value * 10, 3), "mm", censor, f"{prefix}{value:g} cm")
+    keys = ("largest_met_method",) + tuple(answer[0] for answer in LARGEST_MET_ANSWERS.values())
+    return Finding("largest_nodal_deposit", keys, normalize)
+
+
+SIZE_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*(mm|cm)?", re.IGNORECASE)
+
+
+def parse_sizes(text, default_unit="cm"):
+    # Free text such as "2.1, 1.5 cm; 8 mm" -> sizes in mm; a bare number takes
+    # the next explicit unit in the text, or default_unit
+    sizes = []
+    pending = []
+    for number, unit in SIZE_PATTERN.findall(text or ""):
+        pending.append(float(number))
+        if unit:
+            sizes += [value * MM_PER_UNIT[unit.lower()] for value in pending]
+            pending = []
+    sizes += [value * MM_PER_UNIT[default_unit] for value in pending]
+    return [round(size, 3) for size in sizes]
+
+
+def _other_tumor_sizes():
+    def normalize(values):
+        text = values.get("other_tumor_sizes")
+        sizes = parse_sizes(text)
+        if not sizes:
+            return None
+        return Measurement(sizes, "mm", None, text)
+    return Finding("other_tumor_sizes", ("other_tumor_sizes",), normalize)
+
+
+def _nodule(finding, i):
+    # HCC nodule findings only count for the nodules currently documented
+    def normalize(values):
+        if i >= int(_number(values.get("num_tumors")) or 1):
+            return None
+        return finding.normalize(values)
+    return Finding(f"{finding.name}_{i}", finding.keys + ("num_tumors",), normalize)
+
+
+NODES = [
+    _count("ln_positive", "ln_positive_method", "ln_positive_exact", "ln_positive_atleast"),
+    _count("ln_examined", "ln_examined_method", "ln_examined_exact", "ln_examined_atleast")
+]
+
+FINDINGS = {
+    "colon": NODES + [
+        _length("tumor_size", "size_cm"),
+        _length("tumor_size_x", "size_x"),
+        _length("tumor_size_y", "size_y"),
+        _length("invasion_depth", "depth_mm", unit="mm"),
+        _plain_count("tumor_buds", "buds_number"),
+        _plain_count("tumor_deposits", "deposits_number"),
+        _closest_distance()
+    ],
+    "ampulla": NODES + [
+        _length("tumor_size", "size_cm"),
+        _length("tumor_size_x", "size_x"),
+        _length("tumor_size_y", "size_y"),
+        _length("largest_focus", "largest_focus"),
+        _length("aggregate_size", "aggregate_size"),
+        _percent("invasive_percentage", "invasive_percentage"),
+        _closest_distance()
+    ],
+    "kidney": NODES + [
+        _quantity("kidney_weight", "kidney_weight", "g"),
+        _length("kidney_length", "kidney_length"),
+        _length("kidney_width", "kidney_width"),
+        _length("kidney_height", "kidney_height"),
+        _plain_count("tumor_number", "tumor_number"),
+        _length("tumor_size", "greatest_dimension"),
+        _length("tumor_size_x", "size_x"),
+        _length("tumor_size_y", "size_y"),
+        _other_tumor_sizes(),
+        _percent("sarcomatoid_percentage", "sarcomatoid_percentage"),
+        _percent("rhabdoid_percentage", "rhabdoid_percentage"),
+        _percent("necrosis_percentage", "necrosis_percentage"),
+        _largest_met()
+    ] + [_percent(f"{marker}_percentage", f"{marker}_percentage") for marker in ("cd10", "ck7", "vimentin", "pax8", "rcc")],
+    "hcc": NODES + [_closest_distance()]
+}
+
+for _i in range(5):
+    FINDINGS["hcc"] += [
+        _nodule(_length("tumor_size", f"size_cm_{_i}"), _i),
+        _nodule(_length("tumor_size_x", f"size_x_{_i}"), _i),
+        _nodule(_length("tumor_size_y", f"size_y_{_i}"), _i),
+        _nodule(_length("gross_size", f"gross_size_{_i}"), _i),
+        _nodule(_percent("necrosis_percentage", f"necrosis_percent_{_i}"), _i)
+    ]
+
+
+def _build_index(findings):
+    index = {}
+    for position, finding in enumerate(findings):
+        for key in finding.keys:
+            index.setdefault(key, []).append(position)
+    return index
+
+
+FINDING_INDEX = {organ: _build_index(findings) for organ, findings in FINDINGS.items()}
+
+
+def normalize_values(organ, values):
+    # All findings of a form or stored case -> {name: Measurement}
+    measurements = {}
+    for finding in FINDINGS[organ]:
+        measurement = finding.normalize(values)
+        if measurement is not None:
+            measurements[finding.name] = measurement
+    return measurements
+
@@ -0,0 +1,40 @@
+import getpass
+import json
+import os
+
+import streamlit as st
+
+from storage import data_path
+
+PREFS_FILE = "user_prefs.json"
+
+
+def current_user():
+    # Signed-in user if authentication is configured, otherwise ?user=... or the OS account
+    email = st.user.get("email")
+    if email:
+        return email
+    return st.query_params.get("user") or os.environ.get("CHECKLIST_USER") or getpass.getuser()
+
+
+def _load_all():
+    path = data_path(PREFS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_prefs(user=None):
+    return _load_all().get(user or current_user(), {})
+
+
+def save_pref(name, value, user=None):
+    user = user or current_user()
+    prefs = _load_all()
+    prefs.setdefault(user, {})[name] = value
+    path = data_path(PREFS_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(prefs, f, indent=2)
+    os.replace(tmp_path, path)
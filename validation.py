@@ -0,0 +1,196 @@
+from collections import namedtuple
+
+import streamlit as st
+
+from change_tracking import changed_keys
+
+# Incremental consistency checks. Every rule declares the session keys it
+# reads; a key -> rules index is built once per organ, and on each rerun only
+# the rules reading a key whose value changed since the last run are
+# re-evaluated. Results are kept in session state between reruns.
+Rule = namedtuple("Rule", "name section keys check message")
+
+SECTION_TITLES = {
+    "tumor": "Tumor",
+    "lymph_nodes": "Regional Lymph Nodes",
+    "distant_metastasis": "Distant Metastasis",
+    "ptnm": "pTNM Classification"
+}
+
+
+def _number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _exclusive(name, section, key, others, message):
+    # `key` checked together with any of `others`
+    keys = (key,) + tuple(others)
+    return Rule(name, section, keys, lambda v: bool(v.get(key)) and any(v.get(other) for other in others), message)
+
+
+def _larger_than(name, section, small_keys, large_key, message):
+    keys = tuple(small_keys) + (large_key,)
+
+    def check(v):
+        large = _number(v.get(large_key))
+        return large > 0 and any(_number(v.get(key)) > large for key in small_keys)
+    return Rule(name, section, keys, check, message)
+
+
+def _nodes_rule():
+    keys = ("ln_status", "ln_tumor_status", "ln_positive_method", "ln_positive_exact", "ln_examined_method", "ln_examined_exact")
+
+    def check(v):
+        return (
+            v.get("ln_status") == "Regional lymph nodes present"
+            and v.get("ln_tumor_status") == "Tumor present in regional lymph node(s)"
+            and v.get("ln_positive_method") == "Exact number"
+            and v.get("ln_examined_method") == "Exact number"
+            and _number(v.get("ln_positive_exact")) > _number(v.get("ln_examined_exact")) > 0
+        )
+    return Rule("ln_positive_gt_examined", "lymph_nodes", keys, check, "More positive lymph nodes than nodes examined.")
+
+
+def _descriptors_rule(prefix, descriptors):
+    return _exclusive("descriptors_not_applicable", "ptnm", f"{prefix}_not_applicable",
+                      tuple(f"{prefix}_{descriptor}" for descriptor in descriptors),
+                      "TNM descriptor 'Not applicable' is checked together with a descriptor.")
+
+
+COMMON_RULES = [_nodes_rule()]
+
+DM_SITES = ("dm_non_regional_ln", "dm_liver", "dm_other", "dm_cannot_determine")
+
+RULES = {
+    "colon": COMMON_RULES + [
+        _descriptors_rule("modified", "yr"),
+        _exclusive("lvi_not_identified_and_present", "tumor", "lvi_not_identified",
+                   ("lvi_small", "lvi_large_intramural", "lvi_large_extramural", "lvi_present_nos"),
+                   "Lymphovascular invasion is marked both 'Not identified' and present."),
+        _larger_than("colon_dimension_gt_size", "tumor", ("size_x", "size_y"), "size_cm",
+                     "An additional dimension is larger than the tumor size."),
+        _exclusive("dm_not_applicable_and_site", "distant_metastasis", "dm_not_applicable", DM_SITES,
+                   "Distant metastasis is 'Not applicable' but a site is checked.")
+    ],
+    "ampulla": COMMON_RULES + [
+        _descriptors_rule("modified", "yr"),
+        _exclusive("no_primary_and_extent", "tumor", "extent_no_evidence",
+                   ("extent_cis", "extent_ampulla", "extent_sphincter", "extent_submucosa", "extent_muscularis",
+                    "extent_pancreas_05", "extent_pancreas_more", "extent_peripancreatic", "extent_periduodenal",
+                    "extent_serosa", "extent_other_organs"),
+                   "'No evidence of primary tumor' is checked together with a tumor extent."),
+        _exclusive("limited_and_beyond_ampulla", "tumor", "extent_ampulla",
+                   ("extent_sphincter", "extent_submucosa", "extent_muscularis", "extent_pancreas_05",
+                    "extent_pancreas_more", "extent_peripancreatic", "extent_periduodenal", "extent_serosa",
+                    "extent_other_organs"),
+                   "Tumor is 'Limited to ampulla of Vater' but extends beyond it."),
+        _exclusive("pancreas_depths", "tumor", "extent_pancreas_05", ("extent_pancreas_more",),
+                   "Pancreatic invasion is marked both up to 0.5 cm and more than 0.5 cm."),
+        _larger_than("ampulla_dimension_gt_size", "tumor", ("size_x", "size_y"), "size_cm",
+                     "An additional dimension is larger than the greatest dimension."),
+        _exclusive("dm_not_applicable_and_site", "distant_metastasis", "dm_not_applicable", DM_SITES,
+                   "Distant metastasis is 'Not applicable' but a site is checked.")
+    ],
+    "kidney": COMMON_RULES + [
+        _descriptors_rule("modified", "yr"),
+        _exclusive("limited_and_beyond_kidney", "tumor", "extent_limited_kidney",
+                   ("extent_perinephric", "extent_renal_sinus", "extent_pelvicalyceal", "extent_renal_vein",
+                    "extent_ivc", "extent_gerota", "extent_adrenal_direct", "extent_other_organs"),
+                   "Tumor is 'Limited to kidney' but an extension beyond the kidney is checked."),
+        _exclusive("adrenal_direct_and_noncontiguous", "tumor", "extent_adrenal_direct", ("extent_adrenal_noncontiguous",),
+                   "Adrenal involvement is marked both direct (T4) and non-contiguous (M1)."),
+        _exclusive("no_sarcomatoid_and_present", "tumor", "no_sarcomatoid_rhabdoid", ("sarcomatoid_present", "rhabdoid_present"),
+                   "'Sarcomatoid or rhabdoid features not identified' is checked together with a present feature."),
+        _larger_than("kidney_dimension_gt_size", "tumor", ("size_x", "size_y"), "greatest_dimension",
+                     "An additional dimension is larger than the greatest dimension."),
+        _exclusive("dm_not_applicable_and_site", "distant_metastasis", "dm_not_applicable", ("dm_specify", "dm_cannot_determine"),
+                   "Distant metastasis is 'Not applicable' but a site is checked.")
+    ],
+    "hcc": COMMON_RULES + [
+        _descriptors_rule("tnm", "mry"),
+        Rule("solitary_with_nodules", "tumor", ("focality", "num_tumors"),
+             lambda v: v.get("focality") == "Solitary" and int(v.get("num_tumors") or 1) > 1,
+             "Focality is 'Solitary' but more than one tumor nodule is documented."),
+        _exclusive("dm_not_applicable_and_site", "distant_metastasis", "dm_not_applicable", DM_SITES,
+                   "Distant metastasis is 'Not applicable' but a site is checked.")
+    ]
+}
+
+
+def _nodule_rule(rule, i):
+    # Answers of nodules beyond num_tumors stay in session state but are not documented
+    check = rule.check
+    return rule._replace(keys=rule.keys + ("num_tumors",),
+                         check=lambda v: int(_number(v.get("num_tumors")) or 1) > i and check(v))
+
+
+# Per-nodule HCC rules (up to 5 nodules)
+for _i in range(5):
+    RULES["hcc"] += [_nodule_rule(rule, _i) for rule in (
+        _exclusive(f"vascular_not_identified_and_present_{_i}", "tumor", f"vascular_not_identified_{_i}",
+                   (f"vascular_small_{_i}", f"vascular_large_{_i}", f"vascular_present_nos_{_i}"),
+                   f"Tumor {_i + 1}: vascular invasion is marked both 'Not identified' and present."),
+        _larger_than(f"dimension_gt_size_{_i}", "tumor", (f"size_x_{_i}", f"size_y_{_i}"), f"size_cm_{_i}",
+                     f"Tumor {_i + 1}: an additional dimension is larger than the greatest dimension."),
+        _exclusive(f"confined_and_beyond_liver_{_i}", "tumor", f"confined_liver_{_i}",
+                   (f"major_portal_{_i}", f"hepatic_vein_{_i}", f"visceral_peritoneum_{_i}", f"gallbladder_{_i}",
+                    f"diaphragm_{_i}", f"adjacent_organs_{_i}"),
+                   f"Tumor {_i + 1}: 'Confined to liver' is checked together with extension beyond the liver.")
+    )]
+
+
+def _build_index(rules):
+    index = {}
+    for position, rule in enumerate(rules):
+        for key in rule.keys:
+            index.setdefault(key, []).append(position)
+    return index
+
+
+RULE_INDEX = {organ: _build_index(rules) for organ, rules in RULES.items()}
+
+
+def update_validation(organ):
+    # Call once near the top of main(); re-checks only rules whose keys changed
+    state = st.session_state
+    changed = changed_keys(f"validation_{organ}", RULE_INDEX[organ])
+    failed = state.setdefault(f"_validation_failed_{organ}", set())
+    rules = RULES[organ]
+    dirty = {position for key in changed for position in RULE_INDEX[organ][key]}
+    for position in dirty:
+        if rules[position].check(state):
+            failed.add(position)
+        else:
+            failed.discard(position)
+
+
+def validation_issues(organ, section=None):
+    rules = RULES[organ]
+    failed = sorted(st.session_state.get(f"_validation_failed_{organ}", set()))
+    return [rules[position] for position in failed if section in (None, rules[position].section)]
+
+
+def inline_warnings(organ, section):
+    for rule in validation_issues(organ, section):
+        st.warning(f"⚠️ {rule.message}")
+
+
+def validation_summary(organ):
+    # Shown above the generate button; report generation is blocked until resolved or acknowledged.
+    # Re-checked here too, for answers set while the form rendered
+    update_validation(organ)
+    issues = validation_issues(organ)
+    if not issues:
+        # A new issue later on needs a fresh acknowledgement
+        st.session_state.pop("validation_override", None)
+        return
+    lines = "\n".join(f"- **{SECTION_TITLES[rule.section]}:** {rule.message}" for rule in issues)
+    st.error(f"**{len(issues)} consistency issue(s) must be resolved before the report is generated:**\n{lines}")
+    st.checkbox("I have reviewed these issues; generate the report anyway", key="validation_override")
+
+
+def report_allowed(organ):
+    return not validation_issues(organ) or st.session_state.get("validation_override", False)
@@ -0,0 +1,94 @@
+from datetime import date
+from urllib.parse import quote
+
+import streamlit as st
+
+from cases import APP_URLS, ORGANS, STATUSES, connect, list_cases, pathologists
+
+st.set_page_config(
+    page_title="Pathology Case Worklist",
+    page_icon="🗂️",
+    layout="wide"
+)
+
+SORT_LABELS = {"updated_desc": "Last updated (newest first)", "updated_asc": "Last updated (oldest first)", "case_id": "Case ID"}
+PAGE_SIZE = 25
+
+
+def _reset_pages():
+    # Keyset cursors of the pages visited so far; a filter or sort change starts over
+    st.session_state._worklist_cursors = [None]
+
+
+def _next_page(cursor):
+    st.session_state._worklist_cursors.append(cursor)
+
+
+def _previous_page():
+    st.session_state._worklist_cursors.pop()
+
+
+def main():
+    st.title("🗂️ Case Worklist")
+    st.markdown("**Drafts and signed-out cases** across all checklists")
+    if "_worklist_cursors" not in st.session_state:
+        _reset_pages()
+
+    connection = connect()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        organ = st.selectbox("Organ:", [""] + list(ORGANS), format_func=lambda o: ORGANS.get(o, "All"),
+                             key="worklist_organ", on_change=_reset_pages)
+    with col2:
+        status = st.selectbox("Status:", [""] + list(STATUSES), format_func=lambda s: STATUSES.get(s, "All"),
+                              key="worklist_status", on_change=_reset_pages)
+    with col3:
+        pathologist = st.selectbox("Pathologist:", [""] + pathologists(connection), format_func=lambda p: p or "All",
+                                   key="worklist_pathologist", on_change=_reset_pages)
+    with col4:
+        sort = st.selectbox("Sort:", list(SORT_LABELS), format_func=SORT_LABELS.get, key="worklist_sort", on_change=_reset_pages)
+    dates = st.date_input("Last updated between:", value=(), max_value=date.today(), key="worklist_dates", on_change=_reset_pages)
+
+    filters = {"organ": organ, "status": status, "pathologist": pathologist}
+    if len(dates) == 2:
+        filters["updated_from"], filters["updated_to"] = dates[0].isoformat(), dates[1].isoformat()
+
+    cursors = st.session_state._worklist_cursors
+    rows = list_cases(connection, filters, sort, cursors[-1], PAGE_SIZE)
+    connection.close()
+    has_next = len(rows) > PAGE_SIZE
+    rows = rows[:PAGE_SIZE]
+
+    if not rows:
+        st.info("No cases match these filters.")
+    else:
+        st.dataframe(
+            {
+                "Case ID": [row["case_id"] for row in rows],
+                "Organ": [ORGANS[row["organ"]] for row in rows],
+                "Status": [STATUSES.get(row["status"], row["status"]) for row in rows],
+                "Patient": [row["patient_name"] for row in rows],
+                "Pathologist": [row["pathologist"] for row in rows],
+                "Procedure Date": [row["procedure_date"] for row in rows],
+                "Last Updated": [row["updated_at"].replace("T", " ") for row in rows],
+                "Open": [f"{APP_URLS[row['organ']]}/?case={quote(row['case_id'])}" for row in rows]
+            },
+            hide_index=True,
+            use_container_width=True,
+            column_config={"Open": st.column_config.LinkColumn("Open", display_text="Open ↗")}
+        )
+
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        st.button("◀ Previous", key="worklist_previous", disabled=len(cursors) == 1, on_click=_previous_page)
+    with col2:
+        st.caption(f"Page {len(cursors)}")
+    with col3:
+        if has_next:
+            last = rows[-1]
+            st.button("Next ▶", key="worklist_next", on_click=_next_page,
+                      args=((last["sort_value"], last["organ"], last["case_id"]),))
+
+
+if __name__ == "__main__":
+    main()